@@ -662,28 +662,47 @@ class StrategyGUI(QtWidgets.QWidget):
     def get_kline_data_from_db(self, db_path, symbol):
         """从数据库获取K线数据"""
         try:
-            import sqlite3
             import pandas as pd
+            from app.data.sqlite_profile import connect
             
-            conn = sqlite3.connect(db_path)
+            # 只读连接：WAL模式下不会被收集器的写入阻塞
+            conn = connect(db_path, readonly=True)
             
-            # 获取所有表名
+            # 优先读取数值类型的min1_bars表，旧数据库回退到min1_data
             cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name IN ('min1_bars', 'min1_data');")
+            tables = {row[0] for row in cursor.fetchall()}
             
             if not tables:
-                self.append_log("❌ 数据库中没有任何表")
+                self.append_log("❌ 数据库中没有K线表")
                 return None
             
-            # 选择第一个表（通常是min1_data）
-            table_name = tables[0][0]
+            if 'min1_bars' in tables:
+                # 内存K线存储按合约从数据库同步（(code, time) 主键范围扫描），收集器写入的数据直接可用
+                from datetime import datetime
+                from app.data.bar_store import get_bar_store
+                table_name = 'min1_bars'
+                bars = get_bar_store().latest(symbol, '1m', 1000, db_path, table_name)
+                df = pd.DataFrame({
+                    'time': [datetime.fromtimestamp(int(t)).strftime('%Y-%m-%d %H:%M:%S') for t in bars['time'][::-1]],
+                    'open': bars['open'][::-1],
+                    'high': bars['high'][::-1],
+                    'low': bars['low'][::-1],
+                    'close': bars['close'][::-1],
+                    'vol': bars['volume'][::-1]
+                })
+                if df.empty:
+                    # 合约代码与数据库中的code不一致时，退回读取整张表的最新K线
+                    df = pd.read_sql_query(f"""
+                        SELECT strftime('%Y-%m-%d %H:%M:%S', time, 'unixepoch', 'localtime') AS time,
+                               open, high, low, close, vol
+                        FROM {table_name} ORDER BY time DESC LIMIT ?
+                    """, conn, params=(1000,))
+            else:
+                table_name = 'min1_data'
+                df = pd.read_sql_query(f"SELECT * FROM {table_name} ORDER BY time DESC LIMIT ?", conn, params=(1000,))
             self.append_log(f"📊 从表 {table_name} 获取数据")
             
-            # 查询数据
-            query = f"SELECT * FROM {table_name} ORDER BY time DESC LIMIT 1000"
-            df = pd.read_sql_query(query, conn)
-            
             conn.close()
             
             if df.empty:
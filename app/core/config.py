@@ -21,7 +21,68 @@ class Settings(BaseSettings):
     
     # 数据库配置
     database_url: str = "sqlite:///./tradestation.db"
+    db_bulk_chunk_size: int = 5000  # 批量写入market_data时每块的行数
+    db_read_chunk_size: int = 100000  # 分块读取market_data时每块的行数
+    market_data_partitioned: bool = False  # PostgreSQL下market_data按合约/月分区（需在create_tables前设置）
     
+    # HTTP连接池配置
+    http_pool_connections: int = 4  # 缓存的主机连接池数量
+    http_pool_maxsize: int = 20  # 每个主机的最大keep-alive连接数
+    http_timeout: int = 30  # 请求超时（秒）
+    http_dns_cache_ttl: int = 300  # 异步会话DNS缓存时间（秒）
+    http_keepalive_timeout: int = 60  # 异步会话空闲连接保持时间（秒）
+
+    # OAuth令牌配置
+    token_file: str = "tokens.json"
+    token_refresh_margin: int = 300  # 过期前多少秒提前刷新
+
+    # API限流配置（每个窗口的请求配额）
+    rate_limit_window: int = 300  # 秒
+    rate_limit_marketdata: int = 500
+    rate_limit_brokerage: int = 250
+    rate_limit_max_retries: int = 3  # 收到429后最多重试次数
+
+    # 请求容错配置
+    retry_max_attempts: int = 4  # 网络错误/超时/5xx的最多重试次数
+    retry_base_delay: float = 0.5  # 指数退避基数（秒）
+    retry_max_delay: float = 30.0  # 单次退避上限（秒）
+    circuit_failure_threshold: int = 5  # 连续失败多少次后熔断
+    circuit_reset_timeout: float = 30.0  # 熔断后多久放行试探请求（秒）
+    recovery_max_attempts: int = 8  # 漏取K线的最多补数次数
+
+    # SQLite存储配置（K线数据库）
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size: int = -65536  # 负数表示KiB
+    sqlite_mmap_size: int = 268435456
+    sqlite_temp_store: str = "MEMORY"
+    sqlite_busy_timeout: int = 5000  # 毫秒
+
+    # 数据收集配置
+    collector_streaming: bool = False  # True时实时K线使用barcharts流式订阅，而不是按K线边界轮询
+    collector_max_concurrent_downloads: int = 6  # 历史数据同时进行的请求数（其余留给实时轮询）
+
+    # 批量报价配置
+    quote_batch_size: int = 50  # 每次请求最多合并的代码数
+    quote_batch_window: float = 0.02  # 合并请求的等待窗口（秒）
+    quote_cache_ttl: float = 1.0  # 报价缓存时间（秒）
+
+    # 账户总览配置
+    dashboard_refresh_interval: float = 5.0  # 自动刷新间隔（秒）
+    dashboard_position_max_age: float = 3.0  # 平仓时直接使用快照中持仓的最长时效（秒），超过则重新查询
+
+    # 历史归档配置（Parquet，需要pyarrow）
+    archive_enabled: bool = False  # 收集引擎是否在后台把已收盘月份从SQLite移到Parquet
+    archive_dir: str = "archive"
+    archive_keep_months: int = 2  # SQLite中保留的已收盘月份数（当前月始终保留）
+    archive_compact_interval: float = 21600  # 后台归档间隔（秒）
+    archive_compression: str = "zstd"
+    archive_row_group_size: int = 50000  # 每个行组的K线数（时间范围过滤按行组跳过）
+
+    # K线文件配置（定长记录二进制文件，读取方内存映射）
+    bar_files_enabled: bool = False  # 收集器入库后同时追加到K线文件
+    bar_file_dir: str = "bars"
+
     # Redis配置
     redis_url: str = "redis://localhost:6379"
     
@@ -30,8 +91,10 @@ class Settings(BaseSettings):
     log_file: str = "logs/tradestation.log"
     
     # 数据缓存配置
+    cache_backend: str = "memory"  # memory（进程内LRU+TTL）或 redis
     cache_ttl: int = 300  # 5分钟
-    max_cache_size: int = 1000
+    max_cache_size: int = 1000  # 进程内缓存最多保存的条目数
+    cache_compression: str = "zlib"  # Redis中DataFrame缓冲区的压缩方式：zlib或none
     
     class Config:
         env_file = ".env"
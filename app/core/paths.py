@@ -0,0 +1,27 @@
+"""
+文件路径工具
+"""
+import hashlib
+import os
+from typing import Tuple
+
+
+def symbol_dirname(symbol: str) -> str:
+    """合约代码 -> 可用作文件名/目录名的字符串（路径分隔符替换为下划线）"""
+    return symbol.replace("/", "_").replace("\\", "_")
+
+
+def db_dirname(database: str) -> str:
+    """数据库 -> 目录名 '文件名-哈希'，不同数据库中的同一合约各用一个目录。
+    SQLite路径先转为绝对路径（同一文件的不同写法对应同一目录），数据库URL原样参与哈希"""
+    identity = database if "://" in database else os.path.abspath(database)
+    stem = os.path.splitext(os.path.basename(identity.rstrip("/")))[0] or "db"
+    return f"{symbol_dirname(stem)}-{hashlib.sha1(identity.encode()).hexdigest()[:8]}"
+
+
+def split_db_target(target: str) -> Tuple[str, str]:
+    """命令行参数 '数据库路径:合约' -> (数据库路径, 合约)，如 es_futures_data.db:ES、C:\\data\\es.db:ES"""
+    db_path, separator, symbol = target.rpartition(":")
+    if not separator or not db_path or not symbol:
+        raise ValueError(f"应为 数据库路径:合约 格式: {target}")
+    return db_path, symbol
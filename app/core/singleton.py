@@ -0,0 +1,35 @@
+"""
+进程内共享实例 - 各模块get_xxx()函数的延迟创建（多线程下只创建一次）
+"""
+import functools
+import threading
+from typing import Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def shared_instance(factory: Callable[[], T]) -> Callable[[], T]:
+    """把无参工厂函数变成返回进程内共享实例的get函数：第一次调用时创建（双重检查加锁），之后返回同一个实例
+    get.reset()丢弃当前实例并把它返回（没有创建过则返回None），供调用方释放资源，下次调用get时重新创建
+
+        @shared_instance
+        def get_bar_store() -> BarStore:
+            return BarStore()
+    """
+    lock = threading.Lock()
+    instance: List[T] = []
+
+    @functools.wraps(factory)
+    def get() -> T:
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    def reset() -> Optional[T]:
+        with lock:
+            return instance.pop() if instance else None
+
+    get.reset = reset
+    return get
@@ -0,0 +1,259 @@
+"""
+增量历史数据回补
+读取每个K线表最后入库的时间，检测序列中的缺口（扣除CME休市时段），
+只请求缺失的时间段，并按单次请求的K线上限分页
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+    CME_TZ = ZoneInfo("America/Chicago")
+except Exception:
+    # 没有tzdata时退回到固定的CST偏移
+    CME_TZ = timezone(timedelta(hours=-6))
+
+from app.data.sqlite_profile import StorageProfile, connect
+
+
+# CME Globex 股指期货交易时段（芝加哥时间）：周日17:00开盘，周五16:00收盘，周一至周四16:00-17:00每日休市
+CME_DAILY_CLOSE_HOUR = 16
+CME_DAILY_OPEN_HOUR = 17
+
+# 结束时间距现在不足这个秒数的区间不记为已检查（最近的K线可能还没有进入历史数据接口）
+CHECKED_SETTLE_SECONDS = 3600
+
+
+def _cme_day_sessions(day: datetime) -> List[Tuple[datetime, datetime]]:
+    """某个芝加哥自然日内的交易时段"""
+    weekday = day.weekday()  # 周一=0 ... 周日=6
+    midnight = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    close = midnight.replace(hour=CME_DAILY_CLOSE_HOUR)
+    reopen = midnight.replace(hour=CME_DAILY_OPEN_HOUR)
+    next_midnight = midnight + timedelta(days=1)
+
+    if weekday <= 3:
+        return [(midnight, close), (reopen, next_midnight)]
+    if weekday == 4:
+        return [(midnight, close)]
+    if weekday == 6:
+        return [(reopen, next_midnight)]
+    return []
+
+
+def session_seconds_between(start_ts: int, end_ts: int) -> int:
+    """[start_ts, end_ts) 之间处于CME交易时段的秒数"""
+    if end_ts <= start_ts:
+        return 0
+
+    start = datetime.fromtimestamp(start_ts, CME_TZ)
+    end = datetime.fromtimestamp(end_ts, CME_TZ)
+    total = 0.0
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    while day < end:
+        for session_start, session_end in _cme_day_sessions(day):
+            overlap_start = max(session_start, start)
+            overlap_end = min(session_end, end)
+            if overlap_end > overlap_start:
+                total += overlap_end.timestamp() - overlap_start.timestamp()
+        day = datetime.combine(day.date() + timedelta(days=1), datetime.min.time(), tzinfo=CME_TZ)
+
+    return int(total)
+
+
+def is_cme_session_open(ts: int) -> bool:
+    """某个时间点CME是否处于交易时段"""
+    return session_seconds_between(ts, ts + 1) > 0
+
+
+@dataclass
+class BackfillRequest:
+    """一次barcharts请求"""
+    timeframe: str
+    first_ts: Optional[int]  # 起始K线时间（Unix秒，含），None表示按barsback请求最近的K线
+    last_ts: Optional[int]  # 结束K线时间（Unix秒，含）
+    expected_bars: int
+
+    def to_params(self) -> dict:
+        """转换为barcharts的firstdate/lastdate/barsback参数"""
+        if self.first_ts is None:
+            return {'barsback': self.expected_bars}
+        params = {'firstdate': _iso(self.first_ts)}
+        if self.last_ts is not None:
+            params['lastdate'] = _iso(self.last_ts)
+        return params
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def subtract_checked(gaps: List[Tuple[int, int]], checked: List[Tuple[int, int]],
+                     interval_seconds: int) -> List[Tuple[int, int]]:
+    """从缺口 (前一根开盘时间, 后一根开盘时间) 中去掉已检查的区间 [start, end]，
+    剩余部分之间仍有至少一个周期的交易时段时保留"""
+    result = []
+    for gap in gaps:
+        pieces = [gap]
+        for checked_start, checked_end in checked:
+            remaining = []
+            for start, end in pieces:
+                if checked_end < start or checked_start > end:
+                    remaining.append((start, end))
+                    continue
+                if checked_start > start:
+                    remaining.append((start, checked_start))
+                if checked_end < end:
+                    remaining.append((checked_end, end))
+            pieces = remaining
+        if pieces == [gap]:
+            result.append(gap)
+            continue
+        result.extend((start, end) for start, end in pieces
+                      if session_seconds_between(start + interval_seconds, end) >= interval_seconds)
+    return result
+
+
+class BackfillPlanner:
+    """回补计划器 - 根据已入库数据计算需要请求的时间段"""
+
+    def __init__(self, db_path: str, symbol: str, storage_profile: StorageProfile = None,
+                 lookback_bars: int = 1000, max_bars_per_request: int = 10000):
+        self.db_path = db_path
+        self.symbol = symbol
+        self.storage_profile = storage_profile
+        self.lookback_bars = lookback_bars
+        self.max_bars_per_request = max_bars_per_request
+
+    def plan(self, timeframe: str, table_name: str, interval_seconds: int,
+             now_ts: int = None) -> List[BackfillRequest]:
+        """生成某个时间周期的回补请求列表"""
+        now_ts = now_ts or int(datetime.now(timezone.utc).timestamp())
+        window_start = self._lookback_start(now_ts, interval_seconds)
+        stored = self._load_stored_times(table_name, window_start)
+
+        if not stored:
+            # 空表：按原来的方式取最近lookback_bars根
+            return [BackfillRequest(timeframe, None, None, self.lookback_bars)]
+
+        # 存储的time为K线开盘时间+周期-1秒，还原为开盘时间
+        opens = [t - interval_seconds + 1 for t in stored]
+        gaps = []
+
+        # 窗口开头缺失
+        if session_seconds_between(window_start, opens[0]) >= interval_seconds:
+            gaps.append((window_start, opens[0]))
+
+        # 中间缺口：相邻两根K线之间的交易时段超过一个周期
+        for previous, current in zip(opens, opens[1:]):
+            if session_seconds_between(previous + interval_seconds, current) >= interval_seconds:
+                gaps.append((previous, current))
+
+        # 最后一根之后到现在（最后一根可能是未完成的K线，所以从它本身开始重新获取）
+        if session_seconds_between(opens[-1] + interval_seconds, now_ts) >= interval_seconds:
+            gaps.append((opens[-1], now_ts))
+
+        # 已经请求过、接口确实没有K线的时段（停牌、节假日、无成交）不再请求
+        gaps = subtract_checked(gaps, self._load_checked(timeframe, window_start), interval_seconds)
+
+        requests = []
+        for gap_start, gap_end in gaps:
+            requests.extend(self._paginate(timeframe, gap_start, gap_end, interval_seconds))
+        return requests
+
+    def plan_range(self, timeframe: str, start_ts: int, end_ts: int,
+                   interval_seconds: int) -> List[BackfillRequest]:
+        """指定时间段 [start_ts, end_ts]（开盘时间，Unix秒）的请求，不检查已入库数据，按单次请求上限拆分"""
+        return self._paginate(timeframe, start_ts, end_ts, interval_seconds)
+
+    def _paginate(self, timeframe: str, start_ts: int, end_ts: int,
+                  interval_seconds: int) -> List[BackfillRequest]:
+        """把一个缺口按单次请求上限拆分"""
+        requests = []
+        chunk_seconds = self.max_bars_per_request * interval_seconds
+        chunk_start = start_ts
+
+        while chunk_start <= end_ts:
+            chunk_end = min(chunk_start + chunk_seconds - interval_seconds, end_ts)
+            expected = max(1, session_seconds_between(chunk_start, chunk_end + interval_seconds) // interval_seconds)
+            if session_seconds_between(chunk_start, chunk_end + interval_seconds) > 0:
+                requests.append(BackfillRequest(timeframe, chunk_start, chunk_end, expected))
+            chunk_start = chunk_end + interval_seconds
+
+        return requests
+
+    def _lookback_start(self, now_ts: int, interval_seconds: int) -> int:
+        """往回推lookback_bars根K线对应的交易时段起点"""
+        needed = self.lookback_bars * interval_seconds
+        start = now_ts
+        step = max(needed, 86400)
+
+        # 按天回退，直到覆盖足够的交易时段
+        while session_seconds_between(start, now_ts) < needed:
+            start -= step
+            step = 86400
+        return start
+
+    def mark_checked(self, request: BackfillRequest, now_ts: int = None):
+        """记录一个已成功完成的区间请求，与重叠的已记录区间合并（barsback请求不记录）"""
+        if request.first_ts is None:
+            return
+        now_ts = now_ts or int(datetime.now(timezone.utc).timestamp())
+        start = request.first_ts
+        end = min(request.last_ts if request.last_ts is not None else now_ts, now_ts - CHECKED_SETTLE_SECONDS)
+        if end <= start:
+            return
+
+        try:
+            conn = connect(self.db_path, self.storage_profile)
+            with conn:
+                # 已记录的区间互不重叠，与新区间重叠的行合并成一行
+                overlap = (self.symbol, request.timeframe, end, start)
+                for row_start, row_end in conn.execute("""
+                    SELECT start, end FROM backfill_checked
+                    WHERE code = ? AND timeframe = ? AND start <= ? AND end >= ?
+                """, overlap).fetchall():
+                    start, end = min(start, row_start), max(end, row_end)
+                conn.execute("""
+                    DELETE FROM backfill_checked
+                    WHERE code = ? AND timeframe = ? AND start <= ? AND end >= ?
+                """, overlap)
+                conn.execute("INSERT INTO backfill_checked (code, timeframe, start, end) VALUES (?, ?, ?, ?)",
+                             (self.symbol, request.timeframe, start, end))
+            conn.close()
+        except Exception as e:
+            print(f"❌ 记录回补区间失败: {e}")
+
+    def _load_checked(self, timeframe: str, since_ts: int) -> List[Tuple[int, int]]:
+        """读取窗口内已检查过的区间"""
+        try:
+            conn = connect(self.db_path, self.storage_profile, readonly=True)
+            rows = conn.execute("""
+                SELECT start, end FROM backfill_checked
+                WHERE code = ? AND timeframe = ? AND end >= ?
+                ORDER BY start
+            """, (self.symbol, timeframe, since_ts)).fetchall()
+            conn.close()
+            return rows
+        except Exception as e:
+            print(f"❌ 读取已检查的回补区间失败: {e}")
+            return []
+
+    def _load_stored_times(self, table_name: str, since_ts: int) -> List[int]:
+        """读取窗口内已入库的K线时间"""
+        try:
+            conn = connect(self.db_path, self.storage_profile, readonly=True)
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT time FROM {table_name}
+                WHERE code = ? AND time >= ?
+                ORDER BY time
+            """, (self.symbol, since_ts))
+            rows = cur.fetchall()
+            conn.close()
+            return [row[0] for row in rows]
+        except Exception as e:
+            print(f"❌ 读取已入库K线失败: {e}")
+            return []
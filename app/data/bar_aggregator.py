@@ -0,0 +1,105 @@
+"""
+K线聚合模块 - 由1分钟K线增量推导更高时间周期
+每根1分钟K线收盘后更新所在周期的K线（未完成的周期以部分K线写入，后续覆盖），
+保证各时间周期之间完全一致，同时只需要轮询1分钟数据
+"""
+import threading
+from typing import Dict, List, Tuple
+
+from app.data.bar_decoder import BarColumns
+from app.data.sqlite_profile import StorageProfile, connect
+
+
+class BarAggregator:
+    """增量K线聚合器"""
+
+    def __init__(self, db_path: str, symbol: str, source_table: str = 'min1_bars',
+                 interval_seconds: Dict[str, int] = None, storage_profile: StorageProfile = None):
+        self.db_path = db_path
+        self.storage_profile = storage_profile
+        self.symbol = symbol
+        self.source_table = source_table
+        self.interval_seconds = interval_seconds or {}
+        self._lock = threading.Lock()
+
+        # 每个时间周期当前所在的桶: {'start': 开盘毫秒, 'minutes': {1分钟开盘毫秒: (o, h, l, c, v)}}
+        self._buckets: Dict[str, Dict] = {}
+
+    def update(self, minute_bars: BarColumns, timeframes: List[str]) -> Dict[str, BarColumns]:
+        """合并新的1分钟K线，返回每个周期需要写入（插入或覆盖）的K线"""
+        result: Dict[str, List[Tuple]] = {tf: [] for tf in timeframes}
+
+        with self._lock:
+            for open_time, *minute in sorted(minute_bars.records()):
+                minute = tuple(minute)
+
+                for timeframe in timeframes:
+                    interval_ms = self.interval_seconds[timeframe] * 1000
+                    bucket_start = open_time // interval_ms * interval_ms
+                    bucket = self._buckets.get(timeframe)
+
+                    if bucket is None or bucket['start'] != bucket_start:
+                        # 新周期（或重启后的第一根/迟到的K线）：从已入库的1分钟数据恢复该周期已有部分
+                        bucket = {
+                            'start': bucket_start,
+                            'minutes': self._load_minutes(bucket_start, interval_ms)
+                        }
+                        if self._buckets.get(timeframe) is None or bucket_start >= self._buckets[timeframe]['start']:
+                            self._buckets[timeframe] = bucket
+
+                    bucket['minutes'][open_time] = minute
+                    row = self._build_kline(bucket)
+
+                    # 同一批次内同一周期只保留最新的部分K线
+                    rows = result[timeframe]
+                    if rows and rows[-1][0] == row[0]:
+                        rows[-1] = row
+                    else:
+                        rows.append(row)
+
+        return {tf: BarColumns.from_records(rows, self.interval_seconds[tf]) for tf, rows in result.items()}
+
+    def reset(self):
+        """清空聚合状态"""
+        with self._lock:
+            self._buckets.clear()
+
+    def _build_kline(self, bucket: Dict) -> Tuple:
+        """由桶内的1分钟K线计算周期K线 (开盘毫秒, open, high, low, close, volume)"""
+        minutes = [bucket['minutes'][key] for key in sorted(bucket['minutes'])]
+
+        return (
+            bucket['start'],
+            minutes[0][0],
+            max(m[1] for m in minutes),
+            min(m[2] for m in minutes),
+            minutes[-1][3],
+            sum(m[4] for m in minutes)
+        )
+
+    def _load_minutes(self, bucket_start: int, interval_ms: int) -> Dict[int, tuple]:
+        """读取某个周期内已入库的1分钟K线"""
+        # 1分钟K线的time字段是收盘时间（开盘时间+59秒，Unix秒）
+        first = (bucket_start + 59999) // 1000
+        last = (bucket_start + interval_ms - 1) // 1000
+
+        minutes = {}
+        try:
+            conn = connect(self.db_path, self.storage_profile, readonly=True)
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT time, open, high, low, close, vol
+                FROM {self.source_table}
+                WHERE code = ? AND time >= ? AND time <= ?
+            """, (self.symbol, first, last))
+            rows = cur.fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"❌ 读取1分钟数据失败: {e}")
+            return minutes
+
+        for close_ts, open_, high, low, close, vol in rows:
+            open_time = (close_ts - 59) * 1000
+            minutes[open_time] = (open_, high, low, close, vol or 0)
+
+        return minutes
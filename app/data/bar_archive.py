@@ -0,0 +1,428 @@
+"""
+K线历史归档 - 已收盘月份的K线从SQLite移到按 数据库/合约/时间周期/月 分区的Parquet文件
+目录结构: {archive_dir}/es_futures_data-1a2b3c4d/symbol=ES/timeframe=1m/month=2024-01/bars.parquet
+读取时先按month目录裁剪文件，再把时间范围下推到Parquet行组统计信息，只解码需要的列；
+后台归档任务定期把SQLite中超过保留期的月份写入Parquet并删除
+"""
+import argparse
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.core.paths import db_dirname, split_db_target, symbol_dirname
+from app.data.bar_schema import BAR_TABLES
+from app.data.bar_store import BAR_FIELDS
+from app.data.sqlite_profile import StorageProfile, connect
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+
+TimeLike = Union[int, datetime, None]
+
+FILE_NAME = "bars.parquet"
+
+
+def _to_ts(value: TimeLike) -> Optional[int]:
+    """Unix秒或datetime（无时区按UTC）-> Unix秒"""
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _month_of(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m")
+
+
+def _month_bounds(month: str) -> Tuple[int, int]:
+    """'YYYY-MM' -> [月初, 下月初) 的Unix秒"""
+    year, month_number = int(month[:4]), int(month[5:7])
+    start = datetime(year, month_number, 1, tzinfo=timezone.utc)
+    end = datetime(year + month_number // 12, month_number % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def archive_cutoff(keep_months: int = None, now: datetime = None) -> int:
+    """归档截止时间（Unix秒）：当前月及之前keep_months个已收盘月份保留在SQLite"""
+    keep_months = settings.archive_keep_months if keep_months is None else keep_months
+    now = now or datetime.now(timezone.utc)
+    index = now.year * 12 + now.month - 1 - keep_months
+    return int(datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+class BarArchive:
+    """Parquet K线归档（time为Unix秒int64，价格和成交量为float64，与内存K线存储一致）
+    一个实例对应一个数据库的归档目录，通过get_bar_archive(数据库)获取"""
+
+    def __init__(self, root: str = None, compression: str = None, row_group_size: int = None):
+        if pa is None:
+            raise RuntimeError("未安装pyarrow，无法使用历史归档")
+        self.root = root or settings.archive_dir
+        self.compression = compression or settings.archive_compression
+        self.row_group_size = row_group_size or settings.archive_row_group_size
+        self.schema = pa.schema([("time", pa.int64())] + [(field, pa.float64()) for field in BAR_FIELDS[1:]])
+        self._partitioning = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+        self._lock = threading.Lock()  # 同一进程内的写入串行（读-合并-替换）
+
+    # ========== 路径 ==========
+
+    def series_dir(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, f"symbol={symbol_dirname(symbol)}", f"timeframe={timeframe}")
+
+    def month_path(self, symbol: str, timeframe: str, month: str) -> str:
+        return os.path.join(self.series_dir(symbol, timeframe), f"month={month}", FILE_NAME)
+
+    def months(self, symbol: str, timeframe: str) -> List[str]:
+        """已归档的月份（升序）"""
+        directory = self.series_dir(symbol, timeframe)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[6:] for name in os.listdir(directory)
+                      if name.startswith("month=") and os.path.exists(os.path.join(directory, name, FILE_NAME)))
+
+    # ========== 写入 ==========
+
+    def write_month(self, symbol: str, timeframe: str, month: str, bars: pd.DataFrame) -> int:
+        """写入一个月的K线（列为BAR_FIELDS），与已归档的同月数据合并，同一时间以新数据为准。
+        先写临时文件再原子替换，读取方不会看到写了一半的文件。返回该月归档后的K线数"""
+        path = self.month_path(symbol, timeframe, month)
+        frame = pd.DataFrame({field: bars[field].to_numpy(dtype=self.schema.field(field).type.to_pandas_dtype())
+                              for field in BAR_FIELDS})
+
+        with self._lock:
+            if os.path.exists(path):
+                existing = pq.read_table(path).to_pandas()
+                frame = pd.concat([existing, frame], ignore_index=True)
+            frame = frame.drop_duplicates("time", keep="last").sort_values("time", ignore_index=True)
+
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # 以.开头的临时文件不会被读取方的目录扫描发现
+            fd, tmp_path = tempfile.mkstemp(prefix=".bars-", suffix=".tmp", dir=directory)
+            os.close(fd)
+            try:
+                table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+                pq.write_table(table, tmp_path, compression=self.compression,
+                               row_group_size=self.row_group_size, write_statistics=True)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return len(frame)
+
+    # ========== 读取 ==========
+
+    def read_table(self, symbol: str, timeframe: str, start: TimeLike = None, end: TimeLike = None,
+                   columns: Sequence[str] = None) -> "pa.Table":
+        """时间范围 [start, end] 内的K线（Arrow表）。month分区和time行组统计都参与过滤"""
+        columns = list(columns or BAR_FIELDS)
+        directory = self.series_dir(symbol, timeframe)
+        if not os.path.isdir(directory):
+            return self.schema.empty_table().select(columns)
+
+        start_ts, end_ts = _to_ts(start), _to_ts(end)
+        dataset = ds.dataset(directory, format="parquet", partitioning=self._partitioning)
+        condition = None
+        if start_ts is not None:
+            condition = (ds.field("month") >= _month_of(start_ts)) & (ds.field("time") >= start_ts)
+        if end_ts is not None:
+            upper = (ds.field("month") <= _month_of(end_ts)) & (ds.field("time") <= end_ts)
+            condition = upper if condition is None else condition & upper
+
+        table = dataset.to_table(columns=columns, filter=condition)
+        if "time" in columns and table.num_rows:
+            table = table.sort_by("time")
+        return table
+
+    def read(self, symbol: str, timeframe: str, start: TimeLike = None, end: TimeLike = None,
+             columns: Sequence[str] = None, db_path: str = None,
+             profile: StorageProfile = None) -> pd.DataFrame:
+        """读取K线DataFrame；给出db_path时合并SQLite中尚未归档的K线（同一时间以SQLite为准）。
+        合并按time去重排序，所以time总是参与读取，最后再只保留columns中的列"""
+        columns = list(columns or BAR_FIELDS)
+        read_columns = columns if "time" in columns else ["time"] + columns
+        frame = self.read_table(symbol, timeframe, start, end, read_columns).to_pandas()
+
+        if db_path is not None:
+            recent = self._read_sqlite(db_path, symbol, timeframe, _to_ts(start), _to_ts(end), profile)
+            if not recent.empty:
+                frame = recent if frame.empty else pd.concat([frame, recent[read_columns]], ignore_index=True)
+                frame = frame.drop_duplicates("time", keep="last").sort_values("time", ignore_index=True)
+        return frame[columns]
+
+    def tail(self, symbol: str, timeframe: str, size: int, before: TimeLike = None) -> pd.DataFrame:
+        """归档中time早于before的最近size根K线（从最新的月份往前读，够数即停）"""
+        before_ts = _to_ts(before)
+        frames, count = [], 0
+        for month in reversed(self.months(symbol, timeframe)):
+            if count >= size:
+                break
+            if before_ts is not None and _month_bounds(month)[0] >= before_ts:
+                continue
+            frame = pq.read_table(self.month_path(symbol, timeframe, month), columns=list(BAR_FIELDS)).to_pandas()
+            if before_ts is not None:
+                frame = frame[frame["time"] < before_ts]
+            frames.append(frame)
+            count += len(frame)
+
+        if not frames:
+            return self.schema.empty_table().to_pandas()
+        return pd.concat(frames[::-1], ignore_index=True).tail(size).reset_index(drop=True)
+
+    @staticmethod
+    def _read_sqlite(db_path: str, symbol: str, timeframe: str, start_ts: Optional[int],
+                     end_ts: Optional[int], profile: StorageProfile = None) -> pd.DataFrame:
+        """SQLite中尚未归档的K线；数据库不存在（还没有写入过）时返回空表"""
+        table_name = BAR_TABLES.get(timeframe)
+        if table_name is None or not os.path.exists(db_path):
+            return pd.DataFrame()
+        sql = f"SELECT time, open, high, low, close, vol FROM {table_name} WHERE code = ?"
+        params: List = [symbol]
+        if start_ts is not None:
+            sql += " AND time >= ?"
+            params.append(start_ts)
+        if end_ts is not None:
+            sql += " AND time <= ?"
+            params.append(end_ts)
+
+        conn = connect(db_path, profile, readonly=True)
+        try:
+            rows = conn.execute(sql + " ORDER BY time", params).fetchall()
+        finally:
+            conn.close()
+        frame = pd.DataFrame.from_records(rows, columns=list(BAR_FIELDS))
+        return frame.astype({field: np.float64 for field in BAR_FIELDS[1:]}).astype({"time": np.int64})
+
+    # ========== 归档 ==========
+
+    def compact_sqlite(self, db_path: str, symbol: str, timeframes: Sequence[str] = None,
+                       keep_months: int = None, profile: StorageProfile = None,
+                       now: datetime = None) -> Dict[str, int]:
+        """把SQLite中截止时间之前的整月K线移到Parquet，返回 {时间周期: 归档K线数}。
+        每个月在一个写事务内完成"读取-写Parquet-删除"，期间写入器等待，不会丢失并发写入的K线"""
+        cutoff = archive_cutoff(keep_months, now)
+        archived: Dict[str, int] = {}
+        conn = connect(db_path, profile, isolation_level=None)
+
+        try:
+            for timeframe in timeframes or list(BAR_TABLES):
+                table_name = BAR_TABLES.get(timeframe)
+                if table_name is None:
+                    continue
+
+                first = conn.execute(f"SELECT MIN(time) FROM {table_name} WHERE code = ? AND time < ?",
+                                     (symbol, cutoff)).fetchone()[0]
+                while first is not None:
+                    month = _month_of(first)
+                    month_start, month_end = _month_bounds(month)
+                    archived[timeframe] = archived.get(timeframe, 0) + self._compact_month(
+                        conn, table_name, symbol, timeframe, month, month_start, month_end)
+                    first = conn.execute(
+                        f"SELECT MIN(time) FROM {table_name} WHERE code = ? AND time >= ? AND time < ?",
+                        (symbol, month_end, cutoff)).fetchone()[0]
+        finally:
+            conn.close()
+
+        for timeframe, count in archived.items():
+            print(f"📦 {symbol} {timeframe}: {count} 根K线已归档到Parquet")
+        return archived
+
+    def _compact_month(self, conn, table_name: str, symbol: str, timeframe: str, month: str,
+                       month_start: int, month_end: int) -> int:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(f"""
+                SELECT time, open, high, low, close, vol FROM {table_name}
+                WHERE code = ? AND time >= ? AND time < ?
+                ORDER BY time
+            """, (symbol, month_start, month_end)).fetchall()
+            if rows:
+                self.write_month(symbol, timeframe, month, pd.DataFrame.from_records(rows, columns=list(BAR_FIELDS)))
+                conn.execute(f"DELETE FROM {table_name} WHERE code = ? AND time >= ? AND time < ?",
+                             (symbol, month_start, month_end))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def compact_market_data(self, storage=None, keep_months: int = None,
+                            now: datetime = None) -> Dict[Tuple[str, str], int]:
+        """把market_data表中截止时间之前的整月K线移到Parquet（时间周期目录使用interval原值）"""
+        from sqlalchemy import delete, func, select
+        from app.data.storage import DataStorage, MarketData
+
+        storage = storage or DataStorage()
+        table = MarketData.__table__
+        cutoff = datetime.fromtimestamp(archive_cutoff(keep_months, now), timezone.utc).replace(tzinfo=None)
+        archived: Dict[Tuple[str, str], int] = {}
+
+        with storage.engine.connect() as conn:
+            series = conn.execute(select(table.c.symbol, table.c.interval)
+                                  .where(table.c.timestamp < cutoff).distinct()).all()
+
+        for symbol, interval in series:
+            with storage.engine.begin() as conn:
+                first = conn.execute(select(func.min(table.c.timestamp)).where(
+                    table.c.symbol == symbol, table.c.interval == interval,
+                    table.c.timestamp < cutoff)).scalar()
+                if first is None:
+                    continue
+                # 按月读出 -> 写Parquet -> 删除，整个序列一个事务
+                total = 0
+                for month in self._months_between(_to_ts(first), _to_ts(cutoff)):
+                    month_start, month_end = (datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+                                              for ts in _month_bounds(month))
+                    condition = (table.c.symbol == symbol, table.c.interval == interval,
+                                 table.c.timestamp >= month_start, table.c.timestamp < month_end)
+                    rows = conn.execute(select(table.c.timestamp, table.c.open, table.c.high, table.c.low,
+                                               table.c.close, table.c.volume).where(*condition)).all()
+                    if not rows:
+                        continue
+                    frame = pd.DataFrame.from_records(rows, columns=['timestamp'] + list(BAR_FIELDS[1:]))
+                    frame['time'] = pd.to_datetime(frame['timestamp']).values.astype('datetime64[s]').astype(np.int64)
+                    self.write_month(symbol, interval, month, frame)
+                    conn.execute(delete(table).where(*condition))
+                    total += len(rows)
+            archived[(symbol, interval)] = total
+            print(f"📦 {symbol} {interval}: market_data中 {total} 条K线已归档到Parquet")
+
+        return archived
+
+    @staticmethod
+    def _months_between(start_ts: int, end_ts: int) -> List[str]:
+        """[start_ts, end_ts) 覆盖的月份"""
+        months = []
+        month = _month_of(start_ts)
+        while True:
+            month_start, month_end = _month_bounds(month)
+            if month_start >= end_ts:
+                break
+            months.append(month)
+            month = _month_of(month_end)
+        return months
+
+
+class ArchiveCompactor:
+    """后台归档任务 - 定期对登记的 (数据库, 合约) 执行compact_sqlite，每个数据库写入自己的归档目录"""
+
+    def __init__(self, interval: float = None, include_market_data: bool = False):
+        if pa is None:
+            raise RuntimeError("未安装pyarrow，无法使用历史归档")
+        self.interval = interval or settings.archive_compact_interval
+        self.include_market_data = include_market_data
+        self.targets: Dict[Tuple[str, str], Optional[List[str]]] = {}  # (数据库, 合约) -> 时间周期
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, db_path: str, symbol: str, timeframes: Sequence[str] = None):
+        self.targets[(db_path, symbol)] = list(timeframes) if timeframes else None
+
+    def remove(self, symbol: str):
+        for key in [key for key in self.targets if key[1] == symbol]:
+            self.targets.pop(key, None)
+
+    def run_once(self) -> int:
+        """执行一轮归档，返回归档的K线总数（单个合约失败不影响其他合约）"""
+        total = 0
+        for (db_path, symbol), timeframes in list(self.targets.items()):
+            try:
+                total += sum(get_bar_archive(db_path).compact_sqlite(db_path, symbol, timeframes).values())
+            except Exception as e:
+                print(f"❌ {symbol} 归档失败: {e}")
+        if self.include_market_data:
+            try:
+                total += sum(compact_market_data().values())
+            except Exception as e:
+                print(f"❌ market_data归档失败: {e}")
+        return total
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="bar-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        # 启动后先执行一次，之后按间隔执行
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+
+_archives_lock = threading.Lock()
+_archives: Dict[str, BarArchive] = {}
+
+
+def get_bar_archive(database: str) -> BarArchive:
+    """获取数据库（SQLite路径或数据库URL）对应的共享归档，目录为 {archive_dir}/{db_dirname}
+    未安装pyarrow时抛出RuntimeError"""
+    key = db_dirname(database)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = _archives[key] = BarArchive(os.path.join(settings.archive_dir, key))
+        return archive
+
+
+def archive_for(symbol: str, timeframe: str, database: str) -> Optional[BarArchive]:
+    """该数据库的这个序列有归档数据时返回共享归档，否则返回None（未安装pyarrow或从未归档，读取方只读数据库）"""
+    if pa is None:
+        return None
+    archive = get_bar_archive(database)
+    return archive if archive.months(symbol, timeframe) else None
+
+
+def compact_market_data(storage=None, keep_months: int = None, now: datetime = None) -> Dict[Tuple[str, str], int]:
+    """把market_data表的已收盘月份归档到该数据库自己的归档目录"""
+    from app.data.storage import DataStorage
+
+    storage = storage or DataStorage()
+    return get_bar_archive(storage.database).compact_market_data(storage, keep_months, now)
+
+
+def _db_target_arg(value: str) -> Tuple[str, str]:
+    """argparse类型函数：格式错误时转成ArgumentTypeError，让argparse给出原始提示"""
+    try:
+        return split_db_target(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main():
+    """命令行归档: python -m app.data.bar_archive es_futures_data.db:ES nqz25_futures_data.db:NQZ25
+    归档market_data表: python -m app.data.bar_archive --market-data"""
+    parser = argparse.ArgumentParser(description="把已收盘月份的K线从SQLite移到Parquet归档")
+    parser.add_argument("targets", nargs="*", type=_db_target_arg, metavar="数据库:合约")
+    parser.add_argument("--market-data", action="store_true", help="同时归档market_data表")
+    args = parser.parse_args()
+
+    for db_path, symbol in args.targets:
+        get_bar_archive(db_path).compact_sqlite(db_path, symbol)
+    if args.market_data:
+        compact_market_data()
+
+
+if __name__ == "__main__":
+    main()
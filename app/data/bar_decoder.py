@@ -0,0 +1,96 @@
+"""
+K线批量解码 - 把barcharts返回的Bars数组一次性转换为NumPy列
+时间戳整列解析为datetime64，价格和成交量整列转换为float64，不为每根K线构造字典
+"""
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+
+@dataclass
+class BarColumns:
+    """一批K线的列数据（按API返回顺序，通常为时间升序）"""
+    open_time: np.ndarray  # 开盘时间，Unix毫秒（int64）
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    interval_seconds: int
+
+    def __len__(self):
+        return len(self.open_time)
+
+    @property
+    def time(self) -> np.ndarray:
+        """数据库时间键：收盘时间的Unix秒（开盘时间+周期-1毫秒）"""
+        return (self.open_time + self.interval_seconds * 1000 - 1) // 1000
+
+    @classmethod
+    def empty(cls, interval_seconds: int) -> 'BarColumns':
+        return cls.from_records([], interval_seconds)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple], interval_seconds: int) -> 'BarColumns':
+        """由 (开盘毫秒, open, high, low, close, volume) 元组构造"""
+        records = list(records)
+        if not records:
+            return cls(np.empty(0, np.int64), *(np.empty(0, np.float64) for _ in range(5)),
+                       interval_seconds=interval_seconds)
+
+        open_time, open_, high, low, close, volume = zip(*records)
+        return cls(
+            np.array(open_time, dtype=np.int64),
+            np.array(open_, dtype=np.float64),
+            np.array(high, dtype=np.float64),
+            np.array(low, dtype=np.float64),
+            np.array(close, dtype=np.float64),
+            np.array(volume, dtype=np.float64),
+            interval_seconds=interval_seconds
+        )
+
+    def records(self) -> List[Tuple]:
+        """(开盘毫秒, open, high, low, close, volume) 元组列表"""
+        return list(zip(self.open_time.tolist(), self.open.tolist(), self.high.tolist(),
+                        self.low.tolist(), self.close.tolist(), self.volume.tolist()))
+
+    def to_rows(self, symbol: str) -> List[Tuple]:
+        """数据库行 (time, high, low, open, close, vol, code)"""
+        count = len(self)
+        return list(zip(self.time.tolist(), self.high.tolist(), self.low.tolist(),
+                        self.open.tolist(), self.close.tolist(),
+                        self.volume.astype(np.int64).tolist(), [symbol] * count))
+
+
+def decode_bars(bars: List, interval_seconds: int) -> BarColumns:
+    """解码barcharts的Bars数组（dict或json_codec.Bar结构）
+
+    TimeStamp为K线开盘时间（UTC，ISO8601带Z）；成交量字段为TotalVolume，旧数据兼容Volume
+    """
+    if not bars:
+        return BarColumns.empty(interval_seconds)
+
+    # 只遍历一次Bars，取出需要的6个字段（类型化结构直接读属性）
+    if isinstance(bars[0], dict):
+        fields = [(bar['TimeStamp'], bar['Open'], bar['High'], bar['Low'], bar['Close'],
+                   bar.get('TotalVolume', bar.get('Volume', 0)))
+                  for bar in bars]
+    else:
+        fields = [(bar.TimeStamp, bar.Open, bar.High, bar.Low, bar.Close,
+                   bar.TotalVolume or bar.Volume or 0)
+                  for bar in bars]
+    timestamps, open_, high, low, close, volume = zip(*fields)
+
+    # datetime64不带时区表示，去掉Z后整列解析
+    open_seconds = np.char.rstrip(np.array(timestamps), 'Z').astype('datetime64[s]').astype(np.int64)
+
+    return BarColumns(
+        open_seconds * 1000,
+        np.array(open_, dtype=np.float64),
+        np.array(high, dtype=np.float64),
+        np.array(low, dtype=np.float64),
+        np.array(close, dtype=np.float64),
+        np.array(volume, dtype=np.float64),
+        interval_seconds=interval_seconds
+    )
@@ -0,0 +1,310 @@
+"""
+K线二进制文件 - 每个合约/时间周期一个定长记录文件，读取方np.memmap后按时间切片（零拷贝）
+格式: 64字节文件头（魔数、版本、记录长度、已提交记录数）+ 按time升序排列的定长记录
+记录为 (time int64, open, high, low, close, volume float64) 共48字节；
+time列本身就是时间索引，按日期范围取数据只是两次二分查找，多个进程映射同一文件时共享页缓存
+"""
+import argparse
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.core.paths import db_dirname, split_db_target, symbol_dirname
+from app.data.bar_schema import BAR_TABLES, ensure_bar_schema
+from app.data.bar_store import BAR_DTYPES, BAR_FIELDS
+from app.data.sqlite_profile import StorageProfile, connect
+
+
+MAGIC = b"TSBARS1\0"
+VERSION = 1
+HEADER_SIZE = 64
+RECORD_DTYPE = np.dtype([(field, np.dtype(BAR_DTYPES[field]).newbyteorder("<")) for field in BAR_FIELDS])
+_HEADER = struct.Struct("<8sIIq")  # 魔数, 版本, 记录长度, 记录数
+_COUNT_OFFSET = 16
+
+
+class BarFile:
+    """单个K线文件
+
+    文件中只保存已收盘的K线，已写入的记录从不原地修改（原地覆盖时读取方可能读到写了一半的记录）。
+    写入：比最后一根新的K线追加到文件末尾，先写记录再更新文件头的记录数，读取方不会看到写了一半的记录；
+    与文件中相同的K线直接跳过；更早的缺失K线或内容有变化的K线（历史回补、修正）先放入待合并队列，
+    flush()时一次性合并写新文件并原子替换，一次回补只重写一次文件。
+    读取：records()/columns() 返回映射在文件上的只读视图，文件被追加或替换后下次读取自动重新映射。
+    （Windows下文件被其他进程映射时不能替换，flush会失败，待合并的K线保留到下次flush，追加不受影响）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map: Optional[np.memmap] = None
+        self._map_key: Optional[Tuple[int, int]] = None  # (inode, 映射长度)
+        self._pending: List[np.ndarray] = []  # 待合并的更早K线
+        self._lock = threading.Lock()
+
+    # ========== 读取 ==========
+
+    def _mapped(self) -> Optional[np.memmap]:
+        """当前文件的映射；文件变长或被替换时重新映射"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._map = self._map_key = None
+            return None
+        if stat.st_size < HEADER_SIZE:
+            return None
+
+        if self._map is None or self._map_key[0] != stat.st_ino or self._map_key[1] < stat.st_size:
+            self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+            self._map_key = (stat.st_ino, len(self._map))
+            magic, version, record_size, _ = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+                self._map = self._map_key = None
+                raise ValueError(f"不是K线文件或版本不兼容: {self.path}")
+        return self._map
+
+    def __len__(self) -> int:
+        mapped = self._mapped()
+        return 0 if mapped is None else self._count(mapped)
+
+    def _count(self, mapped: np.memmap) -> int:
+        count = int(mapped[_COUNT_OFFSET:_COUNT_OFFSET + 8].view("<i8")[0])
+        # 记录数先于映射更新时只读取已映射的部分
+        return min(count, (len(mapped) - HEADER_SIZE) // RECORD_DTYPE.itemsize)
+
+    def records(self, start_time: int = None, end_time: int = None) -> np.ndarray:
+        """时间范围 [start_time, end_time] 内的记录（结构化数组，只读视图）"""
+        mapped = self._mapped()
+        if mapped is None:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        count = self._count(mapped)
+        records = mapped[HEADER_SIZE:HEADER_SIZE + count * RECORD_DTYPE.itemsize].view(RECORD_DTYPE)
+
+        times = records["time"]
+        lo = int(np.searchsorted(times, start_time, "left")) if start_time is not None else 0
+        hi = int(np.searchsorted(times, end_time, "right")) if end_time is not None else count
+        return records[lo:hi]
+
+    def columns(self, start_time: int = None, end_time: int = None) -> Dict[str, np.ndarray]:
+        """按字段的只读视图，格式与内存K线存储（BarStore）一致"""
+        records = self.records(start_time, end_time)
+        return {field: records[field] for field in BAR_FIELDS}
+
+    def to_frame(self, start_time: int = None, end_time: int = None) -> pd.DataFrame:
+        """复制为DataFrame"""
+        return pd.DataFrame(self.records(start_time, end_time))
+
+    @property
+    def last_time(self) -> Optional[int]:
+        records = self.records()
+        return int(records["time"][-1]) if len(records) else None
+
+    # ========== 写入 ==========
+
+    @property
+    def pending(self) -> int:
+        """待合并的K线数"""
+        return sum(len(records) for records in self._pending)
+
+    def append(self, time_, open_, high, low, close, volume) -> int:
+        """写入已收盘的K线列数据，返回追加和放入待合并队列的条数"""
+        incoming = np.empty(len(time_), dtype=RECORD_DTYPE)
+        for field, column in zip(BAR_FIELDS, (time_, open_, high, low, close, volume)):
+            incoming[field] = column
+        if not len(incoming):
+            return 0
+        incoming = incoming[np.argsort(incoming["time"], kind="stable")]
+        # 同一批内同一时间保留最后一根
+        keep = np.append(incoming["time"][1:] != incoming["time"][:-1], True)
+        incoming = incoming[keep]
+
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._write_file(incoming)
+                return len(incoming)
+
+            existing = self.records()
+            if len(existing):
+                split = int(np.searchsorted(incoming["time"], existing["time"][-1], "right"))
+                older, incoming = self._changed(existing, incoming[:split]), incoming[split:]
+                if len(older):
+                    self._pending.append(older)
+            else:
+                older = incoming[:0]
+            if len(incoming):
+                self._append_tail(incoming, len(existing))
+
+        return len(older) + len(incoming)
+
+    @staticmethod
+    def _changed(existing: np.ndarray, records: np.ndarray) -> np.ndarray:
+        """records中文件里没有或内容不同的K线"""
+        positions = np.searchsorted(existing["time"], records["time"])
+        found = positions < len(existing)
+        same = np.zeros(len(records), dtype=bool)
+        same[found] = existing[positions[found]] == records[found]
+        return records[~same]
+
+    def _append_tail(self, incoming: np.ndarray, count: int):
+        """在已提交的记录之后追加，最后更新记录数"""
+        with open(self.path, "r+b") as handle:
+            handle.seek(HEADER_SIZE + count * RECORD_DTYPE.itemsize)
+            handle.write(incoming.tobytes())
+            handle.flush()
+            handle.seek(_COUNT_OFFSET)
+            handle.write(struct.pack("<q", count + len(incoming)))
+
+    def flush(self) -> int:
+        """把待合并的K线与文件合并后整体重写（同一时间以新数据为准），返回合并的条数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = np.concatenate(self._pending)
+            merged = np.concatenate((self.records(), pending))
+            merged = merged[np.argsort(merged["time"], kind="stable")]
+            keep = np.append(merged["time"][1:] != merged["time"][:-1], True)
+            self._write_file(merged[keep])
+            self._pending = []
+        return len(pending)
+
+    def _write_file(self, records: np.ndarray):
+        """写完整文件到临时文件后原子替换"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".bars-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                header = _HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, len(records))
+                handle.write(header.ljust(HEADER_SIZE, b"\0"))
+                handle.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class BarFileStore:
+    """按 (合约, 时间周期) 管理一个数据库的K线文件: {bar_file_dir}/{数据库}/{合约}/{时间周期}.bars
+    通过get_bar_file_store(数据库)获取，不同数据库中的同一合约各有自己的文件"""
+
+    def __init__(self, root: str = None):
+        self.root = root or settings.bar_file_dir
+        self._files: Dict[Tuple[str, str], BarFile] = {}
+        self._lock = threading.Lock()
+
+    def path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, symbol_dirname(symbol), f"{timeframe}.bars")
+
+    def get(self, symbol: str, timeframe: str) -> BarFile:
+        key = (symbol, timeframe)
+        bar_file = self._files.get(key)
+        if bar_file is None:
+            with self._lock:
+                bar_file = self._files.get(key)
+                if bar_file is None:
+                    bar_file = self._files[key] = BarFile(self.path(symbol, timeframe))
+        return bar_file
+
+    def append(self, symbol: str, timeframe: str, time_, open_, high, low, close, volume,
+               now: int = None) -> int:
+        """写入K线列数据；只写入已收盘的K线（time为收盘时间，早于now），未完成的K线留给内存K线存储"""
+        time_ = np.asarray(time_, dtype=np.int64)
+        closed = time_ < (int(time.time()) if now is None else now)
+        columns = [np.asarray(column)[closed] for column in (time_, open_, high, low, close, volume)]
+        return self.get(symbol, timeframe).append(*columns)
+
+    def flush(self, symbol: str = None, timeframe: str = None) -> int:
+        """合并待合并的K线（历史回补结束后调用），返回合并的条数"""
+        return sum(bar_file.flush() for (file_symbol, file_timeframe), bar_file in list(self._files.items())
+                   if symbol in (None, file_symbol) and timeframe in (None, file_timeframe))
+
+    def ensure_built(self, db_path: str, symbol: str, timeframes: Sequence[str] = None,
+                     profile: StorageProfile = None) -> Dict[str, int]:
+        """还没有K线文件的时间周期先用数据库中的K线生成，之后的写入只需追加"""
+        missing = [timeframe for timeframe in timeframes or list(BAR_TABLES)
+                   if not os.path.exists(self.path(symbol, timeframe))]
+        return self.build_from_sqlite(db_path, symbol, missing, profile) if missing else {}
+
+    def range(self, symbol: str, timeframe: str, start_time: int = None,
+              end_time: int = None) -> Dict[str, np.ndarray]:
+        """时间范围内的K线列视图"""
+        return self.get(symbol, timeframe).columns(start_time, end_time)
+
+    def build_from_sqlite(self, db_path: str, symbol: str, timeframes: Sequence[str] = None,
+                          profile: StorageProfile = None) -> Dict[str, int]:
+        """用SQLite（以及已归档到Parquet的月份）中的K线生成/补全K线文件，返回 {时间周期: 文件中的K线数}"""
+        try:
+            from app.data.bar_archive import get_bar_archive
+            archive = get_bar_archive(db_path)
+        except RuntimeError:
+            archive = None
+
+        ensure_bar_schema(db_path, profile)
+        built = {}
+        for timeframe in timeframes or list(BAR_TABLES):
+            table_name = BAR_TABLES.get(timeframe)
+            if table_name is None:
+                continue
+            if archive is not None:
+                frame = archive.read(symbol, timeframe, db_path=db_path, profile=profile)
+                columns = [frame[field].to_numpy() for field in BAR_FIELDS] if len(frame) else None
+            else:
+                conn = connect(db_path, profile, readonly=True)
+                try:
+                    rows = conn.execute(f"""
+                        SELECT time, open, high, low, close, vol FROM {table_name}
+                        WHERE code = ? ORDER BY time
+                    """, (symbol,)).fetchall()
+                finally:
+                    conn.close()
+                columns = [np.asarray(column) for column in zip(*rows)] if rows else None
+
+            if columns is not None:
+                self.append(symbol, timeframe, *columns)
+                self.get(symbol, timeframe).flush()
+            built[timeframe] = len(self.get(symbol, timeframe))
+            print(f"✅ {symbol} {timeframe}: K线文件 {built[timeframe]} 根")
+        return built
+
+
+_stores_lock = threading.Lock()
+_stores: Dict[str, BarFileStore] = {}
+
+
+def get_bar_file_store(db_path: str) -> BarFileStore:
+    """获取数据库对应的共享K线文件存储，目录为 {bar_file_dir}/{db_dirname}"""
+    key = db_dirname(db_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = BarFileStore(os.path.join(settings.bar_file_dir, key))
+        return store
+
+
+def _db_target_arg(value: str) -> Tuple[str, str]:
+    """argparse类型函数：格式错误时转成ArgumentTypeError，让argparse给出原始提示"""
+    try:
+        return split_db_target(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main():
+    """从SQLite生成/补全K线文件: python -m app.data.bar_file es_futures_data.db:ES nqz25_futures_data.db:NQZ25"""
+    parser = argparse.ArgumentParser(description="用SQLite（及Parquet归档）中的K线生成K线文件")
+    parser.add_argument("targets", nargs="+", type=_db_target_arg, metavar="数据库:合约")
+    args = parser.parse_args()
+
+    for db_path, symbol in args.targets:
+        get_bar_file_store(db_path).build_from_sqlite(db_path, symbol)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+K线数据库结构与版本迁移
+minN_bars 为数值类型的K线表（time为Unix秒，OHLC为REAL，vol为INTEGER），
+以 (code, time) 为主键的WITHOUT ROWID聚簇表，"某合约最新N根K线"和计数查询都是主键范围扫描；
+原来的 minN_data 保留为兼容视图（TEXT列、本地时间字符串），旧代码可以继续读写
+"""
+import argparse
+import sqlite3
+from typing import Callable, Dict, List, Tuple
+
+from app.data.sqlite_profile import StorageProfile, connect
+
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 时间周期 -> 数值K线表
+BAR_TABLES: Dict[str, str] = {
+    '1m': 'min1_bars',
+    '3m': 'min3_bars',
+    '5m': 'min5_bars',
+    '10m': 'min10_bars',
+    '15m': 'min15_bars',
+    '30m': 'min30_bars',
+    '1h': 'min60_bars'
+}
+
+# 时间周期 -> 旧版表名（迁移后为兼容视图）
+LEGACY_TABLES: Dict[str, str] = {
+    '1m': 'min1_data',
+    '3m': 'min3_data',
+    '5m': 'min5_data',
+    '10m': 'min10_data',
+    '15m': 'min15_data',
+    '30m': 'min30_data',
+    '1h': 'min60_data'
+}
+
+
+def _object_type(conn: sqlite3.Connection, name: str):
+    """返回sqlite_master中对象的类型（table/view），不存在时返回None"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _create_legacy_view(conn: sqlite3.Connection, bars_table: str, legacy_name: str):
+    """创建与旧表结构一致的兼容视图，并支持通过视图写入"""
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS {legacy_name} AS
+        SELECT strftime('{TIME_FORMAT}', time, 'unixepoch', 'localtime') AS time,
+               CAST(high AS TEXT) AS high,
+               CAST(low AS TEXT) AS low,
+               CAST(open AS TEXT) AS open,
+               CAST(close AS TEXT) AS close,
+               CAST(vol AS TEXT) AS vol,
+               code
+        FROM {bars_table}
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {legacy_name}_insert
+        INSTEAD OF INSERT ON {legacy_name}
+        BEGIN
+            INSERT OR REPLACE INTO {bars_table} (time, high, low, open, close, vol, code)
+            VALUES (CAST(strftime('%s', NEW.time, 'utc') AS INTEGER),
+                    CAST(NEW.high AS REAL), CAST(NEW.low AS REAL),
+                    CAST(NEW.open AS REAL), CAST(NEW.close AS REAL),
+                    CAST(NEW.vol AS INTEGER), NEW.code);
+        END
+    """)
+
+
+def _migrate_v1_typed_columns(conn: sqlite3.Connection):
+    """v1: TEXT列 -> REAL/INTEGER列，时间字符串 -> Unix秒"""
+    for timeframe, bars_table in BAR_TABLES.items():
+        legacy_name = LEGACY_TABLES[timeframe]
+
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {bars_table} (
+                time INTEGER PRIMARY KEY,
+                high REAL,
+                low REAL,
+                open REAL,
+                close REAL,
+                vol INTEGER,
+                code TEXT
+            )
+        """)
+
+        if _object_type(conn, legacy_name) == 'table':
+            # 旧表中的时间是本地时间字符串，'utc'修饰符将其换算为UTC
+            conn.execute(f"""
+                INSERT OR REPLACE INTO {bars_table} (time, high, low, open, close, vol, code)
+                SELECT CAST(strftime('%s', time, 'utc') AS INTEGER),
+                       CAST(high AS REAL), CAST(low AS REAL),
+                       CAST(open AS REAL), CAST(close AS REAL),
+                       CAST(vol AS INTEGER), code
+                FROM {legacy_name}
+                WHERE strftime('%s', time, 'utc') IS NOT NULL
+            """)
+            conn.execute(f"DROP TABLE {legacy_name}")
+
+        _create_legacy_view(conn, bars_table, legacy_name)
+
+
+def _create_clustered_table(conn: sqlite3.Connection, table_name: str):
+    """以 (code, time) 为聚簇主键的K线表"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            time INTEGER NOT NULL,
+            high REAL,
+            low REAL,
+            open REAL,
+            close REAL,
+            vol INTEGER,
+            code TEXT NOT NULL,
+            PRIMARY KEY (code, time)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migrate_v2_clustered_primary_key(conn: sqlite3.Connection):
+    """v2: time单列主键 -> (code, time) 复合主键 + WITHOUT ROWID"""
+    for timeframe, bars_table in BAR_TABLES.items():
+        legacy_name = LEGACY_TABLES[timeframe]
+        new_table = f"{bars_table}_v2"
+
+        # 兼容视图和触发器引用旧表，重建表之前先删除
+        conn.execute(f"DROP TRIGGER IF EXISTS {legacy_name}_insert")
+        conn.execute(f"DROP VIEW IF EXISTS {legacy_name}")
+
+        _create_clustered_table(conn, new_table)
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {new_table} (time, high, low, open, close, vol, code)
+            SELECT time, high, low, open, close, vol, COALESCE(code, '')
+            FROM {bars_table}
+        """)
+        conn.execute(f"DROP TABLE {bars_table}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {bars_table}")
+
+        _create_legacy_view(conn, bars_table, legacy_name)
+
+
+def _migrate_v3_backfill_checked(conn: sqlite3.Connection):
+    """v3: 记录已经请求过的回补区间，区间内没有K线的时段（停牌、节假日、无成交）不再重复请求"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checked (
+            code TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            end INTEGER NOT NULL,
+            PRIMARY KEY (code, timeframe, start)
+        ) WITHOUT ROWID
+    """)
+
+
+# (版本号, 迁移函数)，按顺序执行
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _migrate_v1_typed_columns),
+    (2, _migrate_v2_clustered_primary_key),
+    (3, _migrate_v3_backfill_checked),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """读取数据库结构版本（PRAGMA user_version）"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate_bar_schema(conn: sqlite3.Connection) -> int:
+    """执行所有未应用的迁移，每个版本一个事务，返回最终版本"""
+    current = get_schema_version(conn)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+
+    try:
+        for version, migration in MIGRATIONS:
+            if version <= current:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 其他进程可能刚刚完成了同一个迁移
+                if get_schema_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    current = get_schema_version(conn)
+                    continue
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            current = version
+            print(f"✅ K线数据库结构已迁移到 v{version}")
+    finally:
+        conn.isolation_level = isolation_level
+
+    return current
+
+
+def ensure_bar_schema(db_path: str, profile: StorageProfile = None) -> int:
+    """打开数据库并迁移到最新结构"""
+    conn = connect(db_path, profile)
+    try:
+        return migrate_bar_schema(conn)
+    finally:
+        conn.close()
+
+
+def main():
+    """命令行迁移: python -m app.data.bar_schema es_futures_data.db nqz25_futures_data.db"""
+    parser = argparse.ArgumentParser(description="把K线数据库迁移到最新结构")
+    parser.add_argument("db_paths", nargs="+", metavar="数据库")
+    args = parser.parse_args()
+
+    for db_path in args.db_paths:
+        version = ensure_bar_schema(db_path)
+        print(f"📊 {db_path}: v{version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+内存列式K线存储 - 每个合约/时间周期一个NumPy环形缓冲区
+收集器写入后追加到这里，图表、策略等读取方直接切片（零拷贝视图），
+缓冲区中没有的数据再回退到SQLite（持久层）
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.core.singleton import shared_instance
+from app.data.sqlite_profile import StorageProfile, connect
+
+
+BAR_FIELDS: Tuple[str, ...] = ('time', 'open', 'high', 'low', 'close', 'volume')
+# 数据来源 (数据库, 表名)：同一合约/时间周期来自不同数据库时各用一个缓冲区
+Source = Tuple[str, str]
+
+BAR_DTYPES: Dict[str, type] = {
+    'time': np.int64,  # Unix秒（与数据库time键一致）
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,
+}
+
+
+class RingBarBuffer:
+    """定长环形K线缓冲区
+
+    每个字段分配2倍容量并且双写（位置i和i+capacity），
+    这样任意"最近N根"窗口在内存中都是连续的，读取时可以直接返回切片视图而不需要拷贝。
+    返回的视图在之后追加超过capacity根K线前保持有效，需要长期持有请自行copy()
+    """
+
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self._arrays = {field: np.zeros(capacity * 2, dtype=BAR_DTYPES[field]) for field in BAR_FIELDS}
+        self._count = 0  # 已写入总数（单调递增）
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def last_time(self) -> Optional[int]:
+        if self._count == 0:
+            return None
+        return int(self._arrays['time'][self._window(1)[0]])
+
+    @property
+    def first_time(self) -> Optional[int]:
+        if self._count == 0:
+            return None
+        start, _ = self._window(len(self))
+        return int(self._arrays['time'][start])
+
+    def _window(self, size: int) -> Tuple[int, int]:
+        """最近size根K线在双倍数组中的连续区间 [start, end)"""
+        end = (self._count - 1) % self.capacity + self.capacity + 1
+        return end - size, end
+
+    def _write(self, slot: int, values: Sequence):
+        for field, value in zip(BAR_FIELDS, values):
+            array = self._arrays[field]
+            array[slot] = value
+            array[slot + self.capacity] = value
+
+    def append(self, time: np.ndarray, open_: np.ndarray, high: np.ndarray,
+               low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> int:
+        """追加K线。比最后一根新的K线直接写入环形区，与已有时间相同的K线覆盖更新（未完成K线），
+        缓冲区中不存在的更早K线（历史回补）合并后重建缓冲区。返回写入条数"""
+        order = np.argsort(time, kind='stable')
+        columns = [np.asarray(column)[order] for column in (time, open_, high, low, close, volume)]
+        missing = []
+
+        with self._lock:
+            for index, row in enumerate(zip(*columns)):
+                bar_time = int(row[0])
+                last_time = self.last_time
+
+                if last_time is None or bar_time > last_time:
+                    self._write(self._count % self.capacity, row)
+                    self._count += 1
+                    continue
+
+                # 覆盖已存在的同一时间K线
+                start, end = self._window(len(self))
+                times = self._arrays['time'][start:end]
+                position = int(np.searchsorted(times, bar_time))
+                if position < len(times) and times[position] == bar_time:
+                    self._write((start + position) % self.capacity, row)
+                else:
+                    missing.append(index)
+
+            if missing:
+                self._merge([column[missing] for column in columns])
+
+        return len(order)
+
+    def _merge(self, columns: List[np.ndarray]):
+        """把更早的K线与现有数据按时间合并，保留最新的capacity根（调用方持有锁）"""
+        start, end = self._window(len(self))
+        merged = [np.concatenate((self._arrays[field][start:end], column))
+                  for field, column in zip(BAR_FIELDS, columns)]
+        order = np.argsort(merged[0], kind='stable')[-self.capacity:]
+
+        size = len(order)
+        for field, column in zip(BAR_FIELDS, merged):
+            array = self._arrays[field]
+            array[self.capacity:self.capacity + size] = column[order]
+            array[:size] = column[order]
+        self._count = size
+
+    def latest(self, size: int) -> Dict[str, np.ndarray]:
+        """最近size根K线（只读视图，按时间升序）"""
+        with self._lock:
+            size = min(size, len(self))
+            start, end = self._window(size) if size else (0, 0)
+            return self._view(start, end)
+
+    def range(self, start_time: int = None, end_time: int = None) -> Dict[str, np.ndarray]:
+        """时间范围 [start_time, end_time] 内的K线（只读视图）"""
+        with self._lock:
+            size = len(self)
+            if not size:
+                return self._view(0, 0)
+            start, end = self._window(size)
+            times = self._arrays['time'][start:end]
+            lo = int(np.searchsorted(times, start_time, 'left')) if start_time is not None else 0
+            hi = int(np.searchsorted(times, end_time, 'right')) if end_time is not None else size
+            return self._view(start + lo, start + hi)
+
+    def _view(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        views = {}
+        for field in BAR_FIELDS:
+            view = self._arrays[field][start:end]
+            view.flags.writeable = False
+            views[field] = view
+        return views
+
+
+def sqlite_source(db_path: str, table_name: str) -> Source:
+    """SQLite数据来源标识（绝对路径，同一文件的不同写法对应同一个缓冲区）"""
+    return os.path.abspath(db_path), table_name
+
+
+class BarStore:
+    """进程内K线存储 - 按 (合约, 时间周期, 数据来源) 管理环形缓冲区，SQLite作为持久层"""
+
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self._buffers: Dict[Tuple[str, str, Optional[Source]], RingBarBuffer] = {}
+        self._synced: Set[Tuple[str, str, Optional[Source]]] = set()  # 已从SQLite加载过的缓冲区
+        self._archive_loaded: Set[Tuple[str, str, Optional[Source]]] = set()  # 已从Parquet归档补足过的缓冲区
+        self._lock = threading.Lock()
+
+    def get_buffer(self, symbol: str, timeframe: str, create: bool = True,
+                   source: Source = None) -> Optional[RingBarBuffer]:
+        key = (symbol, timeframe, source)
+        buffer = self._buffers.get(key)
+        if buffer is None and create:
+            with self._lock:
+                buffer = self._buffers.get(key)
+                if buffer is None:
+                    buffer = self._buffers[key] = RingBarBuffer(self.capacity)
+        return buffer
+
+    def append(self, symbol: str, timeframe: str, time, open_, high, low, close, volume,
+               source: Source = None) -> int:
+        """追加K线列数据（source为写入的数据库，与读取时的来源一致才会读到）"""
+        return self.get_buffer(symbol, timeframe, source=source).append(
+            np.asarray(time, dtype=np.int64),
+            np.asarray(open_, dtype=np.float64),
+            np.asarray(high, dtype=np.float64),
+            np.asarray(low, dtype=np.float64),
+            np.asarray(close, dtype=np.float64),
+            np.asarray(volume, dtype=np.float64)
+        )
+
+    def append_rows(self, symbol: str, timeframe: str, rows: Sequence[Tuple],
+                    source: Source = None) -> int:
+        """追加数据库行格式的K线 (time, high, low, open, close, vol, code)"""
+        if not rows:
+            return 0
+        columns = list(zip(*rows))
+        return self.append(symbol, timeframe, columns[0], columns[3], columns[1],
+                           columns[2], columns[4], columns[5], source=source)
+
+    def latest(self, symbol: str, timeframe: str, size: int,
+               db_path: str = None, table_name: str = None,
+               profile: StorageProfile = None) -> Dict[str, np.ndarray]:
+        """最近size根K线；给出数据库时先与SQLite同步（其他进程写入的数据也能读到）"""
+        source = None
+        if db_path and table_name:
+            source = sqlite_source(db_path, table_name)
+            self.sync_from_sqlite(symbol, timeframe, db_path, table_name, profile, limit=size)
+        return self.get_buffer(symbol, timeframe, source=source).latest(size)
+
+    def range(self, symbol: str, timeframe: str, start_time: int = None,
+              end_time: int = None, source: Source = None) -> Optional[Dict[str, np.ndarray]]:
+        """缓冲区覆盖该时间范围时返回视图，否则返回None（调用方回退到持久层）
+        范围终点晚于缓冲区最后一根K线时，只有从数据库同步过的缓冲区（sync_from_sqlite）才视为完整，
+        只靠本进程写入的缓冲区可能缺少其他进程写入的较新K线"""
+        buffer = self.get_buffer(symbol, timeframe, create=False, source=source)
+        if buffer is None or not len(buffer):
+            return None
+        if start_time is not None and buffer.first_time > start_time:
+            return None
+        if (end_time is not None and buffer.last_time < end_time
+                and (symbol, timeframe, source) not in self._synced):
+            return None
+        return buffer.range(start_time, end_time)
+
+    def sync_from_sqlite(self, symbol: str, timeframe: str, db_path: str, table_name: str,
+                         profile: StorageProfile = None, limit: int = None) -> int:
+        """从SQLite加载K线到缓冲区：第一次加载最近limit根（数据库中不够时用Parquet归档补足），
+        之后只读取最后一根及之后的数据（主键范围扫描）"""
+        source = sqlite_source(db_path, table_name)
+        buffer = self.get_buffer(symbol, timeframe, source=source)
+        key = (symbol, timeframe, source)
+        limit = min(limit or self.capacity, self.capacity)
+
+        last_time = buffer.last_time
+        incremental = key in self._synced and len(buffer) >= limit and last_time is not None
+        if incremental:
+            sql = f"""
+                SELECT time, high, low, open, close, vol, code
+                FROM {table_name}
+                WHERE code = ? AND time >= ?
+                ORDER BY time
+            """
+            params = (symbol, last_time)
+        else:
+            sql = f"""
+                SELECT time, high, low, open, close, vol, code
+                FROM {table_name}
+                WHERE code = ?
+                ORDER BY time DESC
+                LIMIT ?
+            """
+            params = (symbol, limit)
+
+        try:
+            conn = connect(db_path, profile, readonly=True)
+            rows = conn.execute(sql, params).fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"❌ 从数据库加载K线失败: {e}")
+            return 0
+
+        self._synced.add(key)
+        count = 0
+        if not incremental and len(rows) < limit and key not in self._archive_loaded:
+            self._archive_loaded.add(key)
+            count += self._load_archived(symbol, timeframe, limit - len(rows),
+                                         rows[-1][0] if rows else None, source)
+        return count + self.append_rows(symbol, timeframe, rows, source)
+
+    def _load_archived(self, symbol: str, timeframe: str, size: int, before: Optional[int],
+                       source: Source) -> int:
+        """首次加载时数据库中的K线不够，用Parquet归档中更早的K线补足（已归档的月份已从数据库删除）"""
+        # bar_archive依赖本模块，延迟导入
+        from app.data.bar_archive import archive_for
+
+        try:
+            archive = archive_for(symbol, timeframe, source[0])
+            if archive is None:
+                return 0
+            bars = archive.tail(symbol, timeframe, size, before)
+        except Exception as e:
+            print(f"❌ 从归档加载K线失败: {e}")
+            return 0
+        if bars.empty:
+            return 0
+        return self.append(symbol, timeframe, *(bars[field].values for field in BAR_FIELDS), source=source)
+
+    def clear(self, symbol: str = None):
+        """清空缓冲区"""
+        with self._lock:
+            if symbol is None:
+                self._buffers.clear()
+                self._synced.clear()
+                self._archive_loaded.clear()
+            else:
+                for key in [key for key in self._buffers if key[0] == symbol]:
+                    del self._buffers[key]
+                    self._synced.discard(key)
+                    self._archive_loaded.discard(key)
+
+
+@shared_instance
+def get_bar_store() -> BarStore:
+    """进程内共享的K线存储"""
+    return BarStore()
@@ -0,0 +1,156 @@
+"""
+K线写入模块 - 每个数据库一个长连接 + 写入队列
+所有时间周期线程、历史回补和实时K线的写入都经过同一个写线程，
+在一个事务里用executemany批量提交，避免争抢SQLite写锁
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.data.sqlite_profile import StorageProfile, connect
+
+
+BarRow = Tuple  # (time, high, low, open, close, vol, code)
+
+
+class SQLiteBarWriter:
+    """单连接SQLite写入器"""
+
+    def __init__(self, db_path: str, profile: StorageProfile = None, max_batch_rows: int = 20000):
+        self.db_path = db_path
+        self.profile = profile
+        self.max_batch_rows = max_batch_rows
+        self._queue: "queue.Queue[Optional[Tuple[str, Sequence[BarRow], Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"bar-writer:{os.path.basename(db_path)}", daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    def write_bars(self, table_name: str, rows: Sequence[BarRow], wait: bool = True) -> Future:
+        """提交一批K线，wait=True时等待事务提交后返回"""
+        future: Future = Future()
+        if not rows:
+            future.set_result(0)
+            return future
+        if self._closed:
+            raise RuntimeError(f"写入器已关闭: {self.db_path}")
+
+        self._queue.put((table_name, rows, future))
+        if wait:
+            future.result()
+        return future
+
+    def flush(self):
+        """等待队列中已提交的写入全部完成"""
+        future: Future = Future()
+        self._queue.put(("", (), future))
+        future.result()
+
+    def close(self):
+        """处理完剩余写入后关闭连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    @staticmethod
+    def _insert_sql(table_name: str) -> str:
+        return f"""
+            INSERT OR REPLACE INTO {table_name}
+            (time, high, low, open, close, vol, code)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+
+    def _run(self):
+        """写线程：阻塞取第一批，再把队列里积压的写入合并进同一个事务"""
+        conn = connect(self.db_path, self.profile, isolation_level=None)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+
+                batch = [item]
+                batch_rows = len(item[1])
+                stop = False
+                while batch_rows < self.max_batch_rows:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                    batch_rows += len(item[1])
+
+                self._commit_batch(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, Sequence[BarRow], Future]]):
+        """按表合并后在一个事务内写入"""
+        by_table: Dict[str, List[BarRow]] = {}
+        for table_name, rows, _ in batch:
+            if rows:
+                by_table.setdefault(table_name, []).extend(rows)
+
+        try:
+            self._execute_transaction(conn, by_table)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # 合并事务失败时逐个提交，只让出错的那一批收到异常
+            for item in batch:
+                self._commit_batch(conn, [item])
+            return
+
+        for _, rows, future in batch:
+            future.set_result(len(rows))
+
+    def _execute_transaction(self, conn: sqlite3.Connection, by_table: Dict[str, List[BarRow]]):
+        """单个事务执行executemany"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table_name, rows in by_table.items():
+                conn.executemany(self._insert_sql(table_name), rows)
+            conn.execute("COMMIT")
+        except Exception:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            raise
+
+
+_writers_lock = threading.Lock()
+_writers: Dict[str, SQLiteBarWriter] = {}
+
+
+def get_bar_writer(db_path: str, profile: StorageProfile = None) -> SQLiteBarWriter:
+    """获取数据库对应的共享写入器（每个数据库只有一个连接）"""
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = SQLiteBarWriter(db_path, profile)
+        return writer
+
+
+def close_all_writers():
+    """关闭所有写入器"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_all_writers)
@@ -0,0 +1,147 @@
+"""
+数据缓存 - 统一的缓存接口，进程内LRU+TTL后端（默认）和可选的Redis后端
+进程内后端直接保存Python对象（DataFrame不做序列化），条数受settings.max_cache_size限制
+"""
+import abc
+import fnmatch
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.config import settings
+from app.data.frame_codec import decode_frame, encode_frame, is_encoded_frame
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class CacheBackend(abc.ABC):
+    """缓存接口"""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，不存在或已过期时返回None"""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: int = None):
+        """写入缓存，ttl为空时使用默认过期时间（秒）"""
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        """删除缓存"""
+
+    @abc.abstractmethod
+    def keys(self, pattern: str = "*") -> List[str]:
+        """匹配pattern（glob风格）的未过期键"""
+
+    @abc.abstractmethod
+    def clear(self):
+        """清空缓存"""
+
+
+class MemoryCache(CacheBackend):
+    """进程内LRU+TTL缓存，超过max_size时淘汰最久未使用的条目（线程安全）"""
+
+    def __init__(self, max_size: int = None, default_ttl: int = None):
+        self.max_size = max_size or settings.max_cache_size
+        self.default_ttl = default_ttl or settings.cache_ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # 键 -> (过期时间, 值)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self, pattern: str = "*") -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (expires_at, _) in self._data.items()
+                    if expires_at > now and fnmatch.fnmatchcase(key, pattern)]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache(CacheBackend):
+    """Redis缓存（多进程共享），DataFrame以二进制列格式保存（见frame_codec），其他值以JSON保存"""
+
+    def __init__(self, url: str = None, default_ttl: int = None):
+        if redis is None:
+            raise RuntimeError("未安装redis")
+        self.client = redis.from_url(url or settings.redis_url)
+        self.default_ttl = default_ttl or settings.cache_ttl
+
+    def ping(self) -> bool:
+        return bool(self.client.ping())
+
+    def get(self, key: str) -> Optional[Any]:
+        cached_data = self.client.get(key)
+        if not cached_data:
+            return None
+        if is_encoded_frame(cached_data):
+            return decode_frame(cached_data)
+        data_json = cached_data.decode('utf-8')
+        if data_json.startswith('[{'):
+            # 旧版本以JSON记录保存的DataFrame
+            return pd.read_json(io.StringIO(data_json), orient='records')
+        return json.loads(data_json)
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        if isinstance(value, pd.DataFrame):
+            data = encode_frame(value, settings.cache_compression)
+        else:
+            data = json.dumps(value)
+        self.client.setex(key, ttl or self.default_ttl, data)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def keys(self, pattern: str = "*") -> List[str]:
+        return [key.decode('utf-8') for key in self.client.keys(pattern)]
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def create_cache(backend: str = None) -> CacheBackend:
+    """按settings.cache_backend创建缓存：memory（默认）或 redis
+    Redis不可用（未安装或连接失败）时回退到进程内缓存"""
+    backend = (backend or settings.cache_backend).lower()
+    if backend == "redis":
+        try:
+            cache = RedisCache()
+            cache.ping()
+            return cache
+        except Exception as e:
+            print(f"⚠️ Redis不可用（{e}），改用进程内缓存")
+    return MemoryCache()
@@ -0,0 +1,83 @@
+"""
+DataFrame二进制编码 - 缓存中用列的NumPy原始缓冲区代替JSON记录
+格式: 魔数(4字节) + 头长度(uint32) + JSON头(列名/dtype/字节数/压缩方式) + 各列缓冲区（可选zlib压缩）
+数值和时间列保持原dtype，解码时直接从缓冲区构造数组；字符串等对象列以JSON数组保存
+"""
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"TSF1"
+_HEADER_LEN = struct.Struct("<I")
+
+
+def _column_buffer(series: pd.Series) -> Tuple[Dict[str, Any], bytes]:
+    """单列 -> (头信息, 原始字节)"""
+    meta: Dict[str, Any] = {"name": series.name}
+    dtype = series.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        meta["tz"] = str(dtype.tz)
+        values = series.dt.tz_convert("UTC").dt.tz_localize(None).values
+    elif dtype.kind in "biufcmM":
+        values = series.values
+    else:
+        meta["dtype"] = "json"
+        return meta, json.dumps(series.tolist(), ensure_ascii=False, default=str).encode("utf-8")
+
+    values = np.ascontiguousarray(values)
+    meta["dtype"] = values.dtype.str
+    return meta, values.tobytes()
+
+
+def encode_frame(df: pd.DataFrame, compression: str = "zlib", level: int = 1) -> bytes:
+    """编码DataFrame（索引不保存，解码后为RangeIndex）；compression为zlib或none"""
+    columns: List[Dict[str, Any]] = []
+    buffers: List[bytes] = []
+    for name in df.columns:
+        meta, buffer = _column_buffer(df[name])
+        if compression == "zlib":
+            buffer = zlib.compress(buffer, level)
+        meta["nbytes"] = len(buffer)
+        columns.append(meta)
+        buffers.append(buffer)
+
+    header = json.dumps({"rows": len(df), "compression": compression, "columns": columns},
+                        ensure_ascii=False, default=str).encode("utf-8")
+    return b"".join([MAGIC, _HEADER_LEN.pack(len(header)), header] + buffers)
+
+
+def is_encoded_frame(data: bytes) -> bool:
+    return data[:4] == MAGIC
+
+
+def decode_frame(data: bytes) -> pd.DataFrame:
+    """解码encode_frame的结果"""
+    if not is_encoded_frame(data):
+        raise ValueError("不是编码后的DataFrame")
+    (header_len,) = _HEADER_LEN.unpack_from(data, 4)
+    offset = 4 + _HEADER_LEN.size
+    header = json.loads(data[offset:offset + header_len])
+    offset += header_len
+
+    view = memoryview(data)
+    columns = {}
+    for meta in header["columns"]:
+        buffer = view[offset:offset + meta["nbytes"]]
+        offset += meta["nbytes"]
+        if header["compression"] == "zlib":
+            buffer = zlib.decompress(buffer)
+
+        if meta["dtype"] == "json":
+            columns[meta["name"]] = json.loads(bytes(buffer))
+            continue
+        values = np.frombuffer(buffer, dtype=np.dtype(meta["dtype"]))
+        if "tz" in meta:
+            values = pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(meta["tz"])
+        columns[meta["name"]] = values
+
+    return pd.DataFrame(columns, columns=[meta["name"] for meta in header["columns"]])
+
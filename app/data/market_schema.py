@@ -0,0 +1,127 @@
+"""
+market_data表结构与迁移
+(symbol, interval, timestamp) 唯一索引：按合约/周期/时间范围的查询、最新K线查询都走索引，
+写入使用 INSERT ... ON CONFLICT 覆盖已存在的K线；
+PostgreSQL可选分区布局：先按合约LIST分区，每个合约再按月RANGE分区
+"""
+import argparse
+import hashlib
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+
+UNIQUE_INDEX = "ux_market_data_symbol_interval_ts"
+
+
+def has_unique_index(conn: Connection) -> bool:
+    """market_data上是否已有 (symbol, interval, timestamp) 唯一索引"""
+    inspector = inspect(conn)
+    if not inspector.has_table("market_data"):
+        return False
+    for index in inspector.get_indexes("market_data"):
+        if index.get("unique") and list(index["column_names"]) == ["symbol", "interval", "timestamp"]:
+            return True
+    return False
+
+
+def migrate_market_data(engine: Engine) -> Optional[int]:
+    """为已有数据库补建唯一索引：先删除重复K线（保留最后写入的一条）。
+    会删除数据，只由命令行或DataStorage.migrate_schema显式调用；
+    返回删除的重复K线条数，表不存在或已有唯一索引时返回None"""
+    with engine.begin() as conn:
+        if not inspect(conn).has_table("market_data") or has_unique_index(conn):
+            return None
+
+        removed = conn.execute(text("""
+            DELETE FROM market_data
+            WHERE id NOT IN (
+                SELECT MAX(id) FROM market_data GROUP BY symbol, interval, timestamp
+            )
+        """)).rowcount
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX {UNIQUE_INDEX} ON market_data (symbol, interval, timestamp)"
+        ))
+    return removed
+
+
+# ---- PostgreSQL分区布局 ----
+
+def _partition_suffix(symbol: str) -> str:
+    """合约代码 -> 分区表名后缀（小写字母数字和下划线；含其他字符时追加哈希，避免 @ES 与 ES 撞名）"""
+    suffix = re.sub(r"[^0-9a-z]+", "_", symbol.lower()).strip("_") or "symbol"
+    if suffix != symbol.lower():
+        suffix += "_" + hashlib.md5(symbol.encode("utf-8")).hexdigest()[:6]
+    return suffix
+
+
+def _month_starts(start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """覆盖 [start, end] 的每个自然月 [月初, 下月初)"""
+    months = []
+    current = datetime(start.year, start.month, 1)
+    while current <= end:
+        following = datetime(current.year + current.month // 12, current.month % 12 + 1, 1)
+        months.append((current, following))
+        current = following
+    return months
+
+
+def create_partitioned_market_data(conn: Connection):
+    """创建分区的market_data父表（分区键需要包含在唯一索引中，所以id不再是主键）"""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS market_data (
+            id BIGSERIAL NOT NULL,
+            symbol VARCHAR(20) NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            open DOUBLE PRECISION NOT NULL,
+            high DOUBLE PRECISION NOT NULL,
+            low DOUBLE PRECISION NOT NULL,
+            close DOUBLE PRECISION NOT NULL,
+            volume DOUBLE PRECISION NOT NULL,
+            interval VARCHAR(10) NOT NULL,
+            created_at TIMESTAMP
+        ) PARTITION BY LIST (symbol)
+    """))
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} ON market_data (symbol, interval, timestamp)"
+    ))
+
+
+def ensure_market_partitions(conn: Connection, symbol: str, start: datetime, end: datetime):
+    """确保合约分区及 [start, end] 覆盖的月分区存在（写入前调用；不建DEFAULT分区，
+    否则之后再建的分区会与DEFAULT分区中已有的数据冲突）"""
+    symbol_table = f"market_data_{_partition_suffix(symbol)}"
+    symbol_literal = "'" + symbol.replace("'", "''") + "'"
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {symbol_table}
+        PARTITION OF market_data FOR VALUES IN ({symbol_literal})
+        PARTITION BY RANGE (timestamp)
+    """))
+
+    for month_start, month_end in _month_starts(start, end):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {symbol_table}_{month_start:%Y_%m}
+            PARTITION OF {symbol_table}
+            FOR VALUES FROM ('{month_start:%Y-%m-%d}') TO ('{month_end:%Y-%m-%d}')
+        """))
+
+
+def main():
+    """命令行迁移: python -m app.data.market_schema [数据库URL]（默认settings.database_url）"""
+    parser = argparse.ArgumentParser(description="为market_data补建 (symbol, interval, timestamp) 唯一索引")
+    parser.add_argument("database_url", nargs="?", default=settings.database_url)
+    args = parser.parse_args()
+
+    removed = migrate_market_data(create_engine(args.database_url))
+    if removed is None:
+        print("📊 market_data无需迁移")
+    else:
+        print(f"✅ market_data已建立唯一索引（删除重复K线 {removed} 条）")
+
+
+if __name__ == "__main__":
+    main()
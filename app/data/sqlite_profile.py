@@ -0,0 +1,69 @@
+"""
+SQLite存储配置 - WAL模式和连接参数
+收集器（写）和图表/策略（读）都通过这里打开数据库，WAL模式下读写互不阻塞
+"""
+import sqlite3
+from pathlib import Path
+from dataclasses import dataclass, replace
+
+from app.core.config import settings
+from app.core.singleton import shared_instance
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """SQLite连接参数"""
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"  # WAL模式下NORMAL即可保证数据库不损坏
+    cache_size: int = -65536  # 负数表示KiB，即64MB页缓存
+    mmap_size: int = 268435456  # 256MB内存映射
+    temp_store: str = "MEMORY"
+    busy_timeout: int = 5000  # 毫秒
+
+    @classmethod
+    def from_settings(cls) -> "StorageProfile":
+        """从全局配置生成"""
+        return cls(
+            journal_mode=settings.sqlite_journal_mode,
+            synchronous=settings.sqlite_synchronous,
+            cache_size=settings.sqlite_cache_size,
+            mmap_size=settings.sqlite_mmap_size,
+            temp_store=settings.sqlite_temp_store,
+            busy_timeout=settings.sqlite_busy_timeout
+        )
+
+    def with_options(self, **kwargs) -> "StorageProfile":
+        """基于当前配置覆盖部分参数"""
+        return replace(self, **kwargs)
+
+    def apply(self, conn: sqlite3.Connection, set_journal_mode: bool = True):
+        """在连接上应用PRAGMA"""
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        if set_journal_mode:
+            # journal_mode写入数据库文件，只需要在建库/写连接上设置一次
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA temp_store = {self.temp_store}")
+
+
+@shared_instance
+def get_storage_profile() -> StorageProfile:
+    """获取默认存储配置"""
+    return StorageProfile.from_settings()
+
+
+def connect(db_path: str, profile: StorageProfile = None, readonly: bool = False,
+            **kwargs) -> sqlite3.Connection:
+    """按存储配置打开SQLite连接。readonly=True时以只读模式打开（mode=ro）：
+    不能写入、数据库不存在时报错而不是创建空库，也不修改journal模式"""
+    profile = profile or get_storage_profile()
+    kwargs.setdefault("timeout", profile.busy_timeout / 1000.0)
+    if readonly:
+        conn = sqlite3.connect(f"{Path(db_path).absolute().as_uri()}?mode=ro", uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(db_path, **kwargs)
+    profile.apply(conn, set_journal_mode=not readonly)
+    return conn
@@ -1,21 +1,34 @@
 """
 数据存储模块
 """
+import numpy as np
 import pandas as pd
 import sqlite3
-import json
-import redis
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any
 from datetime import datetime, timedelta
 import asyncio
-from sqlalchemy import create_engine, Column, String, Float, DateTime, Integer, Text
+from sqlalchemy import create_engine, delete, insert, inspect, select, type_coerce, Column, String, Float, DateTime, Index, Integer, Text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.data.bar_archive import archive_for
+from app.data.bar_store import get_bar_store
+from app.data.cache import CacheBackend, create_cache
+from app.data.market_schema import (UNIQUE_INDEX, create_partitioned_market_data, ensure_market_partitions,
+                                    has_unique_index, migrate_market_data)
 
 
 Base = declarative_base()
 
+_MARKET_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的数据库
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+# 单条IN语句的参数上限（旧版SQLite限制为999个绑定参数）
+_MAX_IN_PARAMS = 900
+
 
 class MarketData(Base):
     """市场数据模型"""
@@ -31,87 +44,144 @@ class MarketData(Base):
     volume = Column(Float, nullable=False)
     interval = Column(String(10), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index(UNIQUE_INDEX, 'symbol', 'interval', 'timestamp', unique=True),
+    )
 
 
 class DataStorage:
     """数据存储管理器"""
     
-    def __init__(self):
-        self.engine = create_engine(settings.database_url)
-        self.SessionLocal = sessionmaker(autocreate=False, autoflush=False, bind=self.engine)
-        self.redis_client = redis.from_url(settings.redis_url)
+    def __init__(self, cache: CacheBackend = None, database_url: str = None):
+        self.engine = create_engine(database_url or settings.database_url)
+        self.SessionLocal = sessionmaker(autoflush=False, bind=self.engine)
+        self.cache = cache or create_cache()
+        self.partitioned = settings.market_data_partitioned and self.engine.dialect.name == "postgresql"
+        self._upsert = False
+        # 数据库标识（密码已隐藏）：内存K线存储的缓冲区和Parquet归档目录按数据库区分
+        self.database = str(self.engine.url)
+        self._bar_source = (self.database, "market_data")
+        self._check_schema()
         
     def create_tables(self):
-        """创建数据库表"""
+        """创建数据库表（PostgreSQL且开启market_data_partitioned时market_data为分区表）"""
+        if self.partitioned:
+            with self.engine.begin() as conn:
+                create_partitioned_market_data(conn)
         Base.metadata.create_all(bind=self.engine)
+        self._check_schema()
         print("数据库表创建成功")
     
-    def save_market_data(self, df: pd.DataFrame, symbol: str, interval: str):
-        """保存市场数据到数据库"""
+    def _check_schema(self):
+        """有唯一索引且数据库支持ON CONFLICT时写入使用upsert（只检查，不修改表结构）"""
+        try:
+            with self.engine.connect() as conn:
+                exists = inspect(conn).has_table("market_data")
+                unique = exists and has_unique_index(conn)
+        except Exception as e:
+            print(f"检查market_data表结构失败: {str(e)}")
+            exists = unique = False
+        
+        if exists and not unique:
+            print("⚠️ market_data缺少唯一索引，写入改为先删除后插入；"
+                  "运行 python -m app.data.market_schema 迁移后使用upsert")
+        self._upsert = unique and self.engine.dialect.name in _UPSERT_INSERTS
+    
+    def migrate_schema(self) -> Optional[int]:
+        """显式迁移旧数据库：删除重复K线并补建唯一索引，返回删除的条数（无需迁移时为None）"""
+        removed = migrate_market_data(self.engine)
+        if removed is not None:
+            print(f"✅ market_data已建立唯一索引（删除重复K线 {removed} 条）")
+        self._check_schema()
+        return removed
+    
+    def save_market_data(self, df: pd.DataFrame, symbol: str, interval: str, chunk_size: int = None):
+        """保存市场数据到数据库 - 直接按列批量写入（不创建ORM对象），
+        同一 (symbol, interval, timestamp) 已存在的行会被覆盖，重复保存不会产生重复数据"""
         if df.empty:
             return
             
         try:
-            session = self.SessionLocal()
+            frame = self._prepare_market_frame(df)
+            chunk_size = chunk_size or settings.db_bulk_chunk_size
+            table = MarketData.__table__
+            created_at = datetime.utcnow()
             
-            # 准备数据
-            records = []
-            for _, row in df.iterrows():
-                record = MarketData(
-                    symbol=symbol,
-                    timestamp=row['timestamp'],
-                    open=row['open'],
-                    high=row['high'],
-                    low=row['low'],
-                    close=row['close'],
-                    volume=row['volume'],
-                    interval=interval
-                )
-                records.append(record)
+            with self.engine.begin() as conn:
+                if self.partitioned:
+                    ensure_market_partitions(conn, symbol, frame['timestamp'].iloc[0].to_pydatetime(),
+                                             frame['timestamp'].iloc[-1].to_pydatetime())
+                
+                for start in range(0, len(frame), chunk_size):
+                    chunk = frame.iloc[start:start + chunk_size]
+                    timestamps = list(chunk['timestamp'].dt.to_pydatetime())
+                    rows = [
+                        {'symbol': symbol, 'interval': interval, 'timestamp': ts, 'open': o, 'high': h,
+                         'low': l, 'close': c, 'volume': v, 'created_at': created_at}
+                        for ts, o, h, l, c, v in zip(
+                            timestamps, chunk['open'].tolist(), chunk['high'].tolist(), chunk['low'].tolist(),
+                            chunk['close'].tolist(), chunk['volume'].tolist()
+                        )
+                    ]
+                    
+                    if self._upsert:
+                        # 唯一索引冲突时覆盖价格和成交量
+                        stmt = _UPSERT_INSERTS[self.engine.dialect.name](table)
+                        conn.execute(stmt.on_conflict_do_update(
+                            index_elements=['symbol', 'interval', 'timestamp'],
+                            set_={column: stmt.excluded[column] for column in _MARKET_COLUMNS[1:] + ['created_at']}
+                        ), rows)
+                    else:
+                        self._delete_existing(conn, symbol, interval, timestamps)
+                        conn.execute(insert(table), rows)
             
-            # 批量插入
-            session.bulk_save_objects(records)
-            session.commit()
-            session.close()
+            # 同时把整理后的数据追加到内存K线存储（与写入数据库的行一致）
+            self._buffer_market_data(frame, symbol, interval)
             
-            print(f"成功保存 {len(records)} 条 {symbol} 数据到数据库")
+            print(f"成功保存 {len(frame)} 条 {symbol} 数据到数据库")
             
         except Exception as e:
             print(f"保存数据到数据库失败: {str(e)}")
     
+    @staticmethod
+    def _delete_existing(conn, symbol: str, interval: str, timestamps: List[datetime]):
+        """没有唯一索引时的覆盖写入：一次范围查询找出块内已存在的行并删除"""
+        table = MarketData.__table__
+        wanted = set(timestamps)
+        existing = conn.execute(select(table.c.id, table.c.timestamp).where(
+            table.c.symbol == symbol,
+            table.c.interval == interval,
+            table.c.timestamp.between(timestamps[0], timestamps[-1])
+        )).all()
+        ids = [row_id for row_id, ts in existing if ts in wanted]
+        for i in range(0, len(ids), _MAX_IN_PARAMS):
+            conn.execute(delete(table).where(table.c.id.in_(ids[i:i + _MAX_IN_PARAMS])))
+    
+    @staticmethod
+    def _prepare_market_frame(df: pd.DataFrame) -> pd.DataFrame:
+        """整理待写入的数据：时间统一为无时区UTC、数值列转为float、同一时间点只保留最后一条"""
+        timestamps = pd.to_datetime(df['timestamp'])
+        if timestamps.dt.tz is not None:
+            timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+        frame = pd.DataFrame({'timestamp': timestamps})
+        for column in ('open', 'high', 'low', 'close', 'volume'):
+            frame[column] = pd.to_numeric(df[column]).astype(np.float64).values
+        return frame.drop_duplicates('timestamp', keep='last').sort_values('timestamp')
+    
     def get_market_data(self, symbol: str, interval: str = "1min", 
                        start_date: datetime = None, end_date: datetime = None) -> pd.DataFrame:
-        """从数据库获取市场数据"""
+        """从数据库获取市场数据 - Core查询结果直接按列构造DataFrame（不创建ORM对象）"""
         try:
-            session = self.SessionLocal()
-            
-            query = session.query(MarketData).filter(MarketData.symbol == symbol)
-            query = query.filter(MarketData.interval == interval)
-            
-            if start_date:
-                query = query.filter(MarketData.timestamp >= start_date)
-            if end_date:
-                query = query.filter(MarketData.timestamp <= end_date)
-            
-            results = query.order_by(MarketData.timestamp).all()
-            session.close()
+            with self.engine.connect() as conn:
+                # 直接从DBAPI游标取元组，跳过SQLAlchemy的Row包装
+                result = conn.execute(self._market_data_select(symbol, interval, start_date, end_date))
+                rows = result.cursor.fetchall()
             
-            if not results:
+            df = self._with_archived(self._rows_to_frame(rows), symbol, interval, start_date, end_date)
+            if df.empty:
                 return pd.DataFrame()
             
-            # 转换为DataFrame
-            data = []
-            for result in results:
-                data.append({
-                    'timestamp': result.timestamp,
-                    'open': result.open,
-                    'high': result.high,
-                    'low': result.low,
-                    'close': result.close,
-                    'volume': result.volume
-                })
-            
-            df = pd.DataFrame(data)
             print(f"从数据库获取 {len(df)} 条 {symbol} 数据")
             return df
             
@@ -119,39 +189,95 @@ class DataStorage:
             print(f"从数据库获取数据失败: {str(e)}")
             return pd.DataFrame()
     
+    def _with_archived(self, df: pd.DataFrame, symbol: str, interval: str,
+                       start_date: datetime = None, end_date: datetime = None) -> pd.DataFrame:
+        """合并已归档到Parquet的K线（compact_market_data移出的月份），同一时间以数据库为准"""
+        archive = archive_for(symbol, interval, self.database)
+        if archive is None:
+            return df
+        archived = archive.read(symbol, interval, start_date, end_date)
+        if archived.empty:
+            return df
+        archived.insert(0, 'timestamp', pd.to_datetime(archived.pop('time'), unit='s'))
+        merged = pd.concat([archived, df], ignore_index=True)
+        return merged.drop_duplicates('timestamp', keep='last').sort_values('timestamp', ignore_index=True)
+    
+    def iter_market_data(self, symbol: str, interval: str = "1min", start_date: datetime = None,
+                         end_date: datetime = None, chunk_size: int = None) -> Iterator[pd.DataFrame]:
+        """分块读取市场数据（服务端游标流式返回），用于放不进内存的时间范围"""
+        chunk_size = chunk_size or settings.db_read_chunk_size
+        stmt = self._market_data_select(symbol, interval, start_date, end_date)
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(stmt)
+            while True:
+                # 流式结果会预取一部分行到SQLAlchemy的缓冲区，所以这里不能绕过Result直接读游标
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield self._rows_to_frame(rows)
+    
+    @staticmethod
+    def _market_data_select(symbol: str, interval: str, start_date: datetime = None, end_date: datetime = None):
+        """按时间排序的K线查询；时间列不经过SQLAlchemy逐行转换，由pandas整列解析"""
+        table = MarketData.__table__
+        stmt = select(
+            type_coerce(table.c.timestamp, String).label('timestamp'),
+            table.c.open, table.c.high, table.c.low, table.c.close, table.c.volume
+        ).where(table.c.symbol == symbol, table.c.interval == interval)
+        
+        if start_date:
+            stmt = stmt.where(table.c.timestamp >= start_date)
+        if end_date:
+            stmt = stmt.where(table.c.timestamp <= end_date)
+        return stmt.order_by(table.c.timestamp)
+    
+    @staticmethod
+    def _rows_to_frame(rows: List[Any]) -> pd.DataFrame:
+        """查询结果元组 -> DataFrame（时间列整列解析，价格列统一为float64）"""
+        df = pd.DataFrame.from_records(rows, columns=_MARKET_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df.astype({column: np.float64 for column in _MARKET_COLUMNS[1:]})
+    
+    def _buffer_market_data(self, frame: pd.DataFrame, symbol: str, interval: str):
+        """把_prepare_market_frame整理后的数据（无时区UTC、按时间去重排序）追加到内存K线存储"""
+        timestamps = frame['timestamp'].values.astype('datetime64[s]').astype(np.int64)
+        get_bar_store().append(
+            symbol, interval, timestamps,
+            frame['open'].values, frame['high'].values, frame['low'].values,
+            frame['close'].values, frame['volume'].values,
+            source=self._bar_source
+        )
+    
+    def get_buffered_market_data(self, symbol: str, interval: str = "1min",
+                                 start_date: datetime = None, end_date: datetime = None) -> Optional[pd.DataFrame]:
+        """从内存K线存储获取市场数据（start_date/end_date为无时区UTC），存储未覆盖该时间范围时返回None"""
+        start_ts = int(np.datetime64(start_date, 's').astype(np.int64)) if start_date else None
+        end_ts = int(np.datetime64(end_date, 's').astype(np.int64)) if end_date else None
+        
+        bars = get_bar_store().range(symbol, interval, start_ts, end_ts, self._bar_source)
+        if bars is None or not len(bars['time']):
+            return None
+        
+        return pd.DataFrame({
+            'timestamp': bars['time'].astype('datetime64[s]'),
+            'open': bars['open'],
+            'high': bars['high'],
+            'low': bars['low'],
+            'close': bars['close'],
+            'volume': bars['volume']
+        })
+    
     def cache_data(self, key: str, data: Any, ttl: int = None):
-        """缓存数据到Redis"""
+        """缓存数据（默认进程内缓存，settings.cache_backend为redis时使用Redis）"""
         try:
-            if isinstance(data, pd.DataFrame):
-                data_json = data.to_json(orient='records')
-            else:
-                data_json = json.dumps(data)
-            
-            ttl = ttl or settings.cache_ttl
-            self.redis_client.setex(key, ttl, data_json)
-            print(f"数据已缓存到Redis: {key}")
-            
+            self.cache.set(key, data, ttl or settings.cache_ttl)
         except Exception as e:
             print(f"缓存数据失败: {str(e)}")
     
     def get_cached_data(self, key: str) -> Optional[Any]:
-        """从Redis获取缓存数据"""
+        """获取缓存数据"""
         try:
-            cached_data = self.redis_client.get(key)
-            if cached_data:
-                data_json = cached_data.decode('utf-8')
-                try:
-                    # 尝试解析为DataFrame
-                    data = pd.read_json(data_json, orient='records')
-                    print(f"从Redis获取缓存数据: {key}")
-                    return data
-                except:
-                    # 解析为普通JSON
-                    data = json.loads(data_json)
-                    print(f"从Redis获取缓存数据: {key}")
-                    return data
-            return None
-            
+            return self.cache.get(key)
         except Exception as e:
             print(f"获取缓存数据失败: {str(e)}")
             return None
@@ -159,7 +285,7 @@ class DataStorage:
     def delete_cache(self, key: str):
         """删除缓存"""
         try:
-            self.redis_client.delete(key)
+            self.cache.delete(key)
             print(f"已删除缓存: {key}")
         except Exception as e:
             print(f"删除缓存失败: {str(e)}")
@@ -167,8 +293,7 @@ class DataStorage:
     def get_cache_keys(self, pattern: str = "*") -> List[str]:
         """获取缓存键列表"""
         try:
-            keys = self.redis_client.keys(pattern)
-            return [key.decode('utf-8') for key in keys]
+            return self.cache.keys(pattern)
         except Exception as e:
             print(f"获取缓存键失败: {str(e)}")
             return []
@@ -176,7 +301,7 @@ class DataStorage:
     def clear_all_cache(self):
         """清空所有缓存"""
         try:
-            self.redis_client.flushdb()
+            self.cache.clear()
             print("已清空所有缓存")
         except Exception as e:
             print(f"清空缓存失败: {str(e)}")
@@ -0,0 +1,84 @@
+"""
+后台API事件循环 - 一个常驻线程持有事件循环和长连接的异步客户端
+GUI等同步代码把协程提交到这里执行，每次操作只需一次网络往返，不再为单个请求创建事件循环和会话
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core.singleton import shared_instance
+from app.services.tradestation_client import TradestationAPIClient
+
+
+class APIRunner:
+    """后台事件循环线程 + 共享的TradestationAPIClient"""
+
+    def __init__(self, base_url: str = None):
+        self.base_url = base_url
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.client: Optional[TradestationAPIClient] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._startup_error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台线程（已启动时直接返回）；客户端创建或打开会话失败时抛出该异常，下次调用重新启动"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._startup_error = None
+                self._thread = threading.Thread(target=self._run, name="APIRunner", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        client = None
+        try:
+            client = TradestationAPIClient(base_url=self.base_url)
+            loop.run_until_complete(client.open())
+        except Exception as e:
+            print(f"❌ API后台线程启动失败: {e}")
+            if client is not None:
+                loop.run_until_complete(client.close())
+            loop.close()
+            self._startup_error = e
+            self._ready.set()
+            return
+        self.client, self.loop = client, loop
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.client.close())
+            self.loop.close()
+            self.loop = None
+
+    def submit(self, func: Callable[[TradestationAPIClient], Awaitable[Any]]) -> Future:
+        """提交 func(client) 协程，返回concurrent.futures.Future（可添加回调或阻塞等待）"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(func(self.client), self.loop)
+
+    def run(self, func: Callable[[TradestationAPIClient], Awaitable[Any]], timeout: float = None) -> Any:
+        """提交并阻塞等待结果"""
+        return self.submit(func).result(timeout)
+
+    def stop(self):
+        """停止事件循环并关闭会话"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        thread.join()
+
+
+@shared_instance
+def get_api_runner() -> APIRunner:
+    """获取进程内共享的后台API事件循环"""
+    return APIRunner()
@@ -0,0 +1,147 @@
+"""
+账户总览 - 余额、持仓、订单、报价并发查询合并为一个快照，定时刷新时只报告变化的行
+"""
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+@dataclass
+class DashboardSnapshot:
+    """一次并发查询的结果；持仓按Symbol、订单按OrderID、报价按Symbol索引"""
+    account_id: str
+    balances: Dict[str, Any] = field(default_factory=dict)
+    positions: Dict[str, Any] = field(default_factory=dict)
+    orders: Dict[str, Any] = field(default_factory=dict)
+    quotes: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)  # 查询失败的部分 -> 错误信息（其余部分照常返回）
+    fetched_at: float = 0.0
+
+    @classmethod
+    def from_responses(cls, account_id: str, balances: Any, positions: Any, orders: Any,
+                       quotes: Any) -> 'DashboardSnapshot':
+        """由各接口的响应（或异常）组装快照"""
+        snapshot = cls(account_id, fetched_at=time.time())
+        responses = {"balances": balances, "positions": positions, "orders": orders, "quotes": quotes}
+        for name, response in responses.items():
+            if isinstance(response, BaseException):
+                snapshot.errors[name] = str(response)
+                responses[name] = None
+
+        balance_list = (responses["balances"] or {}).get("Balances", [])
+        snapshot.balances = dict(balance_list[0]) if balance_list else {}
+        snapshot.positions = {pos["Symbol"]: pos for pos in (responses["positions"] or {}).get("Positions", [])}
+        snapshot.orders = {order["OrderID"]: order for order in (responses["orders"] or {}).get("Orders", [])}
+        snapshot.quotes = {quote["Symbol"]: quote for quote in (responses["quotes"] or {}).get("Quotes", [])}
+        return snapshot
+
+    def fresh_position(self, symbol: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """本次查询到且未超过max_age秒的持仓；持仓查询失败（沿用了旧快照）或快照过期时返回None"""
+        if "positions" in self.errors or time.time() - self.fetched_at > max_age:
+            return None
+        return self.positions.get(symbol)
+
+    def merge_failed(self, previous: Optional['DashboardSnapshot']) -> 'DashboardSnapshot':
+        """查询失败的部分沿用上一次快照，避免一次失败让界面上的行全部消失"""
+        if previous is not None and previous.account_id == self.account_id:
+            for name in self.errors:
+                setattr(self, name, getattr(previous, name))
+        return self
+
+
+@dataclass
+class SectionDiff:
+    """一个部分（持仓/订单/报价）的行变化"""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+@dataclass
+class SnapshotDiff:
+    """两次快照之间的变化"""
+    balances_changed: bool = False
+    positions: SectionDiff = field(default_factory=SectionDiff)
+    orders: SectionDiff = field(default_factory=SectionDiff)
+    quotes: SectionDiff = field(default_factory=SectionDiff)
+
+    def __bool__(self) -> bool:
+        return self.balances_changed or bool(self.positions or self.orders or self.quotes)
+
+
+def _diff_section(old: Dict[str, Any], new: Dict[str, Any]) -> SectionDiff:
+    old_keys: Set[str] = set(old)
+    return SectionDiff(
+        added=[key for key in new if key not in old_keys],
+        changed=[key for key in new if key in old_keys and old[key] != new[key]],
+        removed=[key for key in old if key not in new],
+    )
+
+
+def diff_snapshots(old: Optional[DashboardSnapshot], new: DashboardSnapshot) -> SnapshotDiff:
+    """比较两次快照，old为None或换了账户时所有行都视为新增"""
+    if old is None or old.account_id != new.account_id:
+        old = DashboardSnapshot(new.account_id)
+    return SnapshotDiff(
+        balances_changed=old.balances != new.balances,
+        positions=_diff_section(old.positions, new.positions),
+        orders=_diff_section(old.orders, new.orders),
+        quotes=_diff_section(old.quotes, new.quotes),
+    )
+
+
+class DashboardPoller:
+    """定时刷新账户总览，只在有变化时回调 on_update(snapshot, diff)"""
+
+    def __init__(self, client, account_id: str, interval: float,
+                 on_update: Callable[[DashboardSnapshot, SnapshotDiff], Any],
+                 symbols: List[str] = None):
+        self.client = client
+        self.account_id = account_id
+        self.interval = interval
+        self.on_update = on_update
+        self.symbols = list(symbols or [])
+        self.snapshot: Optional[DashboardSnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> SnapshotDiff:
+        """刷新一次，返回与上一次快照的差异"""
+        # 持仓品种的报价一并查询（用上一次快照中的持仓，不必等本次持仓返回）
+        symbols = list(dict.fromkeys(self.symbols + list(self.snapshot.positions if self.snapshot else [])))
+        snapshot = await self.client.get_dashboard_snapshot(self.account_id, symbols)
+        snapshot.merge_failed(self.snapshot)
+        diff = diff_snapshots(self.snapshot, snapshot)
+        self.snapshot = snapshot
+        if diff or snapshot.errors:
+            result = self.on_update(snapshot, diff)
+            if inspect.isawaitable(result):
+                await result
+        return diff
+
+    async def run(self):
+        """按interval循环刷新，直到被取消（单次失败不会中断循环）"""
+        while True:
+            started = time.monotonic()
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 刷新账户总览失败: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> asyncio.Task:
+        """在当前事件循环中启动定时刷新"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,45 @@
+"""
+共享HTTP会话层 - 长连接连接池 + 内存缓存的令牌提供器（见token_manager）
+所有收集线程、所有合约共用同一个会话和令牌，避免每次请求重新握手和读取tokens.json
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.core.singleton import shared_instance
+from app.services.token_manager import TokenManager, get_token_manager
+
+
+def create_http_session(pool_connections: int = None, pool_maxsize: int = None) -> requests.Session:
+    """创建带连接池的keep-alive会话"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections or settings.http_pool_connections,
+        pool_maxsize=pool_maxsize or settings.http_pool_maxsize,
+        pool_block=True
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    })
+    return session
+
+
+@shared_instance
+def get_http_session() -> requests.Session:
+    """获取进程内共享的HTTP会话"""
+    return create_http_session()
+
+
+def get_token_provider() -> TokenManager:
+    """获取进程内共享的令牌提供器（即共享令牌管理器）"""
+    return get_token_manager()
+
+
+def close_http_session():
+    """关闭共享会话（释放连接池）"""
+    session = get_http_session.reset()
+    if session is not None:
+        session.close()
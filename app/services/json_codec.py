@@ -0,0 +1,168 @@
+"""
+JSON编解码 - 优先使用msgspec/orjson，未安装时回退到标准库json
+msgspec可用时，K线/报价/持仓/订单响应可以直接解码为类型化结构（Struct），
+结构支持 obj['Field'] / obj.get('Field', 默认值) 读取，与原来的dict用法兼容
+"""
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if msgspec is not None:
+    JSON_BACKEND = "msgspec"
+    _json_decoder = msgspec.json.Decoder()
+    _json_encoder = msgspec.json.Encoder()
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return _json_decoder.decode(data)
+
+    def dumps(obj: Any) -> bytes:
+        return _json_encoder.encode(obj)
+
+elif orjson is not None:
+    JSON_BACKEND = "orjson"
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+else:
+    JSON_BACKEND = "json"
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+# API数值字段多数以字符串返回，个别接口返回数字
+Number = Optional[Union[str, int, float]]
+
+
+if msgspec is not None:
+    class Record(msgspec.Struct):
+        """类型化响应的基类，兼容dict风格的字段读取"""
+
+        def __getitem__(self, key: str) -> Any:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+
+        def __contains__(self, key: str) -> bool:
+            return getattr(self, key, None) is not None
+
+        def get(self, key: str, default: Any = None) -> Any:
+            value = getattr(self, key, None)
+            return default if value is None else value
+
+    class Bar(Record):
+        TimeStamp: str
+        Open: Number
+        High: Number
+        Low: Number
+        Close: Number
+        TotalVolume: Number = None
+        Volume: Number = None  # 旧版字段
+        OpenInterest: Number = None
+        Epoch: Optional[int] = None
+        BarStatus: Optional[str] = None
+        IsRealtime: Optional[bool] = None
+        IsEndOfHistory: Optional[bool] = None
+
+    class BarsResponse(Record):
+        Bars: List[Bar]
+
+    class Quote(Record):
+        Symbol: str
+        Last: Number = None
+        Bid: Number = None
+        Ask: Number = None
+        BidSize: Number = None
+        AskSize: Number = None
+        Open: Number = None
+        High: Number = None
+        Low: Number = None
+        PreviousClose: Number = None
+        NetChange: Number = None
+        NetChangePct: Number = None
+        Volume: Number = None
+        TradeTime: Optional[str] = None
+
+    class QuotesResponse(Record):
+        Quotes: List[Quote]
+        Errors: List[Dict[str, Any]] = []
+
+    class Position(Record):
+        Symbol: str
+        AccountID: Optional[str] = None
+        PositionID: Optional[str] = None
+        AssetType: Optional[str] = None
+        LongShort: Optional[str] = None
+        Quantity: Number = None
+        AveragePrice: Number = None
+        Last: Number = None
+        Bid: Number = None
+        Ask: Number = None
+        MarketValue: Number = None
+        TotalCost: Number = None
+        UnrealizedProfitLoss: Number = None
+        UnrealizedProfitLossPercent: Number = None
+        TodaysProfitLoss: Number = None
+        Timestamp: Optional[str] = None
+
+    class PositionsResponse(Record):
+        Positions: List[Position]
+        Errors: List[Dict[str, Any]] = []
+
+    class Order(Record):
+        OrderID: str
+        AccountID: Optional[str] = None
+        OrderType: Optional[str] = None
+        Status: Optional[str] = None
+        StatusDescription: Optional[str] = None
+        Duration: Optional[str] = None
+        LimitPrice: Number = None
+        StopPrice: Number = None
+        FilledPrice: Number = None
+        OpenedDateTime: Optional[str] = None
+        ClosedDateTime: Optional[str] = None
+        Legs: List[Dict[str, Any]] = []
+
+    class OrdersResponse(Record):
+        Orders: List[Order]
+        Errors: List[Dict[str, Any]] = []
+        NextToken: Optional[str] = None
+
+    _TYPED_DECODERS = {
+        "bars": msgspec.json.Decoder(BarsResponse),
+        "quotes": msgspec.json.Decoder(QuotesResponse),
+        "positions": msgspec.json.Decoder(PositionsResponse),
+        "orders": msgspec.json.Decoder(OrdersResponse),
+    }
+else:
+    _TYPED_DECODERS = {}
+
+
+def decode(data: Union[bytes, str], schema: str = None) -> Any:
+    """解码响应体。schema为 bars/quotes/positions/orders 且msgspec可用时返回类型化结构，
+    结构不匹配（如接口返回错误信息）或msgspec不可用时返回普通dict"""
+    decoder = _TYPED_DECODERS.get(schema)
+    if decoder is not None:
+        try:
+            return decoder.decode(data)
+        except msgspec.ValidationError:
+            pass
+    return loads(data)
@@ -0,0 +1,98 @@
+"""
+批量报价 - 合并同一时间窗口内的报价请求
+quotes接口支持逗号分隔的多个代码：窗口内的请求合并为每批最多N个代码的一次请求，
+正在请求中的代码不重复请求，结果在短TTL内直接从缓存返回
+"""
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class QuoteService:
+    """报价合并器（绑定创建时所在的事件循环）"""
+
+    def __init__(self, client, batch_window: float = None, max_batch: int = None, ttl: float = None):
+        self.client = client
+        self.batch_window = settings.quote_batch_window if batch_window is None else batch_window
+        self.max_batch = max_batch or settings.quote_batch_size
+        self.ttl = settings.quote_cache_ttl if ttl is None else ttl
+        self._cache: Dict[str, Tuple[float, Any]] = {}  # 代码 -> (获取时间, 报价)
+        self._inflight: Dict[str, asyncio.Future] = {}  # 已排队或请求中的代码
+        self._pending: List[str] = []  # 等待下一批发出的代码
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.requests = 0  # 实际发出的请求数
+
+    async def get_quote(self, symbol: str) -> Optional[Any]:
+        """获取单个代码的报价（与同一窗口内的其他请求合并）"""
+        return (await self.get_quotes([symbol])).get(symbol.strip().upper())
+
+    async def get_quotes(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        """获取多个代码的报价，返回 代码 -> 报价（接口没有返回的代码不在结果中）"""
+        now = time.monotonic()
+        results: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+
+        for symbol in dict.fromkeys(symbol.strip().upper() for symbol in symbols):
+            cached = self._cache.get(symbol)
+            if cached is not None and now - cached[0] < self.ttl:
+                results[symbol] = cached[1]
+                continue
+            future = self._inflight.get(symbol)
+            if future is None:
+                future = self._inflight[symbol] = loop.create_future()
+                self._pending.append(symbol)
+            waiting[symbol] = future
+
+        if self._pending:
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        for symbol, future in waiting.items():
+            quote = await asyncio.shield(future)
+            if quote is not None:
+                results[symbol] = quote
+        return results
+
+    def invalidate(self, symbols: Iterable[str] = None):
+        """清除缓存（不指定代码时全部清除）"""
+        if symbols is None:
+            self._cache.clear()
+            return
+        for symbol in symbols:
+            self._cache.pop(symbol.strip().upper(), None)
+
+    def _flush(self):
+        """把等待中的代码按每批max_batch个发出"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.max_batch):
+            asyncio.ensure_future(self._fetch(pending[i:i + self.max_batch]))
+
+    async def _fetch(self, batch: List[str]):
+        """请求一批代码并唤醒等待者"""
+        self.requests += 1
+        try:
+            response = await self.client.get_quote(",".join(batch), typed=True)
+        except Exception as e:
+            for symbol in batch:
+                future = self._inflight.pop(symbol, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        fetched_at = time.monotonic()
+        quotes = {quote["Symbol"].upper(): quote for quote in (response or {}).get("Quotes", [])}
+        for symbol in batch:
+            quote = quotes.get(symbol)
+            if quote is not None:
+                self._cache[symbol] = (fetched_at, quote)
+            future = self._inflight.pop(symbol, None)
+            if future is not None and not future.done():
+                future.set_result(quote)
@@ -0,0 +1,109 @@
+"""
+API限流 - 按接口分组的令牌桶
+所有请求（异步客户端、同步收集器）共用进程内同一组令牌桶，收到429时按Retry-After暂停整组接口
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.singleton import shared_instance
+
+
+class TokenBucket:
+    """令牌桶 - reserve()预约一个令牌并返回需要等待的秒数，线程安全，不绑定事件循环"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()  # 令牌计算的时间点，暂停期间位于未来
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if now > self.updated:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+            self.tokens -= 1
+            return max(0.0, self.updated - now) + max(0.0, -self.tokens) / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """服务端限流：seconds秒内不再发放令牌，之后从空桶开始补充"""
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+            if resume_at > self.updated:
+                self.updated = resume_at
+                self.tokens = min(self.tokens, 1.0)
+
+
+def parse_retry_after(value: Optional[str], default: float = 10.0) -> float:
+    """解析Retry-After（秒数或HTTP日期）"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimiter:
+    """按接口路径前缀分组的限流器"""
+
+    def __init__(self, limits: List[Tuple[str, int]] = None, window: int = None):
+        window = window or settings.rate_limit_window
+        # (路径前缀, 每个窗口的请求配额)，按顺序匹配，最后一项为默认分组
+        self.limits = limits or [
+            ("/marketdata", settings.rate_limit_marketdata),
+            ("/brokerage", settings.rate_limit_brokerage),
+            ("/orderexecution", settings.rate_limit_brokerage),
+            ("", settings.rate_limit_brokerage),
+        ]
+        self.buckets: Dict[str, TokenBucket] = {}
+        for prefix, quota in self.limits:
+            # 突发量取配额的1/10，补充速度扣除突发量，保证任意一个窗口内都不超过配额
+            burst = max(1, quota // 10)
+            self.buckets[prefix] = TokenBucket(max(quota - burst, 1) / window, burst)
+
+    def bucket_for(self, endpoint: str) -> TokenBucket:
+        path = endpoint.split("?", 1)[0]
+        if path.startswith("/v3/"):
+            path = path[3:]
+        for prefix, _ in self.limits:
+            if path.startswith(prefix):
+                return self.buckets[prefix]
+        return self.buckets[self.limits[-1][0]]
+
+    async def acquire(self, endpoint: str):
+        await self.bucket_for(endpoint).acquire()
+
+    def acquire_sync(self, endpoint: str):
+        self.bucket_for(endpoint).acquire_sync()
+
+    def pause(self, endpoint: str, seconds: float):
+        self.bucket_for(endpoint).pause(seconds)
+
+
+@shared_instance
+def get_rate_limiter() -> RateLimiter:
+    """进程内共享的限流器"""
+    return RateLimiter()
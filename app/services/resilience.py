@@ -0,0 +1,133 @@
+"""
+请求容错 - 带抖动的指数退避、按接口分组的熔断器和请求统计
+"""
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict
+
+from app.core.config import settings
+from app.core.singleton import shared_instance
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间直接拒绝请求"""
+
+
+@dataclass
+class RetryPolicy:
+    """指数退避（full jitter）：第n次重试等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间"""
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    @classmethod
+    def from_settings(cls) -> 'RetryPolicy':
+        return cls(settings.retry_max_attempts, settings.retry_base_delay, settings.retry_max_delay)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，reset_timeout秒后放行一个试探请求（半开），成功则关闭"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允许发送请求（半开状态只放行一个试探请求）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # 试探请求没有结果（例如被取消）时，下一个超时周期再放行一个
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回熔断器是否因此打开"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+    def retry_after(self) -> float:
+        """距离下一次试探还有多少秒"""
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+@dataclass
+class ClientMetrics:
+    """请求与补数统计"""
+    requests: int = 0
+    failures: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    circuit_opened: int = 0
+    circuit_rejected: int = 0
+    missed_bars: int = 0  # 进入补数队列的K线
+    recovered_bars: int = 0  # 补数成功取回的K线
+    recovery_failures: int = 0  # 多次补数仍失败、放弃的K线
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return asdict(self)
+
+
+def endpoint_key(endpoint: str) -> str:
+    """熔断分组：路径前两段，如 /marketdata/barcharts、/brokerage/accounts"""
+    parts = [part for part in endpoint.split("?", 1)[0].split("/") if part]
+    return "/" + "/".join(parts[:2])
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """按接口分组共享的熔断器"""
+    key = endpoint_key(endpoint)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(
+                    key, settings.circuit_failure_threshold, settings.circuit_reset_timeout)
+    return breaker
+
+
+@shared_instance
+def get_client_metrics() -> ClientMetrics:
+    """进程内共享的请求统计"""
+    return ClientMetrics()
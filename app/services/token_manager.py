@@ -0,0 +1,231 @@
+"""
+令牌管理器 - 进程内共享的OAuth令牌缓存
+令牌只在内存中读取；过期前提前刷新，同一时间只有一个线程/进程在刷新（线程锁 + 文件锁），
+刷新结果原子写回tokens.json，其他进程下次需要时直接复用而不会重复刷新
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import requests
+
+from app.core.config import settings
+from app.core.singleton import shared_instance
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+TOKEN_URL = "https://signin.tradestation.com/oauth/token"
+
+
+@contextmanager
+def file_lock(path: str):
+    """跨进程互斥锁（锁文件独立于令牌文件，令牌文件可以被原子替换）"""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK最多重试10秒，持锁进程还在刷新时继续等待
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_json(path: str, data: Dict):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tokens-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class TokenManager:
+    """令牌管理器 - 请求路径只读内存缓存，需要刷新时单飞执行"""
+
+    def __init__(self, path: str = None, refresh_margin: float = None):
+        self.path = path or settings.token_file
+        self.lock_path = self.path + ".lock"
+        self.refresh_margin = timedelta(
+            seconds=settings.token_refresh_margin if refresh_margin is None else refresh_margin)
+        self.access_token: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self.expires_at: Optional[datetime] = None
+        self._rejected: Optional[str] = None  # 被服务端拒绝（401）的令牌，即使未过期也不再使用
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    # ---- 内存缓存 ----
+
+    def _fresh(self) -> bool:
+        """令牌在提前刷新窗口之外"""
+        return bool(self.access_token and self.expires_at
+                    and datetime.now() < self.expires_at - self.refresh_margin)
+
+    def _usable(self) -> bool:
+        """令牌尚未真正过期（提前刷新失败时仍可继续使用）"""
+        return bool(self.access_token and self.expires_at and datetime.now() < self.expires_at)
+
+    def snapshot(self) -> Dict:
+        """当前令牌（首次调用时从文件加载一次）"""
+        self._ensure_loaded()
+        return {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.expires_at,
+        }
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    # ---- 文件读写（调用方持有self._lock） ----
+
+    def _load(self):
+        """从令牌文件加载"""
+        self._loaded = True
+        try:
+            with open(self.path, "r") as f:
+                tokens = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ 加载令牌文件时出错: {e}")
+            return
+
+        self.access_token = tokens.get("access_token")
+        self.refresh_token = tokens.get("refresh_token")
+        expires_at = tokens.get("expires_at")
+        self.expires_at = datetime.fromisoformat(expires_at) if expires_at else None
+
+    def _save(self):
+        atomic_write_json(self.path, {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "saved_at": time.time()
+        })
+
+    def store(self, access_token: str, refresh_token: Optional[str], expires_at: Optional[datetime]):
+        """保存新令牌（授权码换取或外部刷新后调用）"""
+        with self._lock, file_lock(self.lock_path):
+            self.access_token = access_token
+            if refresh_token:
+                self.refresh_token = refresh_token
+            self.expires_at = expires_at
+            self._loaded = True
+            self._save()
+
+    def clear(self):
+        """清除令牌（内存和文件）"""
+        with self._lock, file_lock(self.lock_path):
+            self.access_token = self.refresh_token = self.expires_at = None
+            self._loaded = True
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    # ---- 获取与刷新 ----
+
+    def get_access_token(self) -> Optional[str]:
+        """获取有效的访问令牌，进入提前刷新窗口时自动刷新"""
+        if self._fresh():
+            return self.access_token
+        return self._refresh(force=False)
+
+    def refresh(self) -> Optional[str]:
+        """强制刷新（已有其他线程/进程刚刷新过时直接复用其结果）"""
+        return self._refresh(force=True)
+
+    def invalidate(self, access_token: str = None):
+        """标记令牌失效（例如收到401），下次获取时重新加载/刷新
+        传入被拒绝的令牌时，只有它仍是当前令牌才作废，避免并发401触发多次刷新"""
+        with self._lock:
+            if access_token is None or access_token == self.access_token:
+                self._rejected = self.access_token
+                self.expires_at = None
+
+    def _refresh(self, force: bool) -> Optional[str]:
+        stale_token = self.access_token if force else None
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if self._fresh() and self.access_token not in (stale_token, self._rejected):
+                return self.access_token
+
+            with file_lock(self.lock_path):
+                # 其他进程可能已经刷新并写回了令牌文件，先重新加载一次
+                self._load()
+                if self._fresh() and self.access_token not in (stale_token, self._rejected):
+                    return self.access_token
+
+                if not self.refresh_token:
+                    print("❌ 未找到有效的访问令牌，需要重新运行认证流程")
+                    return None
+
+                print("🔄 访问令牌即将过期，正在自动刷新...")
+                try:
+                    self._request_refresh()
+                except Exception as e:
+                    print(f"❌ 刷新令牌失败: {e}")
+                    # 提前刷新失败时旧令牌仍然有效，下次请求再试
+                    usable = self._usable() and self.access_token not in (stale_token, self._rejected)
+                    return self.access_token if usable else None
+
+                self._save()
+                print("✅ 访问令牌刷新成功")
+                return self.access_token
+
+    def _request_refresh(self):
+        response = requests.post(TOKEN_URL, data={
+            "grant_type": "refresh_token",
+            "client_id": settings.tradestation_api_key,
+            "client_secret": settings.tradestation_secret,
+            "refresh_token": self.refresh_token
+        }, headers={"Content-Type": "application/x-www-form-urlencoded"}, timeout=settings.http_timeout)
+        response.raise_for_status()
+        token_data = response.json()
+
+        self.access_token = token_data["access_token"]
+        if "refresh_token" in token_data:
+            self.refresh_token = token_data["refresh_token"]
+        self.expires_at = datetime.now() + timedelta(seconds=token_data["expires_in"])
+
+
+@shared_instance
+def get_token_manager() -> TokenManager:
+    """获取进程内共享的令牌管理器"""
+    return TokenManager()
@@ -3,8 +3,10 @@ Tradestation API客户端 - 基于官方OAuth2认证
 """
 import asyncio
 import aiohttp
+import codecs
 import json
-from typing import Dict, List, Optional, Any
+import time
+from typing import AsyncIterator, Dict, List, Optional, Any
 from datetime import datetime, timedelta
 from urllib.parse import urlencode, urlparse, parse_qs
 import webbrowser
@@ -12,68 +14,82 @@ import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
 from app.core.config import settings
+from app.services import json_codec
+from app.services.dashboard import DashboardSnapshot
+from app.services.quote_service import QuoteService
+from app.services.rate_limiter import get_rate_limiter, parse_retry_after
+from app.services.resilience import CircuitOpenError, RetryPolicy, get_circuit_breaker, get_client_metrics
+from app.services.token_manager import get_token_manager
 
 
 class TradestationAPIClient:
     """Tradestation API客户端 - OAuth2认证"""
     
-    def __init__(self):
+    def __init__(self, base_url: str = None):
         self.client_id = settings.tradestation_api_key
         self.client_secret = settings.tradestation_secret
-        self.base_url = "https://api.tradestation.com/v3"
+        self.base_url = base_url or "https://api.tradestation.com/v3"
         self.auth_url = "https://signin.tradestation.com"
         self.session: Optional[aiohttp.ClientSession] = None
         self.access_token: Optional[str] = None
         self.refresh_token: Optional[str] = None
         self.token_expires_at: Optional[datetime] = None
+        self.rate_limiter = get_rate_limiter()
+        self.retry_policy = RetryPolicy.from_settings()
+        self.request_timeout = aiohttp.ClientTimeout(total=settings.http_timeout)
+        self.metrics = get_client_metrics()
+        self.token_manager = get_token_manager()
+        self._persistent = False
+        self._session_users = 0  # 嵌套的上下文管理器层数
+        self._quote_service: Optional[QuoteService] = None
+        self._quote_service_loop: Optional[asyncio.AbstractEventLoop] = None
         
         # 尝试加载已保存的令牌
         self._load_tokens()
         
     def _load_tokens(self):
-        """从文件加载令牌"""
-        try:
-            with open("tokens.json", "r") as f:
-                tokens = json.load(f)
-            
-            self.access_token = tokens.get("access_token")
-            self.refresh_token = tokens.get("refresh_token")
-            
-            expires_at_str = tokens.get("expires_at")
-            if expires_at_str:
-                self.token_expires_at = datetime.fromisoformat(expires_at_str)
-                
-        except FileNotFoundError:
-            # 令牌文件不存在，这是正常的
-            pass
-        except Exception as e:
-            print(f"⚠️ 加载令牌文件时出错: {e}")
+        """从共享令牌管理器加载令牌（内存缓存，只在首次使用时读取一次令牌文件）"""
+        tokens = self.token_manager.snapshot()
+        self.access_token = tokens["access_token"]
+        self.refresh_token = tokens["refresh_token"]
+        self.token_expires_at = tokens["expires_at"]
     
     def _save_tokens(self):
-        """保存令牌到文件"""
+        """保存令牌（原子写入令牌文件并更新共享缓存）"""
         try:
-            tokens = {
-                "access_token": self.access_token,
-                "refresh_token": self.refresh_token,
-                "expires_at": self.token_expires_at.isoformat() if self.token_expires_at else None,
-                "saved_at": datetime.now().timestamp()
-            }
-            
-            with open("tokens.json", "w") as f:
-                json.dump(tokens, f, indent=2)
-                
+            self.token_manager.store(self.access_token, self.refresh_token, self.token_expires_at)
         except Exception as e:
             print(f"⚠️ 保存令牌文件时出错: {e}")
         
-    async def __aenter__(self):
-        """异步上下文管理器入口"""
-        self.session = aiohttp.ClientSession()
+    async def open(self, persistent: bool = True):
+        """创建会话（连接池 + DNS缓存）；persistent=True时退出上下文管理器不关闭会话，需显式调用close()"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.http_pool_maxsize,
+                ttl_dns_cache=settings.http_dns_cache_ttl,
+                keepalive_timeout=settings.http_keepalive_timeout
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        self._persistent = self._persistent or persistent
         return self
-        
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """异步上下文管理器出口"""
+    
+    async def close(self):
+        """关闭会话（释放连接池）"""
         if self.session:
             await self.session.close()
+            self.session = None
+        self._persistent = False
+        
+    async def __aenter__(self):
+        """异步上下文管理器入口（已有会话时直接复用）"""
+        self._session_users += 1
+        return await self.open(persistent=False)
+        
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """异步上下文管理器出口（最外层退出且不是长连接会话时才关闭）"""
+        self._session_users -= 1
+        if self._session_users == 0 and not self._persistent:
+            await self.close()
     
     def get_authorization_url(self, redirect_uri: str = "http://localhost:8080") -> str:
         """获取授权URL"""
@@ -105,8 +121,8 @@ class TradestationAPIClient:
             "Content-Type": "application/x-www-form-urlencoded"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(token_url, data=data, headers=headers) as response:
+        async with self:
+            async with self.session.post(token_url, data=data, headers=headers) as response:
                 response.raise_for_status()
                 token_data = await response.json()
                 
@@ -117,58 +133,48 @@ class TradestationAPIClient:
                 return token_data
     
     async def refresh_access_token(self) -> Dict:
-        """刷新访问令牌"""
-        if not self.refresh_token:
+        """刷新访问令牌（由共享令牌管理器单飞执行，并发调用只会刷新一次）"""
+        if not self.refresh_token and not self.token_manager.snapshot()["refresh_token"]:
             raise Exception("没有刷新令牌")
         
-        token_url = f"{self.auth_url}/oauth/token"
-        
-        data = {
-            "grant_type": "refresh_token",
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "refresh_token": self.refresh_token
-        }
-        
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded"
+        access_token = await asyncio.get_running_loop().run_in_executor(None, self.token_manager.refresh)
+        if not access_token:
+            raise Exception("刷新令牌失败")
+        self._load_tokens()
+        return {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_in": int((self.token_expires_at - datetime.now()).total_seconds())
         }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(token_url, data=data, headers=headers) as response:
-                response.raise_for_status()
-                token_data = await response.json()
-                
-                self.access_token = token_data["access_token"]
-                if "refresh_token" in token_data:
-                    self.refresh_token = token_data["refresh_token"]
-                self.token_expires_at = datetime.now() + timedelta(seconds=token_data["expires_in"])
-                
-                # 保存刷新后的令牌到文件
-                self._save_tokens()
-                
-                return token_data
     
     def is_token_valid(self) -> bool:
-        """检查令牌是否有效"""
+        """检查令牌是否有效（过期前提前刷新窗口内视为需要刷新）"""
         if not self.access_token or not self.token_expires_at:
             return False
-        return datetime.now() < self.token_expires_at - timedelta(minutes=5)
+        return datetime.now() < self.token_expires_at - self.token_manager.refresh_margin
     
-    async def _ensure_valid_token(self):
-        """确保有有效的访问令牌"""
-        if not self.is_token_valid():
-            if self.refresh_token:
-                await self.refresh_access_token()
-            else:
-                raise Exception("需要重新授权")
+    async def ensure_valid_token(self):
+        """确保有有效的访问令牌（内存中有效时不访问磁盘，否则由令牌管理器单飞刷新）"""
+        if self.is_token_valid():
+            return
+        self._load_tokens()
+        if self.is_token_valid():
+            return
+        if not self.refresh_token:
+            raise Exception("需要重新授权")
+        access_token = await asyncio.get_running_loop().run_in_executor(
+            None, self.token_manager.get_access_token)
+        if not access_token:
+            raise Exception("需要重新授权")
+        self._load_tokens()
     
-    async def _make_request(self, method: str, endpoint: str, params: Dict = None, data: Dict = None) -> Dict:
-        """发送API请求"""
+    async def _make_request(self, method: str, endpoint: str, params: Dict = None, data: Dict = None,
+                            schema: str = None) -> Dict:
+        """发送API请求（schema见json_codec.decode，指定时返回类型化结构）"""
         if not self.session:
             raise RuntimeError("Session not initialized. Use async context manager.")
         
-        await self._ensure_valid_token()
+        await self.ensure_valid_token()
         
         url = f"{self.base_url}{endpoint}"
         headers = {
@@ -177,19 +183,198 @@ class TradestationAPIClient:
             "Accept": "application/json"
         }
         
-        try:
-            async with self.session.request(
-                method=method,
-                url=url,
-                headers=headers,
-                params=params,
-                json=data
-            ) as response:
-                response.raise_for_status()
-                return await response.json()
+        breaker = get_circuit_breaker(endpoint)
+        # 下单等非幂等请求不做重试，避免超时后重复提交
+        max_attempts = self.retry_policy.max_attempts if method == "GET" else 1
+        attempt = 0
+        rate_limited = 0
+        reauthorized = False
+        
+        while True:
+            if not breaker.allow():
+                self.metrics.incr("circuit_rejected")
+                raise CircuitOpenError(f"接口 {breaker.name} 已熔断，{breaker.retry_after():.0f}秒后重试")
+            
+            # 按接口分组限流，429时整组暂停Retry-After秒后重试
+            await self.rate_limiter.acquire(endpoint)
+            self.metrics.incr("requests")
+            try:
+                async with self.session.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    params=params,
+                    json=data,
+                    timeout=self.request_timeout
+                ) as response:
+                    if response.status == 429 and rate_limited < settings.rate_limit_max_retries:
+                        rate_limited += 1
+                        self.metrics.incr("rate_limited")
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        self.rate_limiter.pause(endpoint, retry_after)
+                        breaker.record_success()
+                        print(f"⚠️ 触发限流 {endpoint}，{retry_after:.0f}秒后重试")
+                        continue
+                    if response.status == 401 and not reauthorized:
+                        # 令牌被服务端拒绝（例如在其他进程中已被刷新作废），刷新后重试一次
+                        reauthorized = True
+                        breaker.record_success()
+                        print(f"⚠️ {endpoint} 返回401，刷新令牌后重试")
+                        response.release()
+                        await self._reauthorize(headers)
+                        continue
+                    response.raise_for_status()
+                    body = await response.read()
+                breaker.record_success()
+                return json_codec.decode(body, schema)
+            
+            except aiohttp.ClientResponseError as e:
+                if e.status < 500:
+                    # 4xx是请求本身的问题，不重试也不计入熔断
+                    breaker.record_success()
+                    raise Exception(f"API请求失败: {str(e)}")
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            
+            # 网络错误、超时、5xx：计入熔断并按退避策略重试
+            error_text = str(error) or "请求超时"
+            self.metrics.incr("failures")
+            if breaker.record_failure():
+                self.metrics.incr("circuit_opened")
+                print(f"🔌 接口 {breaker.name} 连续失败，熔断 {breaker.reset_timeout:.0f}秒")
+            
+            attempt += 1
+            if attempt >= max_attempts:
+                raise Exception(f"API请求失败: {error_text}")
+            
+            delay = self.retry_policy.delay(attempt)
+            self.metrics.incr("retries")
+            print(f"⚠️ 请求 {endpoint} 失败: {error_text}，{delay:.1f}秒后第{attempt}次重试")
+            await asyncio.sleep(delay)
+    
+    async def _reauthorize(self, headers: Dict):
+        """作废被拒绝的令牌，由令牌管理器刷新（并发401只刷新一次）后更新请求头"""
+        self.token_manager.invalidate(self.access_token)
+        self.token_expires_at = None
+        await self.ensure_valid_token()
+        headers["Authorization"] = f"Bearer {self.access_token}"
+    
+    async def _stream(self, endpoint: str, params: Dict = None,
+                      heartbeat_timeout: float = 60) -> AsyncIterator[Dict]:
+        """读取分块JSON流，逐个解析并产出JSON对象"""
+        if not self.session:
+            raise RuntimeError("Session not initialized. Use async context manager.")
+        
+        await self.ensure_valid_token()
+        
+        url = f"{self.base_url}{endpoint}"
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Accept": "application/vnd.tradestation.streams.v2+json"
+        }
+        # 服务端约每5秒发送一次心跳，超过heartbeat_timeout没有数据视为连接失效
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=heartbeat_timeout)
+        decoder = json.JSONDecoder()
+        # 增量解码，避免多字节字符被分块截断
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        
+        await self.rate_limiter.acquire(endpoint)
+        async with self.session.get(url, headers=headers, params=params, timeout=timeout) as response:
+            if response.status == 429:
+                self.rate_limiter.pause(endpoint, parse_retry_after(response.headers.get("Retry-After")))
+            response.raise_for_status()
+            async for chunk in response.content.iter_any():
+                buffer += text_decoder.decode(chunk)
                 
-        except aiohttp.ClientError as e:
-            raise Exception(f"API请求失败: {str(e)}")
+                # 分块边界不一定落在对象边界上，解析完整的对象，剩余部分留到下一块
+                position = 0
+                while True:
+                    while position < len(buffer) and buffer[position] in " \r\n\t":
+                        position += 1
+                    if position >= len(buffer):
+                        break
+                    try:
+                        message, position = decoder.raw_decode(buffer, position)
+                    except json.JSONDecodeError:
+                        break
+                    yield message
+                buffer = buffer[position:]
+    
+    async def stream_bars(self, symbol: str, interval: int = 1, unit: str = "Minute",
+                          barsback: int = 1, reconnect: bool = True,
+                          max_backoff: float = 30, heartbeat_timeout: float = 60) -> AsyncIterator[Dict]:
+        """订阅K线流，断线后自动重连并从最后一根K线续传
+        产出的每个对象都是一根K线（BarStatus为Open表示未完成，Closed表示已收盘）"""
+        last_timestamp: Optional[str] = None
+        last_seen = None
+        backoff = 1.0
+        interval_seconds = interval * {"minute": 60, "daily": 86400, "weekly": 604800}.get(unit.lower(), 60)
+        
+        while True:
+            params = {"interval": interval, "unit": unit, "barsback": barsback}
+            if last_seen is not None:
+                # 续传：请求足够多的历史K线以覆盖断线期间，重复的K线按时间戳过滤
+                params["barsback"] = min(57600, int((time.time() - last_seen) // interval_seconds) + 2)
+            
+            try:
+                async for message in self._stream(f"/marketdata/stream/barcharts/{symbol}", params,
+                                                  heartbeat_timeout=heartbeat_timeout):
+                    if "TimeStamp" in message:
+                        backoff = 1.0
+                        if last_timestamp is not None and message["TimeStamp"] < last_timestamp:
+                            continue
+                        last_timestamp = message["TimeStamp"]
+                        last_seen = datetime.fromisoformat(last_timestamp.replace("Z", "+00:00")).timestamp()
+                        yield message
+                    elif message.get("StreamStatus") == "GoAway":
+                        # 服务端要求重连
+                        break
+                    elif "Error" in message:
+                        raise Exception(f"K线流错误: {message.get('Error')} {message.get('Message', '')}")
+                    # Heartbeat / EndSnapshot 不需要处理
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not reconnect:
+                    raise
+                print(f"⚠️ {symbol} K线流中断: {e}，{backoff:.0f}秒后重连")
+                await asyncio.sleep(backoff)
+                backoff = min(max_backoff, backoff * 2)
+                continue
+            
+            if not reconnect:
+                return
+    
+    async def stream_quotes(self, symbols: List[str], reconnect: bool = True,
+                            max_backoff: float = 30, heartbeat_timeout: float = 60) -> AsyncIterator[Dict]:
+        """订阅报价流，断线后自动重连"""
+        backoff = 1.0
+        
+        while True:
+            try:
+                async for message in self._stream(f"/marketdata/stream/quotes/{','.join(symbols)}",
+                                                  heartbeat_timeout=heartbeat_timeout):
+                    if "Symbol" in message:
+                        backoff = 1.0
+                        yield message
+                    elif message.get("StreamStatus") == "GoAway":
+                        break
+                    elif "Error" in message:
+                        raise Exception(f"报价流错误: {message.get('Error')} {message.get('Message', '')}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not reconnect:
+                    raise
+                print(f"⚠️ 报价流中断: {e}，{backoff:.0f}秒后重连")
+                await asyncio.sleep(backoff)
+                backoff = min(max_backoff, backoff * 2)
+                continue
+            
+            if not reconnect:
+                return
     
     # ========== 市场数据相关 ==========
     
@@ -202,23 +387,41 @@ class TradestationAPIClient:
         return await self._make_request("GET", "/marketdata/symbols", params=params)
     
     async def get_market_data(self, symbol: str, interval: int = 1, unit: str = "minute", 
-                            barsback: int = 10, start_date: str = None) -> Dict:
-        """获取K线数据"""
+                            barsback: int = 10, start_date: str = None,
+                            first_date: str = None, last_date: str = None, typed: bool = False) -> Dict:
+        """获取K线数据（first_date/last_date为ISO8601时间，指定first_date时不再使用barsback）
+        typed为True时返回类型化的Bars结构（需要msgspec）"""
         params = {
             "interval": interval,
-            "unit": unit,
-            "barsback": barsback
+            "unit": unit
         }
         
+        if first_date:
+            params["firstdate"] = first_date
+        else:
+            params["barsback"] = barsback
+        if last_date:
+            params["lastdate"] = last_date
         if start_date:
             params["startdate"] = start_date
             
-        return await self._make_request("GET", f"/marketdata/barcharts/{symbol}", params=params)
+        return await self._make_request("GET", f"/marketdata/barcharts/{symbol}", params=params,
+                                        schema="bars" if typed else None)
     
-    async def get_quote(self, symbol: str) -> Dict:
+    async def get_quote(self, symbol: str, typed: bool = False) -> Dict:
         """获取即时价格"""
         params = {"symbols": symbol}
-        return await self._make_request("GET", "/marketdata/quotes", params=params)
+        return await self._make_request("GET", "/marketdata/quotes", params=params,
+                                        schema="quotes" if typed else None)
+    
+    async def get_quotes(self, symbols: List[str]) -> Dict[str, Any]:
+        """批量获取即时价格，返回 代码 -> 报价
+        同一时间窗口内的调用合并为每批最多N个代码的一次请求，短时间内的重复查询直接返回缓存"""
+        loop = asyncio.get_running_loop()
+        if self._quote_service is None or self._quote_service_loop is not loop:
+            self._quote_service = QuoteService(self)
+            self._quote_service_loop = loop
+        return await self._quote_service.get_quotes(symbols)
     
     # ========== 账户相关 ==========
     
@@ -234,13 +437,29 @@ class TradestationAPIClient:
         """查询资金"""
         return await self._make_request("GET", f"/brokerage/accounts/{account_id}/balances")
     
-    async def get_positions(self, account_id: str) -> Dict:
+    async def get_positions(self, account_id: str, typed: bool = False) -> Dict:
         """查询持仓"""
-        return await self._make_request("GET", f"/brokerage/accounts/{account_id}/positions")
+        return await self._make_request("GET", f"/brokerage/accounts/{account_id}/positions",
+                                        schema="positions" if typed else None)
     
-    async def get_orders(self, account_id: str) -> Dict:
+    async def get_orders(self, account_id: str, typed: bool = False) -> Dict:
         """查询委托/订单"""
-        return await self._make_request("GET", f"/brokerage/accounts/{account_id}/orders")
+        return await self._make_request("GET", f"/brokerage/accounts/{account_id}/orders",
+                                        schema="orders" if typed else None)
+    
+    async def get_dashboard_snapshot(self, account_id: str, symbols: List[str] = None) -> DashboardSnapshot:
+        """并发查询余额、持仓、订单和报价，合并为一个快照（某项失败时记录在snapshot.errors中）"""
+        async def quotes():
+            return {"Quotes": list((await self.get_quotes(symbols or [])).values())}
+        
+        responses = await asyncio.gather(
+            self.get_account_balance(account_id),
+            self.get_positions(account_id),
+            self.get_orders(account_id),
+            quotes(),
+            return_exceptions=True
+        )
+        return DashboardSnapshot.from_responses(account_id, *responses)
     
     # ========== 交易相关 ==========
     
@@ -271,23 +490,30 @@ class TradestationAPIClient:
         
         return await self._make_request("POST", "/orders", data=data)
     
-    async def close_position(self, account_id: str, symbol: str, quantity: int) -> Dict:
-        """市价平仓"""
-        # 先获取当前持仓
-        positions = await self.get_positions(account_id)
-        
-        # 找到对应品种的持仓
-        position = None
-        for pos in positions.get("Positions", []):
-            if pos["Symbol"] == symbol:
-                position = pos
-                break
+    async def close_position(self, account_id: str, symbol: str, quantity: int, position: Dict = None) -> Dict:
+        """市价平仓（传入已知的持仓，例如刚刷新的总览快照中的持仓时，不再先查询一次持仓）
+        平仓数量不能超过持仓数量，否则多出的部分会变成反向开仓"""
+        if position is None:
+            positions = await self.get_positions(account_id)
+            
+            # 找到对应品种的持仓
+            for pos in positions.get("Positions", []):
+                if pos["Symbol"] == symbol:
+                    position = pos
+                    break
         
         if not position:
             raise Exception(f"未找到 {symbol} 的持仓")
         
         # 确定平仓方向
-        side = "Sell" if position["Quantity"] > 0 else "BuyToCover"
+        if position.get("LongShort"):
+            side = "Sell" if position["LongShort"] == "Long" else "BuyToCover"
+        else:
+            side = "Sell" if float(position["Quantity"]) > 0 else "BuyToCover"
+        
+        held = abs(float(position["Quantity"]))
+        if not 0 < abs(quantity) <= held:
+            raise Exception(f"平仓数量 {abs(quantity)} 超出 {symbol} 的持仓数量 {held:g}")
         
         return await self.place_market_order(account_id, symbol, abs(quantity), side)
     
@@ -132,11 +132,16 @@ class TradingUI:
     def _load_data(self, symbol: str, interval: str, days_back: int) -> pd.DataFrame:
         """加载数据"""
         try:
-            # 计算时间范围
-            end_date = datetime.now()
+            # 计算时间范围（与库中时间戳一致，用无时区UTC）
+            end_date = datetime.utcnow()
             start_date = end_date - timedelta(days=days_back)
             
-            # 先从缓存获取
+            # 先从内存K线存储获取
+            df = self.storage.get_buffered_market_data(symbol, interval, start_date, end_date)
+            if df is not None:
+                return df
+            
+            # 再从缓存获取
             cache_key = f"{symbol}_{interval}_{days_back}"
             cached_data = self.storage.get_cached_data(cache_key)
             
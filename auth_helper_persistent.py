@@ -17,6 +17,8 @@ import os
 project_root = Path(__file__).parent
 sys.path.append(str(project_root))
 
+from app.core.config import settings
+from app.services.token_manager import get_token_manager
 from app.services.tradestation_client import TradestationAPIClient
 
 
@@ -158,59 +160,28 @@ class PersistentAuthServer:
 
 
 async def save_tokens(client: TradestationAPIClient):
-    """保存令牌到文件"""
-    tokens = {
-        "access_token": client.access_token,
-        "refresh_token": client.refresh_token,
-        "expires_at": client.token_expires_at.isoformat() if client.token_expires_at else None,
-        "saved_at": time.time()
-    }
-    
-    with open("tokens.json", "w") as f:
-        json.dump(tokens, f, indent=2)
-    
-    print("✅ 令牌已保存到 tokens.json")
+    """保存令牌到文件（通过共享令牌管理器原子写入）"""
+    get_token_manager().store(client.access_token, client.refresh_token, client.token_expires_at)
+    print(f"✅ 令牌已保存到 {settings.token_file}")
 
 
 async def load_tokens(client: TradestationAPIClient) -> bool:
-    """从文件加载令牌"""
+    """从共享令牌管理器加载令牌，即将过期时由管理器单飞刷新"""
+    manager = get_token_manager()
     try:
-        with open("tokens.json", "r") as f:
-            tokens = json.load(f)
-        
-        # 检查令牌是否过期
-        if tokens.get("expires_at"):
-            from datetime import datetime
-            expires_at = datetime.fromisoformat(tokens["expires_at"])
-            if datetime.now() >= expires_at:
-                print("⚠️ 访问令牌已过期，尝试刷新...")
-                client.access_token = tokens["access_token"]
-                client.refresh_token = tokens["refresh_token"]
-                client.token_expires_at = expires_at
-                
-                # 尝试刷新令牌
-                try:
-                    await client.refresh_access_token()
-                    await save_tokens(client)
-                    print("✅ 令牌已刷新")
-                    return True
-                except:
-                    print("❌ 刷新令牌失败，需要重新认证")
-                    return False
-        
-        client.access_token = tokens["access_token"]
-        client.refresh_token = tokens["refresh_token"]
+        tokens = manager.snapshot()
+        if not tokens["access_token"] and not tokens["refresh_token"]:
+            print("❌ 未找到令牌文件")
+            return False
         
-        if tokens["expires_at"]:
-            from datetime import datetime
-            client.token_expires_at = datetime.fromisoformat(tokens["expires_at"])
+        if not await asyncio.get_running_loop().run_in_executor(None, manager.get_access_token):
+            print("❌ 刷新令牌失败，需要重新认证")
+            return False
         
-        print("✅ 令牌已从文件加载")
+        client._load_tokens()
+        print("✅ 令牌已加载")
         return True
         
-    except FileNotFoundError:
-        print("❌ 未找到令牌文件")
-        return False
     except Exception as e:
         print(f"❌ 加载令牌失败: {str(e)}")
         return False
@@ -391,8 +362,8 @@ async def main():
         
         elif choice == "4":
             try:
-                if os.path.exists("tokens.json"):
-                    os.remove("tokens.json")
+                if os.path.exists(settings.token_file):
+                    get_token_manager().clear()
                     print("✅ 令牌文件已清除")
                 else:
                     print("❌ 未找到令牌文件")
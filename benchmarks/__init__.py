@@ -0,0 +1,4 @@
+"""
+性能基准 - 各项优化的对比测试（不被运行时代码导入）
+用法: python -m benchmarks.<模块名> [参数]
+"""
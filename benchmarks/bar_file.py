@@ -0,0 +1,68 @@
+"""
+K线文件基准 - 对比SQLite查询与K线文件内存映射读取多年1分钟K线的耗时
+用法: python -m benchmarks.bar_file [--years 5] [--repeat 5]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from app.data.bar_file import BarFile, BarFileStore
+
+
+def benchmark_bar_file(years: int = 5, repeat: int = 5):
+    """对比SQLite查询与K线文件映射读取 years 年1分钟K线（每年约252个交易日×23小时）的耗时"""
+    rows = years * 252 * 23 * 60
+    times = 1_500_000_000 + np.arange(rows, dtype=np.int64) * 60
+    close = 4500 + np.cumsum(np.random.default_rng(0).normal(0, 0.5, rows))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE min1_bars (time INTEGER NOT NULL, high REAL, low REAL, open REAL, close REAL, "
+                     "vol INTEGER, code TEXT NOT NULL, PRIMARY KEY (code, time)) WITHOUT ROWID")
+        conn.executemany("INSERT INTO min1_bars VALUES (?, ?, ?, ?, ?, ?, 'ES')",
+                         zip(times.tolist(), (close + 0.5).tolist(), (close - 0.5).tolist(),
+                             close.tolist(), close.tolist(), [1] * rows))
+        conn.commit()
+
+        store = BarFileStore(tmp_dir)
+        store.append("ES", "1m", times, close, close + 0.5, close - 0.5, close, np.ones(rows))
+        size_mb = os.path.getsize(store.path("ES", "1m")) / 1e6
+        print(f"📊 {years} 年1分钟K线 {rows:,} 根，K线文件 {size_mb:.1f}MB，每种方式 {repeat} 次")
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = conn.execute("SELECT time, open, high, low, close, vol FROM min1_bars "
+                                  "WHERE code = 'ES' ORDER BY time").fetchall()
+            np.array(result, dtype=np.float64)
+        print(f"  SQLite查询+转数组   {(time.perf_counter() - started) / repeat * 1000:10.2f} ms")
+        conn.close()
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            bars = BarFile(store.path("ES", "1m")).columns()
+            float(bars["close"][-1])
+        print(f"  K线文件映射(全部)   {(time.perf_counter() - started) / repeat * 1000:10.2f} ms")
+
+        start_time, end_time = int(times[rows // 2]), int(times[rows // 2] + 30 * 86400)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            bars = BarFile(store.path("ES", "1m")).columns(start_time, end_time)
+            float(bars["close"].mean())
+        print(f"  K线文件映射(30天)   {(time.perf_counter() - started) / repeat * 1000:10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="K线文件读取基准")
+    parser.add_argument("--years", type=int, default=5, help="1分钟K线的年数")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式的重复次数")
+    args = parser.parse_args()
+    benchmark_bar_file(args.years, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+K线表结构基准 - 对比v1（time主键+code单列索引）与v2（(code, time)聚簇主键）的写入和查询耗时
+用法: python -m benchmarks.bar_queries [--rows 1000000] [--symbols 2] [--repeat 200]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+
+def benchmark_bar_queries(rows: int = 1_000_000, symbols: int = 2, repeat: int = 200):
+    """对比v1（time主键+code单列索引）与v2（(code, time)聚簇主键）的查询耗时"""
+    layouts = {
+        'v1 time PK + idx(code)': [
+            "CREATE TABLE bars (time INTEGER PRIMARY KEY, high REAL, low REAL, open REAL, close REAL, vol INTEGER, code TEXT)",
+            "CREATE INDEX idx_bars_code ON bars(code)"
+        ],
+        'v2 (code, time) WITHOUT ROWID': [
+            "CREATE TABLE bars (time INTEGER NOT NULL, high REAL, low REAL, open REAL, close REAL, vol INTEGER, "
+            "code TEXT NOT NULL, PRIMARY KEY (code, time)) WITHOUT ROWID"
+        ]
+    }
+    queries = {
+        'latest 100': ("SELECT time, high, low, open, close, vol FROM bars WHERE code = ? ORDER BY time DESC LIMIT 100", ('SYM0',)),
+        'count': ("SELECT COUNT(*) FROM bars WHERE code = ?", ('SYM0',)),
+        'range 1 day': ("SELECT time, close FROM bars WHERE code = ? AND time BETWEEN ? AND ?", ('SYM0', 1_600_000_000 + 86400 * 10, 1_600_000_000 + 86400 * 11)),
+    }
+
+    print(f"📊 K线查询基准: {rows:,} 行, {symbols} 个合约, 每个查询 {repeat} 次")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, ddl in layouts.items():
+            db_path = os.path.join(tmp_dir, f"bench_{len(ddl)}.db")
+            conn = sqlite3.connect(db_path)
+            for statement in ddl:
+                conn.execute(statement)
+
+            # 不同合约交错写入，time加合约序号偏移以满足v1的time唯一约束
+            start = time.perf_counter()
+            conn.executemany(
+                "INSERT INTO bars VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((1_600_000_000 + (i // symbols) * 60 + (i % symbols), 100.0, 99.0, 99.5, 99.8, 10, f"SYM{i % symbols}")
+                 for i in range(rows))
+            )
+            conn.commit()
+            print(f"  [{name}] 写入 {time.perf_counter() - start:.2f}s, 文件 {os.path.getsize(db_path) / 1e6:.1f}MB")
+
+            for query_name, (sql, params) in queries.items():
+                plan = " | ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    conn.execute(sql, params).fetchall()
+                elapsed = (time.perf_counter() - start) / repeat * 1000
+                print(f"    {query_name:<12} {elapsed:8.3f} ms   {plan}")
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="K线表结构查询基准")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="总行数")
+    parser.add_argument("--symbols", type=int, default=2, help="合约数")
+    parser.add_argument("--repeat", type=int, default=200, help="每个查询的重复次数")
+    args = parser.parse_args()
+    benchmark_bar_queries(args.rows, args.symbols, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+缓存DataFrame编码基准 - 对比JSON记录（原Redis缓存格式）与二进制列格式的大小和往返耗时
+用法: python -m benchmarks.frame_codec [--rows 50000] [--repeat 10]
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.data.frame_codec import decode_frame, encode_frame
+
+
+def benchmark_frame_codec(rows: int = 50000, repeat: int = 10):
+    """对比JSON记录与二进制编码的大小和往返耗时"""
+    start = np.datetime64("2024-01-02T00:00", "s")
+    close = 4500 + np.cumsum(np.random.default_rng(0).normal(0, 0.5, rows)).round(2)
+    df = pd.DataFrame({
+        "timestamp": start + np.arange(rows) * np.timedelta64(60, "s"),
+        "open": close - 0.25, "high": close + 0.5, "low": close - 0.75, "close": close,
+        "volume": np.random.default_rng(1).integers(1, 500, rows).astype(np.float64),
+    })
+
+    codecs = {
+        "json records": (lambda frame: frame.to_json(orient="records").encode("utf-8"),
+                         lambda data: pd.read_json(io.StringIO(data.decode("utf-8")), orient="records")),
+        "binary": (lambda frame: encode_frame(frame, "none"), decode_frame),
+        "binary+zlib": (lambda frame: encode_frame(frame, "zlib"), decode_frame),
+    }
+
+    print(f"📊 {rows} 根K线，每种方式 {repeat} 次")
+    for name, (encode, decode) in codecs.items():
+        began = time.perf_counter()
+        for _ in range(repeat):
+            data = encode(df)
+        encode_ms = (time.perf_counter() - began) / repeat * 1000
+
+        began = time.perf_counter()
+        for _ in range(repeat):
+            decoded = decode(data)
+        decode_ms = (time.perf_counter() - began) / repeat * 1000
+
+        dtypes_kept = list(decoded.dtypes) == list(df.dtypes)
+        print(f"  {name:<13} {len(data) / 1e6:7.2f}MB  编码 {encode_ms:8.2f} ms  解码 {decode_ms:8.2f} ms"
+              f"  dtype保持: {'是' if dtypes_kept else '否'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存DataFrame编码基准")
+    parser.add_argument("--rows", type=int, default=50000, help="K线条数")
+    parser.add_argument("--repeat", type=int, default=10, help="每种方式的重复次数")
+    args = parser.parse_args()
+    benchmark_frame_codec(args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
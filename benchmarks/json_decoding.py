@@ -0,0 +1,79 @@
+"""
+JSON解码基准 - 对比json、orjson、msgspec（含类型化结构）解码barcharts响应的耗时和内存分配
+用法: python -m benchmarks.json_decoding [barcharts响应文件 ...] [--bars 10000] [--repeat 20]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import List
+
+from app.services import json_codec
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def benchmark_json_decoding(payload_paths: List[str] = None, bars: int = 10000, repeat: int = 20):
+    """对比各JSON解码方式的耗时和内存分配
+    payload_paths为保存下来的barcharts响应文件，不指定时生成一个bars根K线的模拟响应"""
+    payloads = {}
+    for path in payload_paths or []:
+        with open(path, "rb") as f:
+            payloads[path] = f.read()
+
+    if not payloads:
+        start = 1_700_000_000
+        payloads[f"模拟barcharts {bars}根"] = json.dumps({"Bars": [{
+            "High": f"{4500 + i % 7 * 0.25:.2f}", "Low": f"{4499 + i % 5 * 0.25:.2f}",
+            "Open": f"{4499.5 + i % 3 * 0.25:.2f}", "Close": f"{4500 + i % 4 * 0.25:.2f}",
+            "TimeStamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start + i * 60)),
+            "TotalVolume": str(100 + i % 50), "DownTicks": 10, "DownVolume": 40, "OpenInterest": "0",
+            "IsRealtime": False, "IsEndOfHistory": i == bars - 1, "TotalTicks": 25,
+            "UnchangedTicks": 0, "UnchangedVolume": 0, "UpTicks": 15, "UpVolume": 60,
+            "Epoch": (start + i * 60) * 1000, "BarStatus": "Closed"
+        } for i in range(bars)]}).encode("utf-8")
+
+    decoders = {"json": json.loads}
+    if orjson is not None:
+        decoders["orjson"] = orjson.loads
+    if msgspec is not None:
+        decoders["msgspec"] = msgspec.json.Decoder().decode
+        decoders["msgspec typed"] = lambda payload: json_codec.decode(payload, "bars")
+
+    for name, payload in payloads.items():
+        print(f"📊 {name}: {len(payload) / 1e6:.2f}MB, 每种方式 {repeat} 次")
+        for decoder_name, decoder in decoders.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                decoder(payload)
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+
+            tracemalloc.start()
+            result = decoder(payload)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print(f"  {decoder_name:<14} {elapsed:8.2f} ms   峰值分配 {peak / 1e6:6.2f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON解码基准")
+    parser.add_argument("payload_paths", nargs="*", metavar="响应文件", help="保存下来的barcharts响应，不指定时生成模拟响应")
+    parser.add_argument("--bars", type=int, default=10000, help="模拟响应的K线根数")
+    parser.add_argument("--repeat", type=int, default=20, help="每种方式的重复次数")
+    args = parser.parse_args()
+
+    print(f"当前JSON后端: {json_codec.JSON_BACKEND}")
+    benchmark_json_decoding(args.payload_paths, args.bars, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+market_data读取基准 - 对比ORM逐行读取、Core按列读取和分块流式读取
+用法: python -m benchmarks.market_data_read [--rows 1000000] [--database-url sqlite:///./benchmark_market_data.db]
+会重建测试库中的ES/1min数据，不要指向生产数据库
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete
+
+from app.data.cache import create_cache
+from app.data.storage import DataStorage, MarketData
+
+
+def benchmark_market_data_read(rows: int = 1_000_000, database_url: str = "sqlite:///./benchmark_market_data.db"):
+    """对比ORM逐行读取与Core按列读取 rows 条K线的耗时"""
+    storage = DataStorage(cache=create_cache("memory"), database_url=database_url)
+    storage.create_tables()
+    
+    timestamps = pd.date_range('2020-01-01', periods=rows, freq='min')
+    close = 4500 + np.cumsum(np.random.default_rng(0).normal(0, 0.5, rows))
+    with storage.engine.begin() as conn:
+        conn.execute(delete(MarketData.__table__).where(MarketData.symbol == 'ES'))
+    storage.save_market_data(pd.DataFrame({
+        'timestamp': timestamps, 'open': close, 'high': close + 0.5, 'low': close - 0.5,
+        'close': close, 'volume': np.ones(rows)
+    }), 'ES', '1min')
+    
+    started = time.perf_counter()
+    session = storage.SessionLocal()
+    results = session.query(MarketData).filter(MarketData.symbol == 'ES', MarketData.interval == '1min') \
+        .order_by(MarketData.timestamp).all()
+    pd.DataFrame([{'timestamp': r.timestamp, 'open': r.open, 'high': r.high, 'low': r.low,
+                   'close': r.close, 'volume': r.volume} for r in results])
+    session.close()
+    print(f"  ORM逐行读取   {time.perf_counter() - started:8.2f} s")
+    
+    started = time.perf_counter()
+    storage.get_market_data('ES', '1min')
+    print(f"  Core按列读取  {time.perf_counter() - started:8.2f} s")
+    
+    started = time.perf_counter()
+    total = sum(len(chunk) for chunk in storage.iter_market_data('ES', '1min'))
+    print(f"  分块流式读取  {time.perf_counter() - started:8.2f} s（{total} 条）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="market_data读取基准")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="K线条数")
+    parser.add_argument("--database-url", default="sqlite:///./benchmark_market_data.db", help="测试库URL")
+    args = parser.parse_args()
+    benchmark_market_data_read(args.rows, args.database_url)
+
+
+if __name__ == "__main__":
+    main()
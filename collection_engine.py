@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tradestation异步数据收集引擎
+一个asyncio事件循环驱动所有合约×时间周期的收集任务，替代"每个时间周期一个线程"的模式
+"""
+
+import asyncio
+import heapq
+import threading
+import time
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from app.core.config import settings
+from app.data.backfill import BackfillRequest, is_cme_session_open
+from app.data.bar_archive import ArchiveCompactor
+from app.data.bar_decoder import BarColumns
+from app.services.resilience import RetryPolicy, get_client_metrics
+from app.services.tradestation_client import TradestationAPIClient
+from tradestation_data_collector import TradestationDataCollector
+
+# 设置事件循环策略以避免Windows上的警告
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+
+
+def _to_ts(value: Union[int, datetime]) -> int:
+    """Unix秒或datetime（无时区按UTC）-> Unix秒"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+class BarTimerWheel:
+    """按K线边界分桶的定时轮 - 同一边界到期的订阅在一次唤醒中全部触发"""
+
+    def __init__(self):
+        self._slots: Dict[int, List[Tuple[str, str]]] = {}
+        self._heap: List[int] = []
+
+    def schedule(self, due_ms: int, symbol: str, timeframe: str):
+        """在指定边界时间登记一个订阅"""
+        slot = self._slots.get(due_ms)
+        if slot is None:
+            slot = self._slots[due_ms] = []
+            heapq.heappush(self._heap, due_ms)
+        slot.append((symbol, timeframe))
+
+    def next_due(self) -> Optional[int]:
+        """最近一个边界时间"""
+        return self._heap[0] if self._heap else None
+
+    def pop_due(self, now_ms: int) -> List[Tuple[int, str, str]]:
+        """取出所有已到期的订阅"""
+        due = []
+        while self._heap and self._heap[0] <= now_ms:
+            due_ms = heapq.heappop(self._heap)
+            for symbol, timeframe in self._slots.pop(due_ms, []):
+                due.append((due_ms, symbol, timeframe))
+        return due
+
+    def discard_symbol(self, symbol: str):
+        """移除某个合约的所有订阅"""
+        for due_ms in list(self._slots):
+            self._slots[due_ms] = [item for item in self._slots[due_ms] if item[0] != symbol]
+
+    def __len__(self):
+        return sum(len(slot) for slot in self._slots.values())
+
+
+class AsyncCollectionEngine:
+    """单事件循环收集引擎 - 50个合约也只需要一个线程"""
+
+    def __init__(self, max_concurrent_requests: int = 8, max_concurrent_downloads: int = 6,
+                 poll_delay: float = 1.0, streaming: bool = False, base_url: str = None,
+                 status_callback: Callable[[str], None] = None,
+                 error_callback: Callable[[str, str], None] = None,
+                 progress_callback: Callable[[str, int, int], None] = None):
+        self.max_concurrent_requests = max_concurrent_requests
+        # 历史下载最多占用的并发数，小于max_concurrent_requests时实时轮询总有空位
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.poll_delay = poll_delay  # 边界之后延迟多久再请求，等待K线最终确定
+        self.streaming = streaming  # True时实时K线走barcharts流，不再按边界轮询
+        self.base_url = base_url
+        self.status_callback = status_callback or print
+        self.error_callback = error_callback or (lambda symbol, msg: print(f"❌ {symbol}: {msg}"))
+        self.progress_callback = progress_callback or (lambda symbol, fetched, expected: None)
+
+        self.collectors: Dict[str, TradestationDataCollector] = {}
+        self.subscriptions: Dict[str, List[str]] = {}
+        self.wheel = BarTimerWheel()
+        self.progress: Dict[str, List[int]] = {}  # 合约 -> [已下载K线数, 预计K线数]
+        self.recovery_queue: Dict[Tuple[str, str], Set[int]] = {}  # (合约, 周期) -> 漏取K线的开盘时间
+        self.recovery_policy = RetryPolicy(settings.recovery_max_attempts, 2.0, 300.0)
+        self.metrics = get_client_metrics()
+        self._recovering: Set[Tuple[str, str]] = set()
+        self.range_queue: List[Tuple[str, str, List[BackfillRequest]]] = []  # enqueue_range登记、尚未开始的下载
+        self.compactor: Optional[ArchiveCompactor] = None
+        if settings.archive_enabled:
+            try:
+                self.compactor = ArchiveCompactor()
+            except RuntimeError as e:
+                print(f"⚠️ 历史归档不可用: {e}")
+
+        self.running = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.client: Optional[TradestationAPIClient] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._download_semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    # ========== 线程安全的控制接口 ==========
+
+    def start(self):
+        """启动引擎线程（只有这一个线程）"""
+        if self.running:
+            return
+
+        self.running = True
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        if self.compactor:
+            self.compactor.start()
+        self.status_callback("🚀 异步收集引擎已启动")
+
+    def stop(self, timeout: float = 10):
+        """停止引擎并等待事件循环退出（事件循环异常退出后也可以调用，用于清理）"""
+        if not self.running and self.thread is None:
+            return
+
+        self.running = False
+        if self._wakeup:
+            self._call_soon(self._wakeup.set)
+        if self.thread:
+            self.thread.join(timeout=timeout)
+        self.thread = None
+        if self.compactor:
+            self.compactor.stop()
+        self.status_callback("🛑 异步收集引擎已停止")
+
+    def add_symbol(self, symbol: str, db_path: str, timeframes: List[str]):
+        """添加合约订阅，引擎运行中也可以调用"""
+        if symbol in self.collectors:
+            return
+
+        collector = TradestationDataCollector(db_path=db_path, symbol=symbol)
+        # 只有需要轮询的周期进入定时轮，其余周期由1分钟K线聚合
+        self.collectors[symbol] = collector
+        self.subscriptions[symbol] = collector.plan_timeframes(timeframes)
+        if self.compactor:
+            self.compactor.add(db_path, symbol)
+
+        if self.running:
+            self._call_soon(self._register, symbol)
+
+    def remove_symbol(self, symbol: str):
+        """移除合约订阅"""
+        self.collectors.pop(symbol, None)
+        self.subscriptions.pop(symbol, None)
+        self.progress.pop(symbol, None)
+        if self.compactor:
+            self.compactor.remove(symbol)
+        for key in [key for key in self.recovery_queue if key[0] == symbol]:
+            self.recovery_queue.pop(key, None)
+        if self.running:
+            self._call_soon(self.wheel.discard_symbol, symbol)
+
+    def enqueue_range(self, symbol: str, timeframe: str, start: Union[int, datetime],
+                      end: Union[int, datetime]) -> int:
+        """下载指定时间段（开盘时间，Unix秒或datetime，无时区按UTC）的历史K线，不论数据库中是否已有。
+        与历史回补共用下载并发数、限流令牌桶和进度；引擎未运行时在启动后开始。返回请求数"""
+        collector = self.collectors.get(symbol)
+        if collector is None or timeframe not in collector.interval_seconds:
+            raise ValueError(f"未订阅 {symbol} {timeframe}")
+        requests = collector.backfill_planner.plan_range(
+            timeframe, _to_ts(start), _to_ts(end), collector.interval_seconds[timeframe])
+        if requests:
+            self.range_queue.append((symbol, timeframe, requests))
+            if self.running:
+                self._call_soon(self._start_queued_ranges)
+        return len(requests)
+
+    def _call_soon(self, callback, *args):
+        """把回调交给引擎线程执行；事件循环已经退出时忽略"""
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass
+
+    def get_symbols(self) -> List[str]:
+        """当前订阅的合约"""
+        return list(self.collectors)
+
+    def get_progress(self) -> Tuple[int, int]:
+        """所有合约的历史下载进度 (已下载K线数, 预计K线数)"""
+        progress = list(self.progress.values())
+        return sum(p[0] for p in progress), sum(p[1] for p in progress)
+
+    # ========== 事件循环内部 ==========
+
+    def _run_loop(self):
+        """引擎线程入口"""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        except Exception as e:
+            self.error_callback("engine", str(e))
+        finally:
+            # 事件循环退出后引擎视为已停止，之后可以重新start()
+            self.running = False
+            self.loop.close()
+            self.loop = None
+
+    async def _main(self):
+        """主循环：按定时轮唤醒，批量触发到期的订阅"""
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        self._download_semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+
+        async with TradestationAPIClient(base_url=self.base_url) as client:
+            self.client = client
+            for symbol in list(self.collectors):
+                self._register(symbol)
+            self._start_queued_ranges()
+
+            while self.running:
+                next_due = self.wheel.next_due()
+                timeout = None
+                if next_due is not None:
+                    timeout = max(0.0, (next_due - self._now_ms()) / 1000.0 + self.poll_delay)
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+                due = self.wheel.pop_due(self._now_ms() - int(self.poll_delay * 1000))
+                token_ok = True
+                if due:
+                    # 同一批次只检查一次令牌，避免并发请求同时刷新
+                    try:
+                        await client.ensure_valid_token()
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        token_ok = False
+                        self.error_callback("engine", f"令牌检查失败，本批次K线转入补数队列: {e}")
+                for due_ms, symbol, timeframe in due:
+                    collector = self.collectors.get(symbol)
+                    if collector is None:
+                        continue
+                    if token_ok:
+                        self._spawn(self._poll(symbol, timeframe, due_ms))
+                    else:
+                        self._queue_recovery(symbol, timeframe,
+                                             due_ms // 1000 - collector.interval_seconds[timeframe])
+                    self._schedule_next(symbol, timeframe)
+
+            for task in list(self._tasks):
+                task.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.client = None
+
+    def _register(self, symbol: str):
+        """为新合约启动历史回补并登记到定时轮"""
+        collector = self.collectors.get(symbol)
+        if collector is None:
+            return
+        live_timeframes = self.subscriptions.get(symbol, [])
+        for timeframe in live_timeframes + collector.derived_timeframes:
+            self._spawn(self._backfill(symbol, timeframe))
+        for timeframe in live_timeframes:
+            if self.streaming:
+                self._spawn(self._stream(symbol, timeframe))
+            else:
+                self._schedule_next(symbol, timeframe)
+        if self._wakeup:
+            self._wakeup.set()
+        message = f"✅ {symbol} 已加入收集引擎: {', '.join(live_timeframes)}"
+        if collector.derived_timeframes:
+            message += f"（聚合: {', '.join(collector.derived_timeframes)}）"
+        self.status_callback(message)
+
+    def _start_queued_ranges(self):
+        """开始enqueue_range登记的下载（引擎线程内调用）"""
+        while self.range_queue:
+            symbol, timeframe, requests = self.range_queue.pop(0)
+            if symbol in self.collectors:
+                self._spawn(self._backfill(symbol, timeframe, requests))
+
+    def _schedule_next(self, symbol: str, timeframe: str):
+        """登记下一个K线边界"""
+        interval_ms = self.collectors[symbol].interval_seconds[timeframe] * 1000
+        next_boundary = ((self._now_ms() // interval_ms) + 1) * interval_ms
+        self.wheel.schedule(next_boundary, symbol, timeframe)
+
+    def _spawn(self, coro):
+        """创建任务并保持引用"""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, symbol: str, timeframe: str, barsback: int = 1,
+                     range_params: Dict = None) -> BarColumns:
+        """通过异步客户端请求K线并转换格式"""
+        collector = self.collectors[symbol]
+        interval, unit = collector.tradestation_intervals[timeframe]
+        range_params = range_params or {}
+        async with self._semaphore:
+            result = await self.client.get_market_data(
+                symbol, interval=interval, unit=unit,
+                barsback=range_params.get('barsback', barsback),
+                first_date=range_params.get('firstdate'),
+                last_date=range_params.get('lastdate'),
+                typed=True
+            )
+        return collector.parse_bars(timeframe, (result or {}).get('Bars', []))
+
+    async def _save(self, symbol: str, timeframe: str, kline_data: BarColumns, backfill: bool = False):
+        """SQLite写入是阻塞操作，放到线程池执行"""
+        collector = self.collectors.get(symbol)
+        if collector is None or not kline_data:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            None, collector.save_kline_data, timeframe, kline_data, backfill)
+
+    async def _backfill(self, symbol: str, timeframe: str, requests: List[BackfillRequest] = None):
+        """增量下载历史数据 - 规划出的所有缺口（或enqueue_range给出的请求）并发请求（受下载并发数和限流令牌桶约束）"""
+        try:
+            collector = self.collectors[symbol]
+            loop = asyncio.get_running_loop()
+            if requests is None:
+                requests = await loop.run_in_executor(None, collector.plan_backfill, timeframe)
+            if not requests:
+                return
+
+            self._update_progress(symbol, 0, sum(request.expected_bars for request in requests))
+            results = await asyncio.gather(
+                *(self._download(symbol, timeframe, request) for request in requests),
+                return_exceptions=True
+            )
+
+            await loop.run_in_executor(None, collector.flush_bar_files, timeframe)
+
+            total = sum(result for result in results if isinstance(result, int))
+            errors = [result for result in results if isinstance(result, Exception)]
+            self.status_callback(f"🎉 {symbol} {timeframe} 历史数据: {len(requests)} 个请求, {total} 条")
+            if errors:
+                self.error_callback(symbol, f"{timeframe} 历史数据 {len(errors)} 个请求失败: {errors[0]}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error_callback(symbol, f"{timeframe} 历史数据下载失败: {e}")
+
+    async def _download(self, symbol: str, timeframe: str, request: BackfillRequest) -> int:
+        """下载并保存一个回补请求，完成后用实际条数修正预计条数"""
+        try:
+            async with self._download_semaphore:
+                kline_data = await self._fetch(symbol, timeframe, range_params=request.to_params())
+            await self._save(symbol, timeframe, kline_data, backfill=True)
+            # 区间内没有返回的时段（停牌、节假日、无成交）下次启动不再请求
+            collector = self.collectors.get(symbol)
+            if collector is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, collector.backfill_planner.mark_checked, request)
+        except Exception:
+            self._update_progress(symbol, 0, -request.expected_bars)
+            raise
+
+        self._update_progress(symbol, len(kline_data), len(kline_data) - request.expected_bars)
+        return len(kline_data)
+
+    def _update_progress(self, symbol: str, fetched: int, expected: int):
+        """累加下载进度并通知"""
+        if symbol not in self.collectors:
+            return
+        progress = self.progress.setdefault(symbol, [0, 0])
+        progress[0] += fetched
+        progress[1] += expected
+        self.progress_callback(symbol, progress[0], progress[1])
+
+    async def _poll(self, symbol: str, timeframe: str, due_ms: int):
+        """K线边界到达后获取最新一根K线，失败时把刚收盘的K线放入补数队列"""
+        try:
+            kline_data = await self._fetch(symbol, timeframe, 1)
+            if kline_data:
+                await self._store_live(symbol, timeframe, kline_data)
+                return
+            self.status_callback(f"⚠️ 未获取到 {symbol} {timeframe} 数据")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error_callback(symbol, f"收集 {timeframe} 数据出错: {e}")
+
+        collector = self.collectors.get(symbol)
+        if collector is not None:
+            self._queue_recovery(symbol, timeframe, due_ms // 1000 - collector.interval_seconds[timeframe])
+
+    def _queue_recovery(self, symbol: str, timeframe: str, open_ts: int):
+        """登记一根漏取的K线（开盘时间，Unix秒），每个合约×周期一个补数任务"""
+        if not is_cme_session_open(open_ts):
+            return
+        key = (symbol, timeframe)
+        pending = self.recovery_queue.setdefault(key, set())
+        if open_ts in pending:
+            return
+        pending.add(open_ts)
+        self.metrics.incr("missed_bars")
+        if key not in self._recovering:
+            self._recovering.add(key)
+            self._spawn(self._recover(symbol, timeframe))
+
+    async def _recover(self, symbol: str, timeframe: str):
+        """按退避节奏重新请求漏取的K线区间，请求成功后区间内的漏取记录全部清除"""
+        key = (symbol, timeframe)
+        attempt = 0
+        try:
+            while self.recovery_queue.get(key) and symbol in self.collectors:
+                attempt += 1
+                await asyncio.sleep(self.recovery_policy.delay(attempt))
+                pending = self.recovery_queue[key]
+                first, last = min(pending), max(pending)
+                request = BackfillRequest(timeframe, first, last, len(pending))
+
+                try:
+                    kline_data = await self._fetch(symbol, timeframe, range_params=request.to_params())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if attempt >= self.recovery_policy.max_attempts:
+                        self.metrics.incr("recovery_failures", len(pending))
+                        self.error_callback(symbol, f"{timeframe} 补数失败，放弃 {len(pending)} 根K线: {e}")
+                        pending.clear()
+                    continue
+
+                # 区间请求成功：返回的K线即为该区间的全部K线（无成交的分钟本来就没有K线）
+                recovered = set((kline_data.open_time // 1000).tolist()) & pending if kline_data else set()
+                if kline_data:
+                    await self._store_live(symbol, timeframe, kline_data)
+                pending.difference_update(range(first, last + 1))
+                self.metrics.incr("recovered_bars", len(recovered))
+                if recovered:
+                    self.status_callback(f"🩹 {symbol} {timeframe} 已补回 {len(recovered)} 根K线")
+                attempt = 0
+        finally:
+            self._recovering.discard(key)
+            if not self.recovery_queue.get(key):
+                self.recovery_queue.pop(key, None)
+
+    async def _stream(self, symbol: str, timeframe: str):
+        """流式订阅：每根收盘的K线写入数据库（断线重连和续传由客户端处理）"""
+        collector = self.collectors[symbol]
+        interval, unit = collector.tradestation_intervals[timeframe]
+        try:
+            async for bar in self.client.stream_bars(symbol, interval=interval, unit=unit):
+                if symbol not in self.collectors:
+                    return
+                if bar.get('BarStatus') != 'Closed':
+                    continue
+                await self._store_live(symbol, timeframe, collector.parse_bars(timeframe, [bar]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error_callback(symbol, f"{timeframe} K线流失败: {e}")
+
+    async def _store_live(self, symbol: str, timeframe: str, kline_data: BarColumns):
+        """保存实时K线，1分钟K线同时更新聚合周期"""
+        await self._save(symbol, timeframe, kline_data)
+        if timeframe == '1m':
+            collector = self.collectors.get(symbol)
+            if collector is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, collector.save_derived_kline_data, kline_data)
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+
+def main():
+    """测试函数"""
+    engine = AsyncCollectionEngine()
+    engine.add_symbol("ES", "es_futures_data.db", ['1m', '5m'])
+    engine.add_symbol("NQZ25", "nqz25_futures_data.db", ['1m', '5m'])
+
+    try:
+        engine.start()
+        time.sleep(120)
+    finally:
+        engine.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,61 +10,19 @@ import sys
 import os
 import json
 import threading
-import time
 from datetime import datetime
 from PyQt5 import QtWidgets, QtCore, QtGui
-from PyQt5.QtCore import QThread, pyqtSignal, QTimer
+from PyQt5.QtCore import pyqtSignal, QTimer
 from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QPushButton, QTextEdit, QListWidget, QListWidgetItem, QMessageBox, QGroupBox, QGridLayout, QProgressBar, QSpinBox, QCheckBox
-from tradestation_data_collector import TradestationDataCollector
+from app.core.config import settings
+from collection_engine import AsyncCollectionEngine
 
 
-class DataDownloadWorker(QThread):
-    """数据下载工作线程"""
+class EngineSignals(QtCore.QObject):
+    """收集引擎信号桥 - 引擎线程通过信号把状态投递到UI线程"""
     status_update = pyqtSignal(str)  # 状态更新信号
-    progress_update = pyqtSignal(str, int)  # 进度更新信号 (symbol, progress)
     error_occurred = pyqtSignal(str, str)  # 错误信号 (symbol, error_msg)
-    
-    def __init__(self, symbol, db_path):
-        super().__init__()
-        self.symbol = symbol
-        self.db_path = db_path
-        self.collector = None
-        self.is_running = False
-        
-    def run(self):
-        """运行数据收集"""
-        try:
-            self.status_update.emit(f"开始收集 {self.symbol} 数据...")
-            
-            # 创建Tradestation数据收集器
-            self.collector = TradestationDataCollector(
-                db_path=self.db_path,
-                symbol=self.symbol
-            )
-            
-            self.is_running = True
-            self.status_update.emit(f"{self.symbol} 数据收集已启动")
-            
-            # 开始收集数据 - 收集多个时间周期
-            self.collector.start_collection(['1m', '5m', '15m', '30m', '1h'])
-            
-            # 持续运行
-            while self.is_running:
-                self.progress_update.emit(self.symbol, 100)  # 表示正在运行
-                time.sleep(1)
-                
-        except Exception as e:
-            self.error_occurred.emit(self.symbol, str(e))
-        finally:
-            if self.collector:
-                self.collector.stop_collection()
-            self.status_update.emit(f"{self.symbol} 数据收集已停止")
-    
-    def stop(self):
-        """停止数据收集"""
-        self.is_running = False
-        if self.collector:
-            self.collector.stop_collection()
+    progress_update = pyqtSignal(str, int, int)  # 进度信号 (symbol, 已下载K线数, 预计K线数)
 
 
 class DataDownloadManager(QMainWindow):
@@ -72,8 +30,23 @@ class DataDownloadManager(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.download_workers = {}  # 存储下载工作线程
-        self.max_concurrent_downloads = 10  # 最大并发下载数
+        self.active_symbols = set()  # 正在收集的合约
+        self.collection_timeframes = ['1m', '5m', '15m', '30m', '1h']
+        
+        # 所有合约共用一个异步收集引擎（单线程事件循环）
+        self.engine_signals = EngineSignals()
+        self.engine_signals.status_update.connect(self.log_message)
+        self.engine_signals.error_occurred.connect(self.handle_error)
+        self.engine_signals.progress_update.connect(self.update_progress)
+        self.collection_engine = AsyncCollectionEngine(
+            max_concurrent_downloads=settings.collector_max_concurrent_downloads,
+            streaming=settings.collector_streaming,
+            status_callback=self.engine_signals.status_update.emit,
+            error_callback=self.engine_signals.error_occurred.emit,
+            progress_callback=self.engine_signals.progress_update.emit
+        )
+        self.max_concurrent_downloads = settings.collector_max_concurrent_downloads  # 历史数据最大并发请求数
+        self.download_progress = {}  # 合约 -> (已下载K线数, 预计K线数)
         self.main_symbol = None  # 主界面选择的合约
         self.config_file = "download_config.json"
         
@@ -166,7 +139,7 @@ class DataDownloadManager(QMainWindow):
         download_control_layout.addWidget(QLabel("最大并发数:"))
         self.max_concurrent_spin = QSpinBox()
         self.max_concurrent_spin.setRange(1, 10)
-        self.max_concurrent_spin.setValue(10)
+        self.max_concurrent_spin.setValue(self.max_concurrent_downloads)
         self.max_concurrent_spin.valueChanged.connect(self.update_max_concurrent)
         download_control_layout.addWidget(self.max_concurrent_spin)
         
@@ -307,7 +280,7 @@ class DataDownloadManager(QMainWindow):
             return
         
         # 检查是否正在下载
-        if symbol in self.download_workers:
+        if symbol in self.active_symbols:
             QMessageBox.warning(self, "警告", f"合约 {symbol} 正在下载中，请先停止下载")
             return
         
@@ -331,29 +304,23 @@ class DataDownloadManager(QMainWindow):
             QMessageBox.warning(self, "警告", "请先添加要下载的合约")
             return
         
-        # 检查并发数限制
-        if len(symbols) > self.max_concurrent_downloads:
-            QMessageBox.warning(self, "警告", f"合约数量超过最大并发数限制 ({self.max_concurrent_downloads})")
-            return
+        # 合约数量不限：所有下载请求排队，由并发数和限流令牌桶控制节奏
+        if not self.collection_engine.running:
+            self.collection_engine.max_concurrent_downloads = self.max_concurrent_downloads
+            self.collection_engine.max_concurrent_requests = max(
+                self.collection_engine.max_concurrent_requests, self.max_concurrent_downloads + 2)
         
-        # 启动下载
+        # 启动下载 - 所有合约注册到同一个收集引擎
         started_count = 0
         for symbol in symbols:
-            if symbol not in self.download_workers:
+            if symbol not in self.active_symbols:
                 db_path = f"{symbol.lower()}_futures_data.db"
-                worker = DataDownloadWorker(symbol, db_path)
-                
-                # 连接信号
-                worker.status_update.connect(self.log_message)
-                worker.progress_update.connect(self.update_progress)
-                worker.error_occurred.connect(self.handle_error)
-                
-                # 启动工作线程
-                worker.start()
-                self.download_workers[symbol] = worker
+                self.collection_engine.add_symbol(symbol, db_path, self.collection_timeframes)
+                self.active_symbols.add(symbol)
                 started_count += 1
         
         if started_count > 0:
+            self.collection_engine.start()
             self.log_message(f"已启动 {started_count} 个合约的数据下载")
             self.start_download_btn.setEnabled(False)
             self.stop_download_btn.setEnabled(True)
@@ -363,26 +330,31 @@ class DataDownloadManager(QMainWindow):
     
     def stop_download(self):
         """停止数据下载"""
-        if not self.download_workers:
+        if not self.active_symbols:
             QMessageBox.information(self, "提示", "没有正在下载的合约")
             return
         
-        # 停止所有下载
-        for symbol, worker in self.download_workers.items():
-            worker.stop()
-            worker.wait()  # 等待线程结束
+        # 停止收集引擎
+        self.collection_engine.stop()
+        for symbol in self.active_symbols:
+            self.collection_engine.remove_symbol(symbol)
         
-        self.download_workers.clear()
+        self.active_symbols.clear()
+        self.download_progress.clear()
         self.log_message("已停止所有数据下载")
         
         self.start_download_btn.setEnabled(True)
         self.stop_download_btn.setEnabled(False)
         self.progress_bar.setVisible(False)
     
-    def update_progress(self, symbol, progress):
-        """更新进度"""
-        # 这里可以根据需要实现进度显示
-        pass
+    def update_progress(self, symbol, fetched, expected):
+        """更新历史数据下载进度"""
+        if symbol not in self.active_symbols:
+            return
+        previous = self.download_progress.get(symbol)
+        self.download_progress[symbol] = (fetched, expected)
+        if expected and fetched >= expected and (not previous or previous[0] < previous[1]):
+            self.log_message(f"✅ {symbol} 历史数据下载完成: {fetched} 条")
     
     def handle_error(self, symbol, error_msg):
         """处理错误"""
@@ -390,10 +362,17 @@ class DataDownloadManager(QMainWindow):
     
     def update_status(self):
         """更新状态显示"""
-        if self.download_workers:
-            active_count = sum(1 for worker in self.download_workers.values() if worker.is_running)
-            self.progress_bar.setValue(active_count * 10)  # 简单的进度显示
-            self.progress_bar.setFormat(f"正在下载: {active_count}/{len(self.download_workers)} 个合约")
+        if self.active_symbols:
+            fetched = sum(progress[0] for progress in self.download_progress.values())
+            expected = sum(progress[1] for progress in self.download_progress.values())
+            active_count = len(self.collection_engine.get_symbols()) if self.collection_engine.running else 0
+            
+            if expected and fetched < expected:
+                self.progress_bar.setValue(int(fetched * 100 / expected))
+                self.progress_bar.setFormat(f"历史数据: {fetched}/{expected} 条 (%p%) - {active_count} 个合约")
+            else:
+                self.progress_bar.setValue(100)
+                self.progress_bar.setFormat(f"实时收集中: {active_count}/{len(self.active_symbols)} 个合约")
     
     def log_message(self, message):
         """记录日志消息"""
@@ -448,7 +427,7 @@ class DataDownloadManager(QMainWindow):
                     self.add_symbol_to_list(symbol)
                 
                 # 加载最大并发数
-                max_concurrent = config.get("max_concurrent", 10)
+                max_concurrent = config.get("max_concurrent", settings.collector_max_concurrent_downloads)
                 self.max_concurrent_spin.setValue(max_concurrent)
                 
                 # 加载主合约
@@ -470,7 +449,7 @@ class DataDownloadManager(QMainWindow):
     
     def closeEvent(self, event):
         """关闭事件处理"""
-        if self.download_workers:
+        if self.active_symbols:
             reply = QMessageBox.question(self, "确认关闭", 
                                        "有合约正在下载中，确定要关闭吗？\n关闭将停止所有下载。",
                                        QMessageBox.Yes | QMessageBox.No)
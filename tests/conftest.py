@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# 测试直接导入项目模块（app.*、collection_engine等）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def _clean_bar_store():
+    """DataStorage写入时会追加到进程内共享的K线存储，每个测试后清空"""
+    yield
+    from app.data.bar_store import get_bar_store
+    get_bar_store().clear()
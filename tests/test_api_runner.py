@@ -0,0 +1,30 @@
+import pytest
+
+from app.services import api_runner
+from app.services.api_runner import APIRunner
+
+
+def test_start_raises_when_the_client_fails_to_open(monkeypatch):
+    attempts = []
+
+    class FailingClient:
+        def __init__(self, base_url=None):
+            self.session = None
+
+        async def open(self):
+            attempts.append(True)
+            raise OSError("no network")
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(api_runner, "TradestationAPIClient", FailingClient)
+    runner = APIRunner()
+
+    with pytest.raises(OSError, match="no network"):
+        runner.start()
+    assert runner.loop is None and runner.client is None
+    # 下次调用重新尝试启动，而不是挂起或沿用失败的线程
+    with pytest.raises(OSError):
+        runner.run(lambda client: client.open(), timeout=1)
+    assert len(attempts) == 2
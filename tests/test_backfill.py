@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from app.data.backfill import (CME_TZ, BackfillPlanner, BackfillRequest, is_cme_session_open,
+                               session_seconds_between, subtract_checked)
+from app.data.bar_schema import ensure_bar_schema
+from app.data.sqlite_profile import connect
+
+
+def ct(*args) -> int:
+    """芝加哥时间 -> Unix秒"""
+    return int(datetime(*args, tzinfo=CME_TZ).timestamp())
+
+
+def test_session_seconds_skip_daily_break_and_weekend():
+    # 周三 15:00 -> 18:00：16:00-17:00 休市
+    assert session_seconds_between(ct(2024, 1, 10, 15), ct(2024, 1, 10, 18)) == 2 * 3600
+    # 周五 16:00 收盘到周日 17:00 开盘之间没有交易时段
+    assert session_seconds_between(ct(2024, 1, 12, 16), ct(2024, 1, 14, 17)) == 0
+    assert not is_cme_session_open(ct(2024, 1, 13, 12))
+    assert is_cme_session_open(ct(2024, 1, 14, 17, 30))
+
+
+def test_subtract_checked_splits_partially_covered_gap():
+    gap = (ct(2024, 1, 10, 9), ct(2024, 1, 10, 11))
+    checked = [(ct(2024, 1, 10, 9, 30), ct(2024, 1, 10, 10))]
+    assert subtract_checked([gap], checked, 60) == [
+        (ct(2024, 1, 10, 9), ct(2024, 1, 10, 9, 30)),
+        (ct(2024, 1, 10, 10), ct(2024, 1, 10, 11)),
+    ]
+    assert subtract_checked([gap], [(gap[0] - 60, gap[1] + 60)], 60) == []
+    assert subtract_checked([gap], [], 60) == [gap]
+
+
+def _planner_with_hole(tmp_path, hole_start, hole_end, now_ts):
+    db_path = str(tmp_path / "bars.db")
+    ensure_bar_schema(db_path)
+    planner = BackfillPlanner(db_path, "ES", lookback_bars=60)
+    window_start = planner._lookback_start(now_ts, 60)
+
+    opens = [t for t in range(window_start - window_start % 60, now_ts, 60)
+             if is_cme_session_open(t) and not hole_start <= t < hole_end]
+    conn = connect(db_path)
+    conn.executemany("INSERT INTO min1_bars VALUES (?, 1, 1, 1, 1, 1, 'ES')", [(t + 59,) for t in opens])
+    conn.commit()
+    conn.close()
+    return planner
+
+
+def test_plan_requests_only_the_missing_range(tmp_path):
+    now_ts = ct(2024, 1, 10, 15)
+    hole_start, hole_end = ct(2024, 1, 10, 10), ct(2024, 1, 10, 10, 30)
+    planner = _planner_with_hole(tmp_path, hole_start, hole_end, now_ts)
+
+    requests = planner.plan("1m", "min1_bars", 60, now_ts)
+    assert len(requests) == 1
+    assert requests[0].first_ts == hole_start - 60
+    assert requests[0].last_ts == hole_end
+    # 两端已有的K线也包含在请求里
+    assert requests[0].expected_bars == 32
+
+
+def test_checked_ranges_are_not_requested_again(tmp_path):
+    now_ts = ct(2024, 1, 10, 15)
+    planner = _planner_with_hole(tmp_path, ct(2024, 1, 10, 10), ct(2024, 1, 10, 10, 30), now_ts)
+
+    # 接口对这个区间没有返回K线（例如停牌）
+    for request in planner.plan("1m", "min1_bars", 60, now_ts):
+        planner.mark_checked(request, now_ts)
+    assert planner.plan("1m", "min1_bars", 60, now_ts) == []
+
+
+def test_recent_ranges_are_not_marked_checked(tmp_path):
+    now_ts = ct(2024, 1, 10, 15)
+    planner = _planner_with_hole(tmp_path, ct(2024, 1, 10, 14, 40), ct(2024, 1, 10, 14, 50), now_ts)
+
+    requests = planner.plan("1m", "min1_bars", 60, now_ts)
+    assert len(requests) == 1
+    planner.mark_checked(requests[0], now_ts)
+    assert planner.plan("1m", "min1_bars", 60, now_ts) == requests
+
+
+def test_mark_checked_merges_overlapping_ranges(tmp_path):
+    db_path = str(tmp_path / "bars.db")
+    ensure_bar_schema(db_path)
+    planner = BackfillPlanner(db_path, "ES")
+    now_ts = ct(2024, 2, 1)
+
+    planner.mark_checked(BackfillRequest("1m", 1000, 2000, 1), now_ts)
+    planner.mark_checked(BackfillRequest("1m", 1500, 3000, 1), now_ts)
+    planner.mark_checked(BackfillRequest("1m", 5000, 6000, 1), now_ts)
+    planner.mark_checked(BackfillRequest("1m", None, None, 1000), now_ts)
+    assert planner._load_checked("1m", 0) == [(1000, 3000), (5000, 6000)]
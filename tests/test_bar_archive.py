@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.data.bar_archive import (ArchiveCompactor, BarArchive, archive_cutoff, archive_for, compact_market_data,
+                                  get_bar_archive)
+from app.data.bar_schema import ensure_bar_schema
+from app.data.sqlite_profile import connect
+
+
+def utc(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def _bars(times, close=1.0) -> pd.DataFrame:
+    return pd.DataFrame({"time": times, "open": 1.0, "high": 2.0, "low": 0.5, "close": close, "volume": 10.0})
+
+
+def _sqlite_with_bars(tmp_path, times) -> str:
+    db_path = str(tmp_path / "es.db")
+    ensure_bar_schema(db_path)
+    conn = connect(db_path)
+    conn.executemany("INSERT INTO min1_bars VALUES (?, 2, 0.5, 1, ?, 10, 'ES')", [(t, t % 7) for t in times])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_archive_cutoff_keeps_recent_months():
+    assert archive_cutoff(2, datetime(2024, 3, 15, tzinfo=timezone.utc)) == utc(2024, 1, 1)
+    assert archive_cutoff(0, datetime(2024, 1, 15, tzinfo=timezone.utc)) == utc(2024, 1, 1)
+
+
+def test_write_month_merges_and_read_filters_by_range(tmp_path):
+    archive = BarArchive(str(tmp_path / "archive"))
+    archive.write_month("ES", "1m", "2024-01", _bars([utc(2024, 1, 2), utc(2024, 1, 3)]))
+    archive.write_month("ES", "1m", "2024-01", _bars([utc(2024, 1, 3)], close=5.0))
+    archive.write_month("ES", "1m", "2024-02", _bars([utc(2024, 2, 1)]))
+
+    assert archive.months("ES", "1m") == ["2024-01", "2024-02"]
+    frame = archive.read("ES", "1m", utc(2024, 1, 3), utc(2024, 2, 1))
+    assert frame["time"].tolist() == [utc(2024, 1, 3), utc(2024, 2, 1)]
+    assert frame["close"].tolist() == [5.0, 1.0]
+
+
+def test_read_merges_sqlite_and_projects_columns_after_merge(tmp_path):
+    archive = BarArchive(str(tmp_path / "archive"))
+    archive.write_month("ES", "1m", "2024-01", _bars([utc(2024, 1, 2), utc(2024, 1, 3)]))
+    db_path = _sqlite_with_bars(tmp_path, [utc(2024, 1, 3), utc(2024, 3, 1)])
+
+    # 不要求time列时，仍按time去重合并（同一时间以SQLite为准）
+    frame = archive.read("ES", "1m", columns=["close"], db_path=db_path)
+    assert list(frame.columns) == ["close"]
+    assert frame["close"].tolist() == [1.0, utc(2024, 1, 3) % 7, utc(2024, 3, 1) % 7]
+
+    # 数据库尚不存在时只返回归档数据
+    assert len(archive.read("ES", "1m", db_path=str(tmp_path / "missing.db"))) == 2
+
+
+def test_compact_sqlite_moves_closed_months(tmp_path):
+    archive = BarArchive(str(tmp_path / "archive"))
+    times = [utc(2024, 1, 2), utc(2024, 1, 31, 23, 59), utc(2024, 2, 5), utc(2024, 4, 1)]
+    db_path = _sqlite_with_bars(tmp_path, times)
+
+    archived = archive.compact_sqlite(db_path, "ES", ["1m"], keep_months=1,
+                                      now=datetime(2024, 4, 10, tzinfo=timezone.utc))
+    assert archived == {"1m": 3}
+    assert archive.months("ES", "1m") == ["2024-01", "2024-02"]
+
+    conn = connect(db_path)
+    assert conn.execute("SELECT time FROM min1_bars").fetchall() == [(utc(2024, 4, 1),)]
+    conn.close()
+    assert archive.read("ES", "1m", db_path=db_path)["time"].tolist() == times
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "archive_dir", str(tmp_path / "archive"))
+    monkeypatch.setattr("app.data.bar_archive._archives", {})
+    return tmp_path / "archive"
+
+
+def test_bar_store_fills_first_load_from_archive(tmp_path, archive_dir):
+    from app.data.bar_store import BarStore
+
+    db_path = _sqlite_with_bars(tmp_path, [utc(2024, 3, 1), utc(2024, 3, 2)])
+    get_bar_archive(db_path).write_month("ES", "1m", "2024-01", _bars([utc(2024, 1, 2), utc(2024, 1, 3)]))
+
+    store = BarStore()
+    bars = store.latest("ES", "1m", 3, db_path, "min1_bars")
+    assert bars["time"].tolist() == [utc(2024, 1, 3), utc(2024, 3, 1), utc(2024, 3, 2)]
+
+
+def test_each_database_has_its_own_archive(tmp_path, archive_dir):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    now = datetime.now(timezone.utc)
+    times = [utc(2024, 1, 2), utc(now.year, now.month, 1)]
+    db_a, db_b = _sqlite_with_bars(tmp_path / "a", times), _sqlite_with_bars(tmp_path / "b", times[1:])
+
+    compactor = ArchiveCompactor()
+    compactor.add(db_a, "ES", ["1m"])
+    compactor.add(db_b, "ES", ["1m"])
+    assert compactor.run_once() == 1
+
+    assert get_bar_archive(db_a).months("ES", "1m") == ["2024-01"]
+    assert archive_for("ES", "1m", db_b) is None
+    assert get_bar_archive(db_a) is get_bar_archive(str(tmp_path / "a" / ".." / "a" / "es.db"))
+
+
+def test_market_data_reads_include_archived_months(tmp_path, archive_dir):
+    from app.data.cache import MemoryCache
+    from app.data.storage import DataStorage
+
+    storage = DataStorage(cache=MemoryCache(), database_url=f"sqlite:///{tmp_path / 'market.db'}")
+    storage.create_tables()
+    storage.save_market_data(pd.DataFrame({"timestamp": [datetime(2024, 1, 2), datetime(2024, 3, 1)],
+                                           "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0}),
+                             "ES", "1min")
+    archived = compact_market_data(storage, keep_months=1, now=datetime(2024, 3, 10))
+    assert archived == {("ES", "1min"): 1}
+
+    df = storage.get_market_data("ES", "1min")
+    assert df["timestamp"].tolist() == [pd.Timestamp(2024, 1, 2), pd.Timestamp(2024, 3, 1)]
+    assert len(storage.get_market_data("ES", "1min", start_date=datetime(2024, 2, 1))) == 1
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.data.bar_file import BarFile, BarFileStore, get_bar_file_store
+from app.data.bar_schema import ensure_bar_schema
+from app.data.sqlite_profile import connect
+
+
+def _append(target: BarFile, times, close=None):
+    times = np.asarray(times, dtype=np.int64)
+    close = np.asarray(times if close is None else close, dtype=np.float64)
+    ones = np.ones(len(times))
+    return target.append(times, ones, ones, ones, close, ones)
+
+
+@pytest.fixture
+def bar_file(tmp_path):
+    return BarFile(str(tmp_path / "ES" / "1m.bars"))
+
+
+def test_append_and_range_views(bar_file):
+    _append(bar_file, [180, 60, 120])
+    _append(bar_file, [240, 300])
+
+    assert len(bar_file) == 5
+    assert bar_file.columns(100, 250)["time"].tolist() == [120, 180, 240]
+    assert bar_file.last_time == 300
+    # 另一个实例（其他进程）读到同样的数据
+    assert BarFile(bar_file.path).to_frame()["close"].tolist() == [60, 120, 180, 240, 300]
+
+
+def test_known_bars_are_skipped_and_older_bars_wait_for_flush(bar_file):
+    _append(bar_file, [120, 180, 240])
+    inode = os.stat(bar_file.path).st_ino
+
+    # 重复获取的K线与文件一致，不产生写入
+    assert _append(bar_file, [180, 240]) == 0
+    # 回补的更早K线和修正的K线先进入待合并队列，新K线照常追加
+    assert _append(bar_file, [60, 180, 300], close=[6.0, 18.0, 30.0]) == 3
+    assert bar_file.pending == 2
+    assert bar_file.records()["time"].tolist() == [120, 180, 240, 300]
+    assert os.stat(bar_file.path).st_ino == inode
+
+    assert bar_file.flush() == 2
+    assert bar_file.pending == 0
+    assert bar_file.to_frame()["close"].tolist() == [6.0, 120.0, 18.0, 240.0, 30.0]
+
+
+def test_store_writes_only_closed_bars(tmp_path):
+    store = BarFileStore(str(tmp_path))
+    times = np.array([59, 119, 179], dtype=np.int64)
+    ones = np.ones(3)
+    store.append("ES", "1m", times, ones, ones, ones, ones, ones, now=150)
+
+    assert store.range("ES", "1m")["time"].tolist() == [59, 119]
+
+
+def test_ensure_built_creates_missing_files_from_sqlite(tmp_path):
+    db_path = str(tmp_path / "es.db")
+    ensure_bar_schema(db_path)
+    conn = connect(db_path)
+    conn.executemany("INSERT INTO min1_bars VALUES (?, 2, 0, 1, 1, 5, 'ES')", [(t,) for t in (59, 119, 179)])
+    conn.commit()
+    conn.close()
+
+    store = BarFileStore(str(tmp_path / "bars"))
+    assert store.ensure_built(db_path, "ES", ["1m"]) == {"1m": 3}
+    assert store.ensure_built(db_path, "ES", ["1m"]) == {}
+    assert store.range("ES", "1m")["high"].tolist() == [2.0, 2.0, 2.0]
+
+
+def test_each_database_builds_its_own_files(tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "bar_file_dir", str(tmp_path / "bars"))
+    monkeypatch.setattr("app.data.bar_file._stores", {})
+    for name, times in (("a", (59, 119)), ("b", (59,))):
+        (tmp_path / name).mkdir()
+        db_path = str(tmp_path / name / "es.db")
+        ensure_bar_schema(db_path)
+        conn = connect(db_path)
+        conn.executemany("INSERT INTO min1_bars VALUES (?, 2, 0, 1, 1, 5, 'ES')", [(t,) for t in times])
+        conn.commit()
+        conn.close()
+
+    db_a, db_b = str(tmp_path / "a" / "es.db"), str(tmp_path / "b" / "es.db")
+    assert get_bar_file_store(db_a).ensure_built(db_a, "ES", ["1m"]) == {"1m": 2}
+    # 另一个数据库的同一合约不沿用a的文件
+    assert get_bar_file_store(db_b).ensure_built(db_b, "ES", ["1m"]) == {"1m": 1}
+    assert get_bar_file_store(db_a).range("ES", "1m")["time"].tolist() == [59, 119]
@@ -0,0 +1,75 @@
+import numpy as np
+
+from app.data.bar_schema import ensure_bar_schema
+from app.data.bar_store import BarStore, RingBarBuffer
+from app.data.sqlite_profile import connect
+
+
+def _append(buffer: RingBarBuffer, times, close=None):
+    times = np.asarray(times, dtype=np.int64)
+    close = np.asarray(close if close is not None else times, dtype=np.float64)
+    ones = np.ones(len(times))
+    return buffer.append(times, ones, ones, ones, close, ones)
+
+
+def test_ring_buffer_wraps_and_returns_contiguous_views():
+    buffer = RingBarBuffer(capacity=4)
+    _append(buffer, [60, 120, 180, 240, 300, 360])
+
+    latest = buffer.latest(4)
+    assert latest['time'].tolist() == [180, 240, 300, 360]
+    assert not latest['time'].flags.writeable
+    assert buffer.range(200, 300)['time'].tolist() == [240, 300]
+    assert (buffer.first_time, buffer.last_time) == (180, 360)
+
+
+def test_ring_buffer_overwrites_same_time_and_merges_older_bars():
+    buffer = RingBarBuffer(capacity=4)
+    _append(buffer, [120, 180, 240])
+
+    # 未完成K线的更新覆盖同一时间，不增加条数
+    _append(buffer, [240], close=[9.0])
+    assert len(buffer) == 3
+    assert buffer.latest(1)['close'].tolist() == [9.0]
+
+    # 更早的K线（历史回补）按时间合并，超出容量的最旧K线被丢弃
+    _append(buffer, [0, 60])
+    assert buffer.latest(4)['time'].tolist() == [60, 120, 180, 240]
+    assert buffer.latest(1)['close'].tolist() == [9.0]
+
+
+def test_bar_store_syncs_incrementally_from_sqlite(tmp_path):
+    db_path = str(tmp_path / "bars.db")
+    ensure_bar_schema(db_path)
+    conn = connect(db_path)
+    conn.executemany("INSERT INTO min1_bars VALUES (?, 2, 0, 1, ?, 5, 'ES')",
+                     [(t, t / 60) for t in range(60, 601, 60)])
+    conn.commit()
+
+    store = BarStore(capacity=100)
+    bars = store.latest('ES', '1m', 5, db_path, 'min1_bars')
+    assert bars['time'].tolist() == [360, 420, 480, 540, 600]
+    assert bars['open'].tolist() == [1.0] * 5
+
+    conn.execute("INSERT INTO min1_bars VALUES (660, 2, 0, 1, 11, 5, 'ES')")
+    conn.commit()
+    conn.close()
+    assert store.latest('ES', '1m', 2, db_path, 'min1_bars')['time'].tolist() == [600, 660]
+    # 缓冲区不覆盖的时间范围交给调用方回退到数据库
+    assert store.range('ES', '1m', 0, 600) is None
+
+
+def test_bar_store_keeps_each_database_in_its_own_buffer(tmp_path):
+    store = BarStore(capacity=100)
+    for name, close in (("a.db", 1), ("b.db", 2)):
+        db_path = str(tmp_path / name)
+        ensure_bar_schema(db_path)
+        conn = connect(db_path)
+        conn.executemany("INSERT INTO min1_bars VALUES (?, 2, 0, 1, ?, 5, 'ES')",
+                         [(t, close) for t in (60, 120)])
+        conn.commit()
+        conn.close()
+
+    assert store.latest('ES', '1m', 5, str(tmp_path / "a.db"), 'min1_bars')['close'].tolist() == [1, 1]
+    assert store.latest('ES', '1m', 5, str(tmp_path / "b.db"), 'min1_bars')['close'].tolist() == [2, 2]
+    assert store.latest('ES', '1m', 5, str(tmp_path / "a.db"), 'min1_bars')['close'].tolist() == [1, 1]
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from app.data.cache import CacheBackend, MemoryCache
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_size=2, default_ttl=60)
+    cache.set("kline:ES:1m", pd.DataFrame({"close": [1.0]}))
+    cache.set("kline:NQ:1m", [1, 2])
+    cache.get("kline:ES:1m")
+    cache.set("quote:ES", {"Last": "1"})
+
+    assert cache.get("kline:NQ:1m") is None
+    # 进程内后端直接返回原对象，不做序列化
+    assert isinstance(cache.get("kline:ES:1m"), pd.DataFrame)
+    assert sorted(cache.keys("kline:*")) == ["kline:ES:1m"]
+
+
+def test_memory_cache_expires_entries(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("app.data.cache.time.monotonic", lambda: clock[0])
+    cache = MemoryCache(max_size=10, default_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=120)
+
+    clock[0] += 90
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.keys() == ["b"]
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.data.backfill import CME_TZ, BackfillPlanner
+from app.data.bar_schema import ensure_bar_schema
+from collection_engine import AsyncCollectionEngine
+
+
+def ct(*args) -> int:
+    """芝加哥时间 -> Unix秒"""
+    return int(datetime(*args, tzinfo=CME_TZ).timestamp())
+
+
+def test_enqueue_range_feeds_the_backfill_downloads(tmp_path):
+    db_path = str(tmp_path / "bars.db")
+    ensure_bar_schema(db_path)
+    flushed, fetched = [], []
+    engine = AsyncCollectionEngine(status_callback=lambda message: None)
+    engine.collectors["ES"] = SimpleNamespace(
+        interval_seconds={"1m": 60},
+        backfill_planner=BackfillPlanner(db_path, "ES", max_bars_per_request=30),
+        flush_bar_files=flushed.append,
+    )
+
+    with pytest.raises(ValueError):
+        engine.enqueue_range("NQ", "1m", ct(2024, 1, 10, 9), ct(2024, 1, 10, 10))
+    # 引擎未运行时先登记，一小时按单次请求上限拆成两个请求
+    assert engine.enqueue_range("ES", "1m", ct(2024, 1, 10, 9), ct(2024, 1, 10, 9, 59)) == 2
+
+    async def fetch(symbol, timeframe, barsback=1, range_params=None):
+        fetched.append(range_params["firstdate"])
+        return []
+
+    async def run():
+        engine._fetch = fetch
+        engine._download_semaphore = asyncio.Semaphore(2)
+        engine._start_queued_ranges()
+        await asyncio.gather(*engine._tasks)
+
+    asyncio.run(run())
+    assert sorted(fetched) == ["2024-01-10T15:00:00Z", "2024-01-10T15:30:00Z"]
+    assert flushed == ["1m"]
+    assert engine.range_queue == []
+    assert engine.progress["ES"] == [0, 0]
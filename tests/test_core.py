@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from app.core.paths import split_db_target, symbol_dirname
+from app.core.singleton import shared_instance
+
+
+def test_shared_instance_creates_once_across_threads():
+    created = []
+
+    @shared_instance
+    def get_thing():
+        """共享对象"""
+        created.append(object())
+        return created[-1]
+
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(get_thing())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+    assert get_thing.__doc__ == "共享对象"
+
+
+def test_shared_instance_reset_returns_instance_and_recreates():
+    @shared_instance
+    def get_thing():
+        return object()
+
+    assert get_thing.reset() is None
+    first = get_thing()
+    assert get_thing.reset() is first
+    assert get_thing() is not first
+
+
+def test_close_http_session_closes_and_recreates():
+    from app.services.http_session import close_http_session, get_http_session
+
+    session = get_http_session()
+    closed = []
+    session.close = lambda: closed.append(True)
+    close_http_session()
+    close_http_session()
+
+    assert closed == [True]
+    assert get_http_session() is not session
+
+
+def test_symbol_dirname_replaces_path_separators():
+    assert symbol_dirname("@ES") == "@ES"
+    assert symbol_dirname("EUR/USD") == "EUR_USD"
+    assert symbol_dirname("a\\b") == "a_b"
+
+
+def test_split_db_target_keeps_drive_letters():
+    assert split_db_target("es_futures_data.db:ES") == ("es_futures_data.db", "ES")
+    assert split_db_target("C:\\data\\es.db:@ES") == ("C:\\data\\es.db", "@ES")
+    with pytest.raises(ValueError):
+        split_db_target("es_futures_data.db")
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.dashboard import DashboardSnapshot
+from app.services.tradestation_client import TradestationAPIClient
+
+POSITION = {"Symbol": "ES", "LongShort": "Short", "Quantity": "-2"}
+
+
+def _snapshot(age: float = 0.0, **errors) -> DashboardSnapshot:
+    return DashboardSnapshot("A1", positions={"ES": POSITION}, errors=errors,
+                             fetched_at=time.time() - age)
+
+
+def test_fresh_position_only_within_age_and_without_errors():
+    assert _snapshot().fresh_position("ES", 3.0) == POSITION
+    assert _snapshot(age=10).fresh_position("ES", 3.0) is None
+    # 持仓查询失败时快照沿用了旧持仓，不能直接用于平仓
+    assert _snapshot(positions="timeout").fresh_position("ES", 3.0) is None
+
+
+class _OrderRecorder(TradestationAPIClient):
+    def __init__(self):
+        super().__init__()
+        self.orders = []
+
+    async def place_market_order(self, account_id, symbol, quantity, side):
+        self.orders.append((symbol, quantity, side))
+        return {"Orders": []}
+
+
+def test_close_position_checks_quantity_against_position():
+    client = _OrderRecorder()
+    asyncio.run(client.close_position("A1", "ES", 2, position=POSITION))
+    assert client.orders == [("ES", 2, "BuyToCover")]
+
+    with pytest.raises(Exception, match="超出"):
+        asyncio.run(client.close_position("A1", "ES", 3, position=POSITION))
+    assert len(client.orders) == 1
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.data.frame_codec import decode_frame, encode_frame, is_encoded_frame
+
+
+@pytest.mark.parametrize("compression", ["zlib", "none"])
+def test_round_trip_keeps_values_and_dtypes(compression):
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-02", periods=5, freq="min"),
+        "local": pd.date_range("2024-01-02", periods=5, freq="min", tz="America/Chicago"),
+        "close": np.linspace(4500, 4501, 5),
+        "volume": np.arange(5, dtype=np.int64),
+        "symbol": ["ES", "ES", None, "NQ", "收盘"],
+    })
+    data = encode_frame(df, compression)
+
+    assert is_encoded_frame(data)
+    pd.testing.assert_frame_equal(decode_frame(data), df)
+
+
+def test_empty_frame_and_foreign_payload():
+    df = pd.DataFrame({"close": np.array([], dtype=np.float64)})
+    pd.testing.assert_frame_equal(decode_frame(encode_frame(df)), df)
+
+    with pytest.raises(ValueError):
+        decode_frame(b'[{"close": 1}]')
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from app.services.rate_limiter import RateLimiter, TokenBucket, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.rate_limiter.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_allows_burst_then_spaces_requests(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # 桶空后每个令牌间隔 1/rate 秒
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    clock[0] += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_pause_blocks_until_resume(clock):
+    bucket = TokenBucket(rate=1.0, capacity=5)
+    bucket.pause(30)
+    assert bucket.reserve() == pytest.approx(30.0)
+
+    clock[0] += 31
+    assert bucket.reserve() == pytest.approx(0.0)
+
+
+def test_endpoints_share_buckets_by_prefix():
+    limiter = RateLimiter([("/marketdata", 100), ("", 50)], window=60)
+    assert limiter.bucket_for("/v3/marketdata/barcharts/ES?barsback=1") is limiter.buckets["/marketdata"]
+    assert limiter.bucket_for("/marketdata/quotes/ES") is limiter.buckets["/marketdata"]
+    assert limiter.bucket_for("/brokerage/accounts") is limiter.buckets[""]
+    # 突发量为配额的1/10，补充速度扣除突发量
+    assert limiter.buckets["/marketdata"].capacity == 10
+    assert limiter.buckets["/marketdata"].rate == pytest.approx(90 / 60)
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None, default=3.0) == 3.0
+    assert parse_retry_after("soon", default=4.0) == 4.0
+    retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=120), usegmt=True)
+    assert 110 <= parse_retry_after(retry_at) <= 120
@@ -0,0 +1,52 @@
+import pytest
+
+from app.services.resilience import (CircuitBreaker, ClientMetrics, RetryPolicy, endpoint_key,
+                                     get_circuit_breaker)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.resilience.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_retry_delay_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr("app.services.resilience.random.uniform", lambda low, high: high)
+    policy = RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=3.0)
+    assert [policy.delay(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+
+def test_breaker_opens_then_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("/marketdata/barcharts", failure_threshold=2, reset_timeout=30)
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(30)
+
+    clock[0] += 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    # 试探失败立即重新打开，成功则关闭
+    assert breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_breakers_are_shared_per_endpoint_group():
+    assert endpoint_key("/marketdata/barcharts/ES?barsback=1") == "/marketdata/barcharts"
+    assert get_circuit_breaker("/marketdata/barcharts/ES") is get_circuit_breaker("/marketdata/barcharts/NQ")
+    assert get_circuit_breaker("/marketdata/barcharts/ES") is not get_circuit_breaker("/marketdata/quotes/ES")
+
+
+def test_metrics_snapshot():
+    metrics = ClientMetrics()
+    metrics.incr("requests", 3)
+    metrics.incr("missed_bars")
+    snapshot = metrics.snapshot()
+    assert snapshot["requests"] == 3 and snapshot["missed_bars"] == 1 and snapshot["failures"] == 0
@@ -0,0 +1,30 @@
+import sqlite3
+
+import pytest
+
+from app.data.sqlite_profile import connect
+
+
+def test_readonly_connection_does_not_create_missing_database(tmp_path):
+    db_path = tmp_path / "missing.db"
+    with pytest.raises(sqlite3.OperationalError):
+        connect(str(db_path), readonly=True)
+    assert not db_path.exists()
+
+
+def test_readonly_connection_reads_but_cannot_write(tmp_path):
+    db_path = str(tmp_path / "with space.db")
+    conn = connect(db_path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+
+    reader = connect(db_path, readonly=True)
+    try:
+        assert reader.execute("SELECT x FROM t").fetchall() == [(1,)]
+        assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        with pytest.raises(sqlite3.OperationalError):
+            reader.execute("INSERT INTO t VALUES (2)")
+    finally:
+        reader.close()
+        conn.close()
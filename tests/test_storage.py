@@ -0,0 +1,71 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from app.data.cache import MemoryCache
+from app.data.market_schema import migrate_market_data
+from app.data.storage import DataStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = DataStorage(cache=MemoryCache(), database_url=f"sqlite:///{tmp_path / 'market.db'}")
+    storage.create_tables()
+    return storage
+
+
+def test_saved_frame_is_buffered_as_written(storage):
+    # 带时区、乱序、重复时间点、字符串数值的原始数据
+    df = pd.DataFrame({
+        "timestamp": pd.to_datetime(["2024-01-02 15:01", "2024-01-02 15:00", "2024-01-02 15:01"]).tz_localize("America/Chicago"),
+        "open": ["1", "2", "3"], "high": [1, 2, 3], "low": [1, 2, 3], "close": [1, 2, 3], "volume": [1, 2, 3],
+    })
+    storage.save_market_data(df, "ES", "1min")
+
+    stored = storage.get_market_data("ES", "1min")
+    buffered = storage.get_buffered_market_data("ES", "1min")
+    assert stored["timestamp"].tolist() == [pd.Timestamp("2024-01-02 21:00"), pd.Timestamp("2024-01-02 21:01")]
+    assert stored["open"].tolist() == [2.0, 3.0]
+    pd.testing.assert_frame_equal(buffered, stored, check_dtype=False)
+
+
+def test_saving_twice_overwrites_instead_of_duplicating(storage):
+    df = pd.DataFrame({"timestamp": pd.date_range("2024-01-02", periods=3, freq="min"),
+                       "open": 1.0, "high": 1.0, "low": 1.0, "close": [1.0, 2.0, 3.0], "volume": 1.0})
+    storage.save_market_data(df, "ES", "1min")
+    storage.save_market_data(df.assign(close=[4.0, 5.0, 6.0]), "ES", "1min")
+
+    assert storage.get_market_data("ES", "1min")["close"].tolist() == [4.0, 5.0, 6.0]
+
+
+def test_legacy_table_is_only_migrated_explicitly(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE market_data (id INTEGER PRIMARY KEY, symbol TEXT, timestamp DATETIME, open REAL, "
+                 "high REAL, low REAL, close REAL, volume REAL, interval TEXT, created_at DATETIME)")
+    conn.executemany("INSERT INTO market_data (symbol, timestamp, open, high, low, close, volume, interval) "
+                     "VALUES ('ES', '2024-01-02 00:00:00.000000', 1, 1, 1, ?, 1, '1min')", [(1.0,), (2.0,)])
+    conn.commit()
+    conn.close()
+
+    # 构造时只检查表结构，不删除重复数据，写入回退到先删除后插入
+    storage = DataStorage(cache=MemoryCache(), database_url=f"sqlite:///{db_path}")
+    assert not storage._upsert
+    assert sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM market_data").fetchone() == (2,)
+
+    assert migrate_market_data(storage.engine) == 1
+    assert migrate_market_data(storage.engine) is None
+    assert DataStorage(cache=MemoryCache(), database_url=f"sqlite:///{db_path}")._upsert
+    assert storage.get_market_data("ES", "1min")["close"].tolist() == [2.0]
+
+
+def test_buffered_read_requires_the_whole_range(storage):
+    df = pd.DataFrame({"timestamp": pd.date_range("2024-01-02 15:00", periods=3, freq="min"),
+                       "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0})
+    storage.save_market_data(df, "ES", "1min")
+
+    start = pd.Timestamp("2024-01-02 15:00").to_pydatetime()
+    assert len(storage.get_buffered_market_data("ES", "1min", start, start + pd.Timedelta(minutes=2))) == 3
+    # 终点晚于缓冲区最后一根K线：较新的K线可能只在数据库里
+    assert storage.get_buffered_market_data("ES", "1min", start, start + pd.Timedelta(minutes=5)) is None
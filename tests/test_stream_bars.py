@@ -0,0 +1,98 @@
+"""
+K线流测试 - 本地aiohttp服务器模拟barcharts流端点：
+JSON对象跨分块（含被截断的多字节字符）、连接中途断开、重连后从最后一根K线续传
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+from app.services.tradestation_client import TradestationAPIClient
+
+
+def _bar(ts: int, close: float, status: str = "Closed") -> bytes:
+    stamp = datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return json.dumps({"TimeStamp": stamp, "Close": str(close), "BarStatus": status,
+                       "Note": "收盘"}, ensure_ascii=False).encode("utf-8")
+
+
+class StandInServer:
+    """第一次连接：第一根K线分三块发送（在多字节字符中间切开），第二根只发一半后断开；
+    第二次连接：按续传参数重发最近的K线"""
+
+    def __init__(self, base_ts: int):
+        self.base_ts = base_ts
+        self.requests = []
+
+    async def handle(self, request):
+        self.requests.append(dict(request.query))
+        response = web.StreamResponse()
+        await response.prepare(request)
+
+        if len(self.requests) == 1:
+            first = _bar(self.base_ts, 1.0)
+            cut = first.index("收".encode("utf-8")) + 1
+            for part in (first[:10], first[10:cut], first[cut:] + b"\n"):
+                await response.write(part)
+                await asyncio.sleep(0.01)
+            await response.write(b'{"Heartbeat": 1}\n')
+            await response.write(_bar(self.base_ts + 60, 2.0)[:20])
+            await asyncio.sleep(0.01)
+            request.transport.abort()
+            return response
+
+        for offset, close in ((0, 1.0), (60, 2.0), (120, 3.0)):
+            await response.write(_bar(self.base_ts + offset, close))
+        # 保持连接并发送心跳，直到客户端断开
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                await response.write(b'{"Heartbeat": 2}\n')
+        except ConnectionError:
+            pass
+        return response
+
+
+async def _collect(count: int):
+    base_ts = int(time.time()) // 60 * 60 - 180
+    server = StandInServer(base_ts)
+    app = web.Application()
+    app.router.add_get("/v3/marketdata/stream/barcharts/{symbol}", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    client = TradestationAPIClient(base_url=f"http://127.0.0.1:{port}/v3")
+    client.access_token = "test-token"
+    client.token_expires_at = datetime.now() + timedelta(hours=1)
+    bars = []
+    try:
+        async with client:
+            stream = client.stream_bars("ES", barsback=1, max_backoff=0.1)
+            async for bar in stream:
+                bars.append(bar)
+                if len(bars) == count:
+                    break
+            await stream.aclose()
+    finally:
+        await runner.cleanup()
+    return server, bars
+
+
+def test_stream_reassembles_objects_and_resumes_after_disconnect():
+    server, bars = asyncio.run(asyncio.wait_for(_collect(4), timeout=10))
+
+    # 分块拼接后的第一根K线完整解析，多字节字符没有损坏
+    assert bars[0]["Close"] == "1.0" and bars[0]["Note"] == "收盘"
+    # 断线后重连一次，续传请求覆盖断线期间的K线
+    assert len(server.requests) == 2
+    assert server.requests[0]["barsback"] == "1"
+    assert int(server.requests[1]["barsback"]) >= 2
+    # 半个对象被丢弃；重连后比最后一根更早的K线被过滤，同一时间的K线（可能已更新）保留
+    assert [bar["Close"] for bar in bars] == ["1.0", "1.0", "2.0", "3.0"]
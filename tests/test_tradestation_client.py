@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+from app.services.tradestation_client import TradestationAPIClient
+
+
+class StandInTokens:
+    """令牌管理器替身：invalidate之后get_access_token换发新令牌"""
+
+    refresh_margin = timedelta(minutes=5)
+
+    def __init__(self):
+        self.access_token = "old-token"
+        self.expires_at = datetime.now() + timedelta(hours=1)
+        self.invalidated = []
+
+    def snapshot(self):
+        return {"access_token": self.access_token, "refresh_token": "refresh", "expires_at": self.expires_at}
+
+    def invalidate(self, access_token=None):
+        self.invalidated.append(access_token)
+        self.expires_at = None
+
+    def get_access_token(self):
+        self.access_token = "new-token"
+        self.expires_at = datetime.now() + timedelta(hours=1)
+        return self.access_token
+
+
+async def _request(accepted_token: str):
+    seen = []
+
+    async def handle(request):
+        seen.append(request.headers["Authorization"])
+        if request.headers["Authorization"] != f"Bearer {accepted_token}":
+            return web.json_response({"Message": "Unauthorized"}, status=401)
+        return web.json_response({"Symbols": ["ES"]})
+
+    app = web.Application()
+    app.router.add_get("/v3/marketdata/symbols", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    client = TradestationAPIClient(base_url=f"http://127.0.0.1:{port}/v3")
+    client.token_manager = tokens = StandInTokens()
+    client._load_tokens()
+    try:
+        async with client:
+            result = await client._make_request("GET", "/marketdata/symbols")
+    except Exception as e:
+        result = e
+    finally:
+        await runner.cleanup()
+    return result, seen, tokens
+
+
+def test_401_refreshes_the_token_and_retries_once():
+    result, seen, tokens = asyncio.run(asyncio.wait_for(_request("new-token"), timeout=10))
+
+    assert result == {"Symbols": ["ES"]}
+    assert seen == ["Bearer old-token", "Bearer new-token"]
+    assert tokens.invalidated == ["old-token"]
+
+
+def test_401_after_refresh_is_raised():
+    result, seen, _ = asyncio.run(asyncio.wait_for(_request("other-token"), timeout=10))
+
+    assert isinstance(result, Exception) and "401" in str(result)
+    assert len(seen) == 2
@@ -5,7 +5,6 @@ Tradestation期货实时数据收集器 - 简化版
 基于Tradestation API的数据收集器，完全复刻币安数据收集器的功能和数据库结构
 """
 
-import sqlite3
 import time
 import threading
 import asyncio
@@ -17,7 +16,19 @@ import warnings
 
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from app.services.tradestation_client import TradestationAPIClient
+from app.core.config import settings
+from app.data.backfill import BackfillPlanner, BackfillRequest
+from app.data.bar_aggregator import BarAggregator
+from app.data.bar_decoder import BarColumns, decode_bars
+from app.data.bar_file import get_bar_file_store
+from app.data.bar_schema import BAR_TABLES, migrate_bar_schema
+from app.data.bar_store import get_bar_store, sqlite_source
+from app.data.bar_writer import get_bar_writer
+from app.data.sqlite_profile import StorageProfile, connect, get_storage_profile
+from app.services import json_codec
+from app.services.http_session import get_http_session, get_token_provider
+from app.services.rate_limiter import get_rate_limiter, parse_retry_after
+from app.services.resilience import RetryPolicy
 
 # 设置事件循环策略以避免Windows上的警告
 if sys.platform == 'win32':
@@ -28,25 +39,28 @@ warnings.filterwarnings("ignore", category=RuntimeWarning, module="asyncio")
 
 
 class TradestationDataCollector:
-    def __init__(self, db_path: str = "tradestation_futures_data.db", symbol: str = "ES"):
+    def __init__(self, db_path: str = "tradestation_futures_data.db", symbol: str = "ES",
+                 derive_higher_timeframes: bool = True, storage_profile: StorageProfile = None):
         self.db_path = db_path
         self.symbol = symbol
+        self.storage_profile = storage_profile or get_storage_profile()
+        
+        # 实时阶段只轮询1分钟K线，更高周期由本地聚合得到
+        self.derive_higher_timeframes = derive_higher_timeframes
+        self.derived_timeframes: List[str] = []
         
         print(f"📊 使用Tradestation API收集 {symbol} 数据")
         
         self.running = False
         self.threads = {}
         
-        # 支持的时间周期和对应的表名 - 完全复刻币安的结构
-        self.timeframes = {
-            '1m': 'min1_data',
-            '3m': 'min3_data', 
-            '5m': 'min5_data',
-            '10m': 'min10_data',
-            '15m': 'min15_data',
-            '30m': 'min30_data',
-            '1h': 'min60_data'
-        }
+        # 所有收集线程和合约共享同一个连接池会话和令牌缓存
+        self.http_session = get_http_session()
+        self.token_provider = get_token_provider()
+        self.rate_limiter = get_rate_limiter()
+        
+        # 支持的时间周期和对应的数值K线表（旧的minN_data表名保留为兼容视图）
+        self.timeframes = dict(BAR_TABLES)
         
         # 时间周期对应的秒数
         self.interval_seconds = {
@@ -70,31 +84,42 @@ class TradestationDataCollector:
             '1h': (60, 'minute')
         }
         
+        # 1分钟K线 -> 更高周期的增量聚合器
+        self.aggregator = BarAggregator(
+            db_path=self.db_path,
+            symbol=self.symbol,
+            source_table=self.timeframes['1m'],
+            interval_seconds=self.interval_seconds,
+            storage_profile=self.storage_profile
+        )
+        
+        # 增量回补计划器（读取已入库数据，只请求缺口）
+        self.backfill_planner = BackfillPlanner(self.db_path, self.symbol, self.storage_profile)
+        
         # 初始化数据库
         self.init_database()
         
-    def init_database(self):
-        """初始化数据库和所有表 - 完全复刻币安的数据结构"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        for timeframe, table_name in self.timeframes.items():
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS {table_name} (
-                    time TEXT PRIMARY KEY,
-                    high TEXT,
-                    low TEXT,
-                    open TEXT,
-                    close TEXT,
-                    vol TEXT,
-                    code TEXT
-                )
-            """)
-            cur.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_time ON {table_name}(time)')
-            cur.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_code ON {table_name}(code)')
+        # 每个数据库一个长连接写入器
+        self.writer = get_bar_writer(self.db_path, self.storage_profile)
+        self.bar_store = get_bar_store()
+        # K线文件（回测/图表进程内存映射读取）
+        self.bar_files = get_bar_file_store(self.db_path) if settings.bar_files_enabled else None
+        if self.bar_files:
+            try:
+                # 先用数据库中已有的K线生成文件，之后实时K线只需追加
+                self.bar_files.ensure_built(self.db_path, self.symbol, list(self.timeframes), self.storage_profile)
+            except Exception as e:
+                print(f"⚠️ 生成K线文件失败: {e}")
         
-        conn.commit()
-        conn.close()
+    def init_database(self):
+        """初始化数据库和所有表"""
+        # 建库时切换到WAL模式，之后图表/策略读取不会被收集器写入阻塞
+        conn = connect(self.db_path, self.storage_profile)
+        try:
+            # 创建数值类型的K线表，并把旧版TEXT表迁移过来
+            migrate_bar_schema(conn)
+        finally:
+            conn.close()
         print(f"✅ 数据库初始化完成: {self.db_path}")
     
     def get_server_time(self) -> int:
@@ -121,96 +146,50 @@ class TradestationDataCollector:
         
         return next_candle_time
     
-    def get_kline_data_sync(self, timeframe: str, limit: int = 1) -> List[Dict]:
-        """同步方式获取K线数据 - 使用requests避免asyncio问题"""
+    def get_kline_data_sync(self, timeframe: str, limit: int = 1, range_params: Dict = None) -> BarColumns:
+        """同步方式获取K线数据 - 使用共享的keep-alive会话避免asyncio问题
+        range_params为firstdate/lastdate等参数，指定时替代barsback"""
         try:
             interval, unit = self.tradestation_intervals[timeframe]
             
-            # 直接使用requests而不是asyncio
-            import requests
-            import json
-            
-            # 从TradestationAPIClient获取认证信息
-            try:
-                client = TradestationAPIClient()
-                
-                # 检查令牌是否有效，如果无效则自动刷新
-                if not client.is_token_valid():
-                    print("🔄 访问令牌已过期，正在自动刷新...")
-                    try:
-                        # 使用同步方式刷新令牌
-                        import asyncio
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        try:
-                            loop.run_until_complete(client.refresh_access_token())
-                            print("✅ 访问令牌刷新成功")
-                            # 刷新后重新加载令牌
-                            client._load_tokens()
-                        finally:
-                            loop.close()
-                    except Exception as refresh_error:
-                        print(f"❌ 刷新令牌失败: {refresh_error}")
-                        print("❌ 需要重新运行认证流程")
-                        return []
-                
-                # 获取当前有效的令牌
-                if not client.access_token:
-                    print("❌ 未找到有效的访问令牌")
-                    return []
-                
-                # 使用client的access_token而不是从文件重新加载
-                access_token = client.access_token
-                    
-            except Exception as e:
-                print(f"❌ 获取访问令牌失败: {e}")
+            # 从共享令牌提供器获取认证信息（内存缓存，过期时才刷新）
+            access_token = self.token_provider.get_access_token()
+            if not access_token:
+                print("❌ 未找到有效的访问令牌")
                 return []
             
             # 构建API请求
-            url = f"https://api.tradestation.com/v3/marketdata/barcharts/{self.symbol}"
+            endpoint = f"/marketdata/barcharts/{self.symbol}"
+            url = f"https://api.tradestation.com/v3{endpoint}"
             headers = {
-                'Authorization': f"Bearer {access_token}",
-                'Content-Type': 'application/json'
+                'Authorization': f"Bearer {access_token}"
             }
             params = {
                 'interval': interval,
-                'unit': unit,
-                'barsback': limit
+                'unit': unit
             }
+            params.update(range_params or {'barsback': limit})
             
-            # 发送请求
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            # 发送请求（复用连接池中的连接，与异步客户端共用限流令牌桶）
+            for attempt in range(settings.rate_limit_max_retries + 1):
+                self.rate_limiter.acquire_sync(endpoint)
+                response = self.http_session.get(url, headers=headers, params=params, timeout=settings.http_timeout)
+                if response.status_code != 429 or attempt == settings.rate_limit_max_retries:
+                    break
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                self.rate_limiter.pause(endpoint, retry_after)
+                print(f"⚠️ 触发限流 {endpoint}，{retry_after:.0f}秒后重试")
             
-            if response.status_code == 200:
-                result = response.json()
+            if response.status_code == 401:
+                # 令牌被服务端拒绝，下次请求时重新加载/刷新
+                self.token_provider.invalidate(access_token)
+                print("❌ API请求失败: 401 令牌无效")
+                return []
+            elif response.status_code == 200:
+                result = json_codec.decode(response.content, 'bars')
                 
                 if result and 'Bars' in result:
-                    bars = result['Bars']
-                    kline_data = []
-                    
-                    for bar in bars:
-                        # 转换Tradestation数据格式为币安格式
-                        kline = {
-                            'open_time': int(datetime.fromisoformat(bar['TimeStamp'].replace('Z', '+00:00')).timestamp() * 1000),
-                            'close_time': int(datetime.fromisoformat(bar['TimeStamp'].replace('Z', '+00:00')).timestamp() * 1000) + self.interval_seconds[timeframe] * 1000 - 1,
-                            'symbol': self.symbol,
-                            'interval': timeframe,
-                            'first_trade_id': 0,
-                            'last_trade_id': 0,
-                            'open': str(bar['Open']),
-                            'high': str(bar['High']),
-                            'low': str(bar['Low']),
-                            'close': str(bar['Close']),
-                            'volume': str(bar.get('Volume', '0')),
-                            'quote_asset_volume': '0',
-                            'number_of_trades': 0,
-                            'taker_buy_base_asset_volume': '0',
-                            'taker_buy_quote_asset_volume': '0',
-                            'ignore': '0'
-                        }
-                        kline_data.append(kline)
-                    
-                    return kline_data
+                    return self.parse_bars(timeframe, result['Bars'])
                 else:
                     print(f"❌ 获取 {self.symbol} {timeframe} 数据失败")
                     return []
@@ -222,51 +201,86 @@ class TradestationDataCollector:
             print(f"❌ 获取K线数据出错: {e}")
             return []
     
-    def save_kline_data(self, timeframe: str, kline_data: List[Dict]):
-        """保存K线数据到数据库"""
+    def parse_bars(self, timeframe: str, bars: List[Dict]) -> BarColumns:
+        """将Tradestation的Bars批量解码为列数据"""
+        return decode_bars(bars, self.interval_seconds[timeframe])
+    
+    def save_kline_data(self, timeframe: str, kline_data: BarColumns, backfill: bool = False):
+        """保存K线数据到数据库；backfill=True时K线文件中更早的K线留到回补结束后一次性合并（见flush_bar_files）"""
         if not kline_data:
             return
         
         table_name = self.timeframes[timeframe]
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
+            # 使用收盘时间（Unix秒）作为时间键
+            rows = kline_data.to_rows(self.symbol)
             
-            for kline in kline_data:
-                # 使用收盘时间作为时间戳
-                timestamp = datetime.fromtimestamp(kline['close_time'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                
-                cur.execute(f"""
-                    INSERT OR REPLACE INTO {table_name} 
-                    (time, high, low, open, close, vol, code)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    timestamp,
-                    kline['high'],
-                    kline['low'],
-                    kline['open'],
-                    kline['close'],
-                    kline['volume'],
-                    self.symbol
-                ))
+            # 通过共享写入器批量写入（同一数据库的所有线程合并到一个事务）
+            self.writer.write_bars(table_name, rows)
             
-            conn.commit()
-            conn.close()
+            # 入库后追加到内存K线存储，图表和策略直接读取
+            self.bar_store.append(self.symbol, timeframe, kline_data.time, kline_data.open,
+                                  kline_data.high, kline_data.low, kline_data.close, kline_data.volume,
+                                  source=sqlite_source(self.db_path, table_name))
+            
+            if self.bar_files:
+                try:
+                    self.bar_files.append(self.symbol, timeframe, kline_data.time, kline_data.open,
+                                          kline_data.high, kline_data.low, kline_data.close, kline_data.volume)
+                    if not backfill:
+                        self.bar_files.flush(self.symbol, timeframe)
+                except Exception as e:
+                    print(f"⚠️ 写入K线文件失败（数据库已保存）: {e}")
             
             print(f"✅ 已保存 {len(kline_data)} 条 {self.symbol} {timeframe} 数据")
             
         except Exception as e:
             print(f"❌ 保存数据失败: {e}")
     
+    def flush_bar_files(self, timeframe: str):
+        """历史回补结束后把回补的K线合并进K线文件（每次回补只重写一次文件）"""
+        if not self.bar_files:
+            return
+        try:
+            self.bar_files.flush(self.symbol, timeframe)
+        except Exception as e:
+            print(f"⚠️ 合并K线文件失败（数据库已保存）: {e}")
+    
+    def plan_timeframes(self, timeframes: List[str]) -> List[str]:
+        """确定需要实时轮询的时间周期，其余周期改为由1分钟K线聚合"""
+        timeframes = [tf for tf in timeframes if tf in self.timeframes]
+        
+        if not self.derive_higher_timeframes:
+            self.derived_timeframes = []
+            return timeframes
+        
+        self.derived_timeframes = [tf for tf in timeframes if tf != '1m']
+        self.aggregator.reset()
+        return ['1m']
+    
+    def save_derived_kline_data(self, minute_kline_data: BarColumns):
+        """用新收盘的1分钟K线更新并保存更高周期的K线（含未完成的部分K线）"""
+        if not self.derived_timeframes or not minute_kline_data:
+            return
+        
+        derived = self.aggregator.update(minute_kline_data, self.derived_timeframes)
+        for timeframe, kline_data in derived.items():
+            self.save_kline_data(timeframe, kline_data)
+    
     def collect_timeframe_data(self, timeframe: str):
         """收集指定时间周期的数据"""
         print(f"🚀 开始收集 {self.symbol} {timeframe} 数据...")
         
-        # 首先批量下载历史数据
+        # 首先批量下载历史数据（聚合周期的历史数据也在这里一并下载）
         self.download_historical_data(timeframe)
+        if timeframe == '1m':
+            for derived_timeframe in self.derived_timeframes:
+                self.download_historical_data(derived_timeframe)
         
-        # 然后开始实时收集
+        # 然后开始实时收集（连续出错时按指数退避等待，避免接口故障期间反复请求）
+        retry_policy = RetryPolicy.from_settings()
+        failures = 0
         while self.running:
             try:
                 # 等待下一个K线周期
@@ -278,31 +292,51 @@ class TradestationDataCollector:
                 if kline_data:
                     # 保存数据
                     self.save_kline_data(timeframe, kline_data)
+                    if timeframe == '1m':
+                        self.save_derived_kline_data(kline_data)
                 else:
                     print(f"⚠️ 未获取到 {self.symbol} {timeframe} 数据")
                 
                 # 等待一段时间再继续
+                failures = 0
                 time.sleep(1)
                 
             except Exception as e:
-                print(f"❌ 收集 {timeframe} 数据出错: {e}")
-                time.sleep(5)  # 出错后等待5秒再重试
+                failures += 1
+                delay = retry_policy.delay(failures)
+                print(f"❌ 收集 {timeframe} 数据出错: {e}，{delay:.1f}秒后重试")
+                time.sleep(delay)
+    
+    def plan_backfill(self, timeframe: str) -> List[BackfillRequest]:
+        """根据已入库数据规划需要回补的时间段"""
+        return self.backfill_planner.plan(
+            timeframe, self.timeframes[timeframe], self.interval_seconds[timeframe]
+        )
     
     def download_historical_data(self, timeframe: str):
-        """批量下载历史数据"""
-        print(f"📥 开始批量下载 {self.symbol} {timeframe} 历史数据...")
-        
+        """增量下载历史数据 - 只请求缺失的时间段"""
         try:
-            # 获取1000条历史数据
-            kline_data = self.get_kline_data_sync(timeframe, limit=1000)
+            requests = self.plan_backfill(timeframe)
+            if not requests:
+                print(f"✅ {self.symbol} {timeframe} 历史数据已完整，无需回补")
+                return
             
-            if kline_data:
-                print(f"✅ 获取到 {len(kline_data)} 条 {timeframe} 历史数据")
-                
-                # 保存所有历史数据
-                self.save_kline_data(timeframe, kline_data)
-                
-                print(f"🎉 已保存 {len(kline_data)} 条 {self.symbol} {timeframe} 历史数据")
+            expected = sum(request.expected_bars for request in requests)
+            print(f"📥 开始回补 {self.symbol} {timeframe} 历史数据: {len(requests)} 个请求，约 {expected} 条")
+            
+            total = 0
+            for request in requests:
+                kline_data = self.get_kline_data_sync(timeframe, range_params=request.to_params())
+                if kline_data:
+                    self.save_kline_data(timeframe, kline_data, backfill=True)
+                    total += len(kline_data)
+                if isinstance(kline_data, BarColumns):
+                    # 请求成功（包括区间内没有K线）后记录，下次启动不再请求该区间
+                    self.backfill_planner.mark_checked(request)
+            
+            self.flush_bar_files(timeframe)
+            if total:
+                print(f"🎉 已保存 {total} 条 {self.symbol} {timeframe} 历史数据")
             else:
                 print(f"❌ 未获取到 {self.symbol} {timeframe} 历史数据")
                 
@@ -315,11 +349,19 @@ class TradestationDataCollector:
             print("⚠️ 数据收集已在运行中")
             return
         
+        for timeframe in timeframes:
+            if timeframe not in self.timeframes:
+                print(f"❌ 不支持的时间周期: {timeframe}")
+        
         self.running = True
         print(f"🚀 开始收集 {self.symbol} 数据，时间周期: {', '.join(timeframes)}")
         
-        # 为每个时间周期创建线程
-        for timeframe in timeframes:
+        live_timeframes = self.plan_timeframes(timeframes)
+        if self.derived_timeframes:
+            print(f"🧮 {', '.join(self.derived_timeframes)} 由1分钟K线本地聚合")
+        
+        # 为每个需要轮询的时间周期创建线程
+        for timeframe in live_timeframes:
             if timeframe in self.timeframes:
                 thread = threading.Thread(
                     target=self.collect_timeframe_data,
@@ -329,8 +371,6 @@ class TradestationDataCollector:
                 thread.start()
                 self.threads[timeframe] = thread
                 print(f"✅ {timeframe} 数据收集线程已启动")
-            else:
-                print(f"❌ 不支持的时间周期: {timeframe}")
     
     def stop_collection(self):
         """停止数据收集"""
@@ -349,37 +389,33 @@ class TradestationDataCollector:
         self.threads.clear()
         print(f"✅ {self.symbol} 数据收集已完全停止")
     
-    def get_latest_data(self, timeframe: str, limit: int = 100) -> List[Dict]:
-        """获取最新数据"""
+    def get_latest_bars(self, timeframe: str, limit: int = 100) -> Dict:
+        """获取最新K线的列数据（内存K线存储的只读视图，按时间升序）"""
         table_name = self.timeframes.get(timeframe)
         if not table_name:
-            return []
-        
+            return {}
+        return self.bar_store.latest(self.symbol, timeframe, limit, self.db_path,
+                                     table_name, self.storage_profile)
+    
+    def get_latest_data(self, timeframe: str, limit: int = 100) -> List[Dict]:
+        """获取最新数据"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            
-            cur.execute(f"""
-                SELECT time, high, low, open, close, vol, code
-                FROM {table_name}
-                WHERE code = ?
-                ORDER BY time DESC
-                LIMIT ?
-            """, (self.symbol, limit))
-            
-            rows = cur.fetchall()
-            conn.close()
+            bars = self.get_latest_bars(timeframe, limit)
+            if not bars:
+                return []
             
             data = []
-            for row in rows:
+            for index in range(len(bars['time']) - 1, -1, -1):
+                timestamp = int(bars['time'][index])
                 data.append({
-                    'time': row[0],
-                    'high': row[1],
-                    'low': row[2],
-                    'open': row[3],
-                    'close': row[4],
-                    'volume': row[5],
-                    'symbol': row[6]
+                    'time': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                    'timestamp': timestamp,
+                    'high': float(bars['high'][index]),
+                    'low': float(bars['low'][index]),
+                    'open': float(bars['open'][index]),
+                    'close': float(bars['close'][index]),
+                    'volume': int(bars['volume'][index]),
+                    'symbol': self.symbol
                 })
             
             return data
@@ -395,7 +431,7 @@ class TradestationDataCollector:
             return 0
         
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect(self.db_path, self.storage_profile, readonly=True)
             cur = conn.cursor()
             
             cur.execute(f"""
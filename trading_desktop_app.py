@@ -3,15 +3,13 @@ Tradestation 桌面版交易测试程序 - PyQt5
 简单直接的桌面应用程序
 """
 import sys
-import json
-import asyncio
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QGridLayout, QLabel, QPushButton, 
                              QLineEdit, QTextEdit, QComboBox, QTabWidget,
                              QTableWidget, QTableWidgetItem, QMessageBox,
                              QGroupBox, QSpinBox, QDoubleSpinBox, QProgressBar)
-from PyQt5.QtCore import QThread, pyqtSignal, QTimer
+from PyQt5.QtCore import QObject, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont, QIcon
 import sys
 from pathlib import Path
@@ -20,130 +18,128 @@ from pathlib import Path
 project_root = Path(__file__).parent
 sys.path.append(str(project_root))
 
-from app.services.tradestation_client import TradestationAPIClient
+from app.core.config import settings
+from app.services.api_runner import get_api_runner
+from app.services.dashboard import DashboardPoller
 
 
-class APIClientThread(QThread):
-    """API客户端线程"""
+class APIWorker(QObject):
+    """API操作提交器 - 操作在共享的后台事件循环上执行，结果通过信号回到界面线程"""
     result_ready = pyqtSignal(str, object)  # 信号：操作类型，结果数据
     error_occurred = pyqtSignal(str, str)   # 信号：操作类型，错误信息
+    dashboard_updated = pyqtSignal(object, object)  # 信号：总览快照，与上次快照的差异
     
     def __init__(self):
         super().__init__()
-        self.client = None
-        self.operation = None
-        self.params = {}
+        self.runner = get_api_runner()
+        self.poller = None
         
     def load_tokens(self):
-        """加载令牌"""
+        """加载令牌（共享令牌管理器的内存缓存）"""
         try:
-            with open("tokens.json", "r") as f:
-                tokens = json.load(f)
-            
-            self.client = TradestationAPIClient()
-            self.client.access_token = tokens["access_token"]
-            self.client.refresh_token = tokens["refresh_token"]
-            
-            if tokens["expires_at"]:
-                from datetime import datetime
-                self.client.token_expires_at = datetime.fromisoformat(tokens["expires_at"])
-            
+            self.runner.start()
+            if not self.runner.client.access_token and not self.runner.client.refresh_token:
+                raise Exception("未找到令牌，请先运行认证程序")
             return True
         except Exception as e:
             self.error_occurred.emit("load_tokens", str(e))
             return False
     
-    def set_operation(self, operation, **params):
-        """设置操作"""
-        self.operation = operation
-        self.params = params
-    
-    def run(self):
-        """运行API操作"""
-        if not self.client:
-            if not self.load_tokens():
-                return
+    def request(self, operation, **params):
+        """提交操作（不阻塞界面，多个操作可以同时进行）"""
+        handler = getattr(self, f"_{operation}", None)
+        if handler is None or not self.load_tokens():
+            return
         
+        future = self.runner.submit(lambda client: handler(client, params))
+        future.add_done_callback(lambda f: self._emit(operation, f))
+    
+    def _emit(self, operation, future):
+        """在事件循环线程中调用，信号以排队方式送达界面线程"""
         try:
-            if self.operation == "get_accounts":
-                result = asyncio.run(self._get_accounts())
-            elif self.operation == "get_balance":
-                result = asyncio.run(self._get_balance())
-            elif self.operation == "get_positions":
-                result = asyncio.run(self._get_positions())
-            elif self.operation == "get_orders":
-                result = asyncio.run(self._get_orders())
-            elif self.operation == "get_quote":
-                result = asyncio.run(self._get_quote())
-            elif self.operation == "get_market_data":
-                result = asyncio.run(self._get_market_data())
-            elif self.operation == "place_order":
-                result = asyncio.run(self._place_order())
-            elif self.operation == "close_position":
-                result = asyncio.run(self._close_position())
-            else:
-                result = None
-            
-            self.result_ready.emit(self.operation, result)
-            
+            self.result_ready.emit(operation, future.result())
         except Exception as e:
-            self.error_occurred.emit(self.operation, str(e))
+            self.error_occurred.emit(operation, str(e))
+    
+    def start_dashboard(self, account_id, interval=None, symbols=None):
+        """开始定时刷新账户总览（余额/持仓/订单/报价并发查询，有变化时发出dashboard_updated）"""
+        if not self.load_tokens():
+            return
+        self.stop_dashboard()
+        self.poller = DashboardPoller(None, account_id, interval or settings.dashboard_refresh_interval,
+                                      self.dashboard_updated.emit, symbols)
+        poller = self.poller
+        
+        async def start(client):
+            poller.client = client
+            poller.start()
+        self.runner.submit(start)
+    
+    def refresh_dashboard(self):
+        """立即刷新一次账户总览"""
+        poller = self.poller
+        if poller is None:
+            return
+        future = self.runner.submit(lambda client: poller.refresh())
+        future.add_done_callback(self._emit_dashboard_error)
+    
+    def _emit_dashboard_error(self, future):
+        if future.exception() is not None:
+            self.error_occurred.emit("refresh_dashboard", str(future.exception()))
     
-    async def _get_accounts(self):
+    def stop_dashboard(self):
+        """停止定时刷新"""
+        poller, self.poller = self.poller, None
+        if poller is not None and self.runner.loop is not None:
+            self.runner.loop.call_soon_threadsafe(poller.stop)
+    
+    async def _get_accounts(self, c, params):
         """获取账户列表"""
-        async with self.client as c:
-            return await c.get_accounts()
+        return await c.get_accounts()
     
-    async def _get_balance(self):
+    async def _get_balance(self, c, params):
         """获取账户余额"""
-        async with self.client as c:
-            return await c.get_account_balance(self.params['account_id'])
+        return await c.get_account_balance(params['account_id'])
     
-    async def _get_positions(self):
+    async def _get_positions(self, c, params):
         """获取持仓"""
-        async with self.client as c:
-            return await c.get_positions(self.params['account_id'])
+        return await c.get_positions(params['account_id'])
     
-    async def _get_orders(self):
+    async def _get_orders(self, c, params):
         """获取订单"""
-        async with self.client as c:
-            return await c.get_orders(self.params['account_id'])
+        return await c.get_orders(params['account_id'])
     
-    async def _get_quote(self):
+    async def _get_quote(self, c, params):
         """获取报价"""
-        async with self.client as c:
-            return await c.get_quote(self.params['symbol'])
+        return await c.get_quote(params['symbol'])
     
-    async def _get_market_data(self):
+    async def _get_market_data(self, c, params):
         """获取市场数据"""
-        async with self.client as c:
-            return await c.get_market_data(
-                self.params['symbol'], 
-                self.params.get('interval', '1min'),
-                count=self.params.get('count', 100)
-            )
+        return await c.get_market_data(
+            params['symbol'], 
+            params.get('interval', '1min'),
+            count=params.get('count', 100)
+        )
     
-    async def _place_order(self):
+    async def _place_order(self, c, params):
         """下单"""
-        async with self.client as c:
-            return await c.place_order(
-                self.params['account_id'],
-                self.params['symbol'],
-                self.params['quantity'],
-                self.params['side'],
-                self.params.get('order_type', 'Market'),
-                self.params.get('price')
-            )
+        return await c.place_order(
+            params['account_id'],
+            params['symbol'],
+            params['quantity'],
+            params['side'],
+            params.get('order_type', 'Market'),
+            params.get('price')
+        )
     
-    async def _close_position(self):
-        """平仓"""
-        async with self.client as c:
-            return await c.close_position(
-                self.params['account_id'],
-                self.params['symbol'],
-                self.params['quantity'],
-                self.params['side']
-            )
+    async def _close_position(self, c, params):
+        """平仓（总览快照中有该持仓时直接使用，不再先查询持仓）"""
+        return await c.close_position(
+            params['account_id'],
+            params['symbol'],
+            params['quantity'],
+            position=params.get('position')
+        )
 
 
 class TradingApp(QMainWindow):
@@ -151,9 +147,14 @@ class TradingApp(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.api_thread = APIClientThread()
-        self.api_thread.result_ready.connect(self.on_api_result)
-        self.api_thread.error_occurred.connect(self.on_api_error)
+        self.api_worker = APIWorker()
+        self.api_worker.result_ready.connect(self.on_api_result)
+        self.api_worker.error_occurred.connect(self.on_api_error)
+        self.api_worker.dashboard_updated.connect(self.on_dashboard_updated)
+        
+        self.dashboard = None  # 最近一次账户总览快照
+        self.position_rows = {}  # 持仓表格：Symbol -> 行号
+        self.order_rows = {}  # 订单表格：OrderID -> 行号
         
         self.accounts = []
         self.selected_account = None
@@ -213,10 +214,14 @@ class TradingApp(QMainWindow):
         self.account_id_label = QLabel("账户ID: -")
         self.account_type_label = QLabel("账户类型: -")
         self.account_status_label = QLabel("状态: -")
+        self.account_equity_label = QLabel("权益: -")
+        self.account_pnl_label = QLabel("今日盈亏: -")
         
         info_layout.addWidget(self.account_id_label, 0, 0)
         info_layout.addWidget(self.account_type_label, 0, 1)
         info_layout.addWidget(self.account_status_label, 1, 0)
+        info_layout.addWidget(self.account_equity_label, 1, 1)
+        info_layout.addWidget(self.account_pnl_label, 2, 0)
         
         layout.addWidget(info_group)
         
@@ -389,13 +394,10 @@ class TradingApp(QMainWindow):
         refresh_group = QGroupBox("刷新操作")
         refresh_layout = QHBoxLayout(refresh_group)
         
-        refresh_orders_btn = QPushButton("刷新订单")
-        refresh_orders_btn.clicked.connect(self.query_orders)
-        refresh_layout.addWidget(refresh_orders_btn)
-        
-        refresh_positions_btn = QPushButton("刷新持仓")
-        refresh_positions_btn.clicked.connect(self.query_positions)
-        refresh_layout.addWidget(refresh_positions_btn)
+        # 订单和持仓表格由账户总览定时刷新，按钮只是立即刷新一次（并发查询余额/持仓/订单）
+        refresh_dashboard_btn = QPushButton("刷新订单和持仓")
+        refresh_dashboard_btn.clicked.connect(self.refresh_dashboard)
+        refresh_layout.addWidget(refresh_dashboard_btn)
         
         layout.addWidget(refresh_group)
         
@@ -430,8 +432,7 @@ class TradingApp(QMainWindow):
     def refresh_accounts(self):
         """刷新账户列表"""
         self.statusBar().showMessage("正在刷新账户...")
-        self.api_thread.set_operation("get_accounts")
-        self.api_thread.start()
+        self.api_worker.request("get_accounts")
         
     def on_account_changed(self, text):
         """账户选择改变"""
@@ -440,6 +441,8 @@ class TradingApp(QMainWindow):
                 if f"{account['AccountID']} ({account['AccountType']})" == text:
                     self.selected_account = account
                     self.update_account_info()
+                    # 选中账户后自动定时刷新总览
+                    self.api_worker.start_dashboard(account['AccountID'])
                     break
                     
     def update_account_info(self):
@@ -460,8 +463,7 @@ class TradingApp(QMainWindow):
             return
             
         self.statusBar().showMessage("正在查询余额...")
-        self.api_thread.set_operation("get_balance", account_id=self.selected_account['AccountID'])
-        self.api_thread.start()
+        self.api_worker.request("get_balance", account_id=self.selected_account['AccountID'])
         
     def query_positions(self):
         """查询持仓"""
@@ -470,8 +472,7 @@ class TradingApp(QMainWindow):
             return
             
         self.statusBar().showMessage("正在查询持仓...")
-        self.api_thread.set_operation("get_positions", account_id=self.selected_account['AccountID'])
-        self.api_thread.start()
+        self.api_worker.request("get_positions", account_id=self.selected_account['AccountID'])
         
     def query_orders(self):
         """查询订单"""
@@ -480,8 +481,16 @@ class TradingApp(QMainWindow):
             return
             
         self.statusBar().showMessage("正在查询订单...")
-        self.api_thread.set_operation("get_orders", account_id=self.selected_account['AccountID'])
-        self.api_thread.start()
+        self.api_worker.request("get_orders", account_id=self.selected_account['AccountID'])
+        
+    def refresh_dashboard(self):
+        """立即刷新账户总览"""
+        if not self.selected_account:
+            QMessageBox.warning(self, "警告", "请先选择账户!")
+            return
+        
+        self.statusBar().showMessage("正在刷新账户总览...")
+        self.api_worker.refresh_dashboard()
         
     def get_quote(self):
         """获取报价"""
@@ -491,8 +500,7 @@ class TradingApp(QMainWindow):
             return
             
         self.statusBar().showMessage(f"正在获取 {symbol} 的报价...")
-        self.api_thread.set_operation("get_quote", symbol=symbol)
-        self.api_thread.start()
+        self.api_worker.request("get_quote", symbol=symbol)
         
     def get_market_data(self):
         """获取市场数据"""
@@ -502,11 +510,10 @@ class TradingApp(QMainWindow):
             return
             
         self.statusBar().showMessage(f"正在获取 {symbol} 的K线数据...")
-        self.api_thread.set_operation("get_market_data", 
-                                     symbol=symbol,
-                                     interval=self.interval_combo.currentText(),
-                                     count=self.count_input.value())
-        self.api_thread.start()
+        self.api_worker.request("get_market_data", 
+                                symbol=symbol,
+                                interval=self.interval_combo.currentText(),
+                                count=self.count_input.value())
         
     def place_order(self, side, order_type):
         """下单"""
@@ -540,14 +547,13 @@ class TradingApp(QMainWindow):
                 price = self.short_price_input.value()
         
         self.statusBar().showMessage(f"正在提交{side}订单...")
-        self.api_thread.set_operation("place_order",
-                                     account_id=self.selected_account['AccountID'],
-                                     symbol=symbol,
-                                     quantity=quantity,
-                                     side=side,
-                                     order_type=order_type,
-                                     price=price)
-        self.api_thread.start()
+        self.api_worker.request("place_order",
+                                account_id=self.selected_account['AccountID'],
+                                symbol=symbol,
+                                quantity=quantity,
+                                side=side,
+                                order_type=order_type,
+                                price=price)
         
     def close_position(self, side):
         """平仓"""
@@ -562,13 +568,18 @@ class TradingApp(QMainWindow):
             
         quantity = self.quantity_input.value()
         
+        position = None
+        if self.dashboard is not None and self.dashboard.account_id == self.selected_account['AccountID']:
+            # 快照可能已经过期（刚成交、刷新失败），只在时效内直接使用，否则由客户端重新查询持仓
+            position = self.dashboard.fresh_position(symbol, settings.dashboard_position_max_age)
+        
         self.statusBar().showMessage(f"正在平仓{side}...")
-        self.api_thread.set_operation("close_position",
-                                     account_id=self.selected_account['AccountID'],
-                                     symbol=symbol,
-                                     quantity=quantity,
-                                     side=side)
-        self.api_thread.start()
+        self.api_worker.request("close_position",
+                                account_id=self.selected_account['AccountID'],
+                                symbol=symbol,
+                                quantity=quantity,
+                                side=side,
+                                position=position)
         
     def on_api_result(self, operation, result):
         """API结果处理"""
@@ -601,14 +612,9 @@ class TradingApp(QMainWindow):
             positions = result.get("Positions", [])
             if positions:
                 self.result_text.append(f"✅ 查询到 {len(positions)} 个持仓")
-                # 更新持仓表格
-                self.positions_table.setRowCount(len(positions))
-                for i, pos in enumerate(positions):
-                    self.positions_table.setItem(i, 0, QTableWidgetItem(str(pos.get('Symbol', ''))))
-                    self.positions_table.setItem(i, 1, QTableWidgetItem(str(pos.get('Side', ''))))
-                    self.positions_table.setItem(i, 2, QTableWidgetItem(str(pos.get('Quantity', ''))))
-                    self.positions_table.setItem(i, 3, QTableWidgetItem(str(pos.get('AveragePrice', ''))))
-                    self.positions_table.setItem(i, 4, QTableWidgetItem(str(pos.get('MarketValue', ''))))
+                for pos in positions:
+                    self.result_text.append(f"  {pos.get('Symbol', '')} {pos.get('LongShort', '')} "
+                                            f"{pos.get('Quantity', '')} @ {pos.get('AveragePrice', '')}")
             else:
                 self.result_text.append("📭 当前无持仓")
                 
@@ -616,15 +622,8 @@ class TradingApp(QMainWindow):
             orders = result.get("Orders", [])
             if orders:
                 self.result_text.append(f"✅ 查询到 {len(orders)} 个订单")
-                # 更新订单表格
-                self.orders_table.setRowCount(len(orders))
-                for i, order in enumerate(orders):
-                    self.orders_table.setItem(i, 0, QTableWidgetItem(str(order.get('OrderID', ''))))
-                    self.orders_table.setItem(i, 1, QTableWidgetItem(str(order.get('Symbol', ''))))
-                    self.orders_table.setItem(i, 2, QTableWidgetItem(str(order.get('Side', ''))))
-                    self.orders_table.setItem(i, 3, QTableWidgetItem(str(order.get('Quantity', ''))))
-                    self.orders_table.setItem(i, 4, QTableWidgetItem(str(order.get('Price', ''))))
-                    self.orders_table.setItem(i, 5, QTableWidgetItem(str(order.get('Status', ''))))
+                for order in orders:
+                    self.result_text.append(f"  {order.get('OrderID', '')} {order.get('Status', '')}")
             else:
                 self.result_text.append("📭 当前无订单")
                 
@@ -652,7 +651,56 @@ class TradingApp(QMainWindow):
                 self.trade_result_text.append("✅ 平仓成功!")
             else:
                 self.trade_result_text.append("❌ 平仓失败!")
+        
+        if operation in ("place_order", "close_position"):
+            # 成交后持仓和订单都会变化，立即刷新总览
+            self.api_worker.refresh_dashboard()
                 
+    def on_dashboard_updated(self, snapshot, diff):
+        """账户总览更新：只重绘变化的行"""
+        if not self.selected_account or snapshot.account_id != self.selected_account['AccountID']:
+            return
+        if self.dashboard is None or self.dashboard.account_id != snapshot.account_id:
+            self.positions_table.setRowCount(0)
+            self.orders_table.setRowCount(0)
+            self.position_rows.clear()
+            self.order_rows.clear()
+        self.dashboard = snapshot
+        
+        if diff.balances_changed:
+            balance = snapshot.balances
+            self.account_equity_label.setText(f"权益: ${balance.get('Equity', '-')}")
+            self.account_pnl_label.setText(f"今日盈亏: ${balance.get('TodaysProfitLoss', '-')}")
+        
+        self.apply_table_diff(self.positions_table, self.position_rows, diff.positions, snapshot.positions,
+                              lambda pos: [pos.get('Symbol', ''), pos.get('LongShort', ''), pos.get('Quantity', ''),
+                                           pos.get('AveragePrice', ''), pos.get('MarketValue', '')])
+        self.apply_table_diff(self.orders_table, self.order_rows, diff.orders, snapshot.orders,
+                              lambda order: [order.get('OrderID', ''), order.get('Symbol', ''), order.get('Side', ''),
+                                             order.get('Quantity', ''), order.get('Price', ''), order.get('Status', '')])
+        
+        for name, error in snapshot.errors.items():
+            self.statusBar().showMessage(f"总览刷新部分失败（{name}）: {error}")
+    
+    def apply_table_diff(self, table, rows, section_diff, items, to_cells):
+        """按差异更新表格：删除移除的行，追加新增的行，只重写变化的行"""
+        for key in section_diff.removed:
+            row = rows.pop(key, None)
+            if row is None:
+                continue
+            table.removeRow(row)
+            for other, other_row in rows.items():
+                if other_row > row:
+                    rows[other] = other_row - 1
+        
+        for key in section_diff.added:
+            rows[key] = table.rowCount()
+            table.insertRow(rows[key])
+        
+        for key in section_diff.added + section_diff.changed:
+            for column, value in enumerate(to_cells(items[key])):
+                table.setItem(rows[key], column, QTableWidgetItem(str(value)))
+        
     def on_api_error(self, operation, error):
         """API错误处理"""
         self.statusBar().showMessage("操作失败")
@@ -671,6 +719,9 @@ def main():
     app.setApplicationName("Tradestation 交易测试系统")
     app.setApplicationVersion("1.0.0")
     
+    # 退出时停止后台API事件循环（关闭连接池）
+    app.aboutToQuit.connect(get_api_runner().stop)
+    
     # 创建主窗口
     window = TradingApp()
     window.show()
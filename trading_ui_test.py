@@ -33,17 +33,10 @@ class TradingUI:
         if not self.client:
             self.client = TradestationAPIClient()
             
-            # 加载保存的令牌
+            # 加载保存的令牌（共享令牌管理器的内存缓存）
             try:
-                with open("tokens.json", "r") as f:
-                    tokens = json.load(f)
-                
-                self.client.access_token = tokens["access_token"]
-                self.client.refresh_token = tokens["refresh_token"]
-                
-                if tokens["expires_at"]:
-                    from datetime import datetime
-                    self.client.token_expires_at = datetime.fromisoformat(tokens["expires_at"])
+                if not self.client.access_token and not self.client.refresh_token:
+                    raise Exception("未找到令牌文件")
                 
                 return True
             except Exception as e: